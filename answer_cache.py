@@ -0,0 +1,133 @@
+import threading
+import time
+import numpy as np
+
+class SemanticAnswerCache:
+    """
+    In-memory cache of generated answers, looked up by query embedding similarity.
+
+    A cached answer is returned for a new query when the cosine similarity of the query
+    embeddings reaches the threshold and the answer was generated from the same retrieved
+    chunks, with the same conversation context and index version. Entries expire after
+    ttl seconds; beyond max_entries the least recently used entry is evicted.
+    """
+
+    def __init__(self, max_entries=1000, ttl=3600, threshold=0.95):
+        """
+        :param max_entries: Maximum number of cached answers (0 disables the cache)
+        :param ttl: Seconds an answer stays valid
+        :param threshold: Minimum cosine similarity between query embeddings
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._vectors = None
+        # slot -> (chunk_ids, context_key, version, answer, expires_at, last_used)
+        self._entries = {}
+        self._free_slots = []
+
+    def get(self, query_vector, chunk_ids, context_key=None, version=None):
+        """
+        Return a cached answer for a similar query over the same chunks.
+
+        :param query_vector: Embedding of the processed query
+        :param chunk_ids: Ids of the chunks retrieved for the query
+        :param context_key: Hash of the conversation context the answer depends on
+        :param version: Current index version; answers from other versions are dropped
+        :return: Cached answer string, or None
+        """
+        if self.max_entries <= 0:
+            return None
+        query_vector = self._normalize(query_vector)
+        chunk_ids = frozenset(chunk_ids)
+        now = time.time()
+        with self._lock:
+            if self._entries and len(query_vector) == self._vectors.shape[1]:
+                slots = np.fromiter(self._entries, dtype=np.int64, count=len(self._entries))
+                similarities = self._vectors[slots] @ query_vector
+                for i in np.argsort(-similarities):
+                    if similarities[i] < self.threshold:
+                        break
+                    slot = int(slots[i])
+                    entry_chunk_ids, entry_context_key, entry_version, answer, expires_at, _ = self._entries[slot]
+                    if expires_at < now or entry_version != version:
+                        self._remove(slot)
+                        continue
+                    if entry_chunk_ids == chunk_ids and entry_context_key == context_key:
+                        self._entries[slot] = self._entries[slot][:5] + (now,)
+                        self.hits += 1
+                        return answer
+            self.misses += 1
+            return None
+
+    def put(self, query_vector, chunk_ids, answer, context_key=None, version=None):
+        """
+        Store an answer generated for a query.
+
+        :param query_vector: Embedding of the processed query
+        :param chunk_ids: Ids of the chunks the answer was generated from
+        :param answer: Generated answer string
+        :param context_key: Hash of the conversation context the answer depends on
+        :param version: Index version the chunks were retrieved from
+        """
+        if self.max_entries <= 0:
+            return
+        query_vector = self._normalize(query_vector)
+        now = time.time()
+        with self._lock:
+            if self._vectors is None or self._vectors.shape[1] != len(query_vector):
+                # First entry, or the embedding dimension changed
+                self._vectors = np.zeros((self.max_entries, len(query_vector)), dtype=np.float32)
+                self._entries.clear()
+                self._free_slots = list(range(self.max_entries - 1, -1, -1))
+            if not self._free_slots:
+                self._evict(now)
+            slot = self._free_slots.pop()
+            self._vectors[slot] = query_vector
+            self._entries[slot] = (frozenset(chunk_ids), context_key, version, answer, now + self.ttl, now)
+
+    def clear(self):
+        with self._lock:
+            for slot in list(self._entries):
+                self._remove(slot)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def stats(self):
+        """
+        Return the cache counters.
+
+        :return: Dictionary with size, max_size, hits, misses and hit_rate
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+
+    def _evict(self, now):
+        """
+        Free slots by dropping expired entries, or else the least recently used one. Called with the lock held.
+        """
+        expired = [slot for slot, entry in self._entries.items() if entry[4] < now]
+        for slot in expired or [min(self._entries, key=lambda slot: self._entries[slot][5])]:
+            self._remove(slot)
+
+    def _remove(self, slot):
+        del self._entries[slot]
+        self._free_slots.append(slot)
+
+    @staticmethod
+    def _normalize(vector):
+        vector = np.asarray(vector, dtype=np.float32).ravel()
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
@@ -1,34 +1,47 @@
-from flask import Flask, render_template, request, jsonify
-from indexing_pipeline import IndexingPipeline
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context
+from indexing_pipeline import get_pipeline
+from task_store import create_task_store, PENDING, PROGRESS, SUCCESS
+from bounded_executor import BoundedExecutor, QueueFull
+from streaming_upload import StreamingUploadRequest, store_upload
 import json
 from dotenv import load_dotenv
-import threading
-import uuid
 import io
 import os
 
 load_dotenv()
 
 app = Flask(__name__)
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16 MB limit
+# Uploaded files are streamed to disk while they are received, so the limit is not bounded by memory
+app.request_class = StreamingUploadRequest
+app.config['MAX_CONTENT_LENGTH'] = int(float(os.getenv('MAX_UPLOAD_MB', 2048)) * 1024 * 1024)
 app.config['UPLOAD_FOLDER'] = 'uploads'
 
-# Dictionary to store task results
-task_results = {}
+# Task states with TTL expiry; TASK_STORE_BACKEND=redis shares them between worker processes
+task_store = create_task_store()
+
+# Separate bounded pools, so queued indexing jobs never hold up interactive queries
+query_executor = BoundedExecutor('query', max_workers=int(os.getenv('QUERY_WORKERS', 8)),
+                                 max_queue=int(os.getenv('QUERY_QUEUE_DEPTH', 64)))
+# Streamed answers run on the request thread; they get a slot of their own limit, so at most
+# QUERY_WORKERS are generated at once, and are rejected with 429 like queued queries beyond that
+stream_slots = BoundedExecutor('query_stream', max_workers=int(os.getenv('QUERY_WORKERS', 8)), max_queue=0)
+indexing_executor = BoundedExecutor('indexing', max_workers=int(os.getenv('INDEXING_WORKERS', 1)),
+                                    max_queue=int(os.getenv('INDEXING_QUEUE_DEPTH', 4)))
+
+# Built once at startup and shared by every request thread
+pipeline = get_pipeline()
 
 def run_indexing_pipeline_task(task_id, pdf_files, save_to_file, keyword_filter, max_pages, clean_text, chunk_size, chunk_overlap):
-    pipeline = IndexingPipeline()
-    
     def progress_callback(processed_files, total_files, elapsed_time):
         progress = (processed_files / total_files) * 100
         eta = (elapsed_time / processed_files) * (total_files - processed_files) if processed_files > 0 else 0
-        task_results[task_id] = {
-            'state': 'PROGRESS',
-            'current': processed_files,
-            'total': total_files,
-            'status': f'Processed {processed_files}/{total_files} files ({progress:.2f}%)',
-            'eta': f'{eta:.2f} seconds'
-        }
+        task_store.set_progress(
+            task_id,
+            current=processed_files,
+            total=total_files,
+            status=f'Processed {processed_files}/{total_files} files ({progress:.2f}%)',
+            eta=f'{eta:.2f} seconds'
+        )
 
     processed_files = pipeline.run(
         pdf_files=pdf_files,
@@ -40,12 +53,66 @@ def run_indexing_pipeline_task(task_id, pdf_files, save_to_file, keyword_filter,
         chunk_overlap=chunk_overlap,
         progress_callback=progress_callback
     )
-    task_results[task_id] = {'state': 'SUCCESS', 'result': f'Indexed {processed_files} PDF files successfully.'}
+    return f'Indexed {processed_files} PDF files successfully.'
 
 def generate_context_aware_response_task(task_id, query_text, conversation_history, k=5):
-    pipeline = IndexingPipeline()
     response = pipeline.generate_context_aware_response(query_text, conversation_history, k)
-    task_results[task_id] = {'response': response, 'conversation_history': conversation_history + [{"role": "assistant", "content": response}]}
+    return {'response': response, 'conversation_history': conversation_history + [{"role": "assistant", "content": response}]}
+
+def search_batch_task(task_id, queries, k=5):
+    ranked_results = pipeline.search_similar_chunks_batch(queries, k)
+    return {'results': [
+        [{'chunk': chunk, 'distance': float(distance), 'relevance_score': float(score)} for chunk, distance, score in ranked]
+        for ranked in ranked_results
+    ]}
+
+def start_task(executor, target, *args):
+    """
+    Register a task and run target(task_id, *args) on the given executor.
+
+    The task ends in SUCCESS with target's return value as result, or in FAILURE with the error message.
+
+    :return: Task id
+    :raises QueueFull: If the executor is saturated; the task is marked as failed
+    """
+    task_id = task_store.create()
+
+    def run():
+        try:
+            result = target(task_id, *args)
+        except Exception as e:
+            app.logger.exception(f"Task {task_id} failed")
+            task_store.set_failure(task_id, e)
+        else:
+            task_store.set_success(task_id, result)
+
+    try:
+        executor.submit(run)
+    except QueueFull as e:
+        task_store.set_failure(task_id, e)
+        raise
+    return task_id
+
+@app.errorhandler(QueueFull)
+def queue_full(error):
+    response = jsonify({'error': 'Server is busy, please retry later.'})
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response, 429
+
+@app.route('/metrics')
+def metrics():
+    return jsonify({
+        'executors': {
+            'query': query_executor.stats(),
+            'query_stream': stream_slots.stats(),
+            'indexing': indexing_executor.stats()
+        },
+        'caches': {
+            'query_processing': pipeline.query_processor.cache_stats(),
+            'answers': pipeline.answer_cache.stats(),
+            'embeddings': pipeline.embedding_cache.stats()
+        }
+    })
 
 @app.route('/')
 def index():
@@ -53,51 +120,128 @@ def index():
 
 @app.route('/upload', methods=['POST'])
 def upload_file():
-    if 'document' not in request.files:
-        return jsonify({'error': 'No file part'}), 400
-    file = request.files['document']
-    if file.filename == '':
-        return jsonify({'error': 'No selected file'}), 400
-    if file and file.filename.lower().endswith('.pdf'):
-        filename = os.path.join(app.config['UPLOAD_FOLDER'], file.filename)
-        os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-        file.save(filename)
-        return jsonify({'message': f'File {file.filename} uploaded successfully'}), 200
-    else:
-        return jsonify({'error': 'Invalid file type. Please upload a PDF.'}), 400
+    """
+    Store one or more uploaded PDFs (form fields 'documents' or 'document') and start
+    indexing the ones whose content is not indexed yet.
+
+    Form fields of /index_pdfs set the indexing parameters.
+    """
+    try:
+        files = request.files.getlist('documents') + request.files.getlist('document')
+        files = [file for file in files if file.filename]
+        if not files:
+            return jsonify({'error': 'No selected file'}), 400
+        if not all(file.filename.lower().endswith('.pdf') for file in files):
+            return jsonify({'error': 'Invalid file type. Please upload a PDF.'}), 400
+
+        uploaded = []
+        new_files = []
+        for file in files:
+            content_hash = file.stream.hexdigest()
+            path, duplicate = store_upload(file.stream, file.filename, app.config['UPLOAD_FOLDER'],
+                                           known_paths=pipeline.db_manager.find_documents(content_hash))
+            # The same content sent twice in one request is indexed once
+            duplicate = duplicate or path in new_files
+            uploaded.append({'filename': file.filename, 'stored_as': os.path.basename(path), 'sha256': content_hash,
+                             'size': file.stream.size, 'duplicate': duplicate})
+            if not duplicate:
+                new_files.append(path)
+    finally:
+        request.discard_uploads()
+
+    duplicates = len(uploaded) - len(new_files)
+    message = f"Uploaded {len(uploaded)} file(s), {duplicates} already indexed"
+    if not new_files:
+        return jsonify({'message': message, 'files': uploaded}), 200
+    task_id = start_task(indexing_executor, run_indexing_pipeline_task, new_files, *indexing_options(request.form))
+    return jsonify({'message': f"{message}; indexing started", 'files': uploaded, 'task_id': task_id}), 202
+
+def indexing_options(form):
+    """
+    Indexing parameters of run_indexing_pipeline_task after pdf_files, from request form fields.
+    """
+    return (
+        True,
+        form.get('keyword_filter'),
+        int(form.get('max_pages', 10)),
+        form.get('clean_text', 'true').lower() == 'true',
+        int(form.get('chunk_size', 1000)),
+        int(form.get('chunk_overlap', 200))
+    )
 
 @app.route('/index_pdfs', methods=['POST'])
 def index_pdfs():
-    task_id = str(uuid.uuid4())
     pdf_files = [os.path.join(app.config['UPLOAD_FOLDER'], f) for f in os.listdir(app.config['UPLOAD_FOLDER']) if f.lower().endswith('.pdf')]
-    thread = threading.Thread(target=run_indexing_pipeline_task, args=(
-        task_id,
-        pdf_files,
-        True,
-        request.form.get('keyword_filter'),
-        int(request.form.get('max_pages', 10)),
-        request.form.get('clean_text', 'true').lower() == 'true',
-        int(request.form.get('chunk_size', 1000)),
-        int(request.form.get('chunk_overlap', 200))
-    ))
-    thread.start()
+    task_id = start_task(indexing_executor, run_indexing_pipeline_task, pdf_files, *indexing_options(request.form))
     return jsonify({'message': 'Indexing started', 'task_id': task_id}), 202
 
 @app.route('/search', methods=['POST'])
 def search():
     query = request.form['query']
     conversation_history = json.loads(request.form.get('conversation_history', '[]'))
-    task_id = str(uuid.uuid4())
-    thread = threading.Thread(target=generate_context_aware_response_task, args=(task_id, query, conversation_history))
-    thread.start()
+    task_id = start_task(query_executor, generate_context_aware_response_task, query, conversation_history)
+    return jsonify({'task_id': task_id}), 202
+
+@app.route('/search/stream', methods=['POST'])
+def search_stream():
+    query = request.form['query']
+    conversation_history = json.loads(request.form.get('conversation_history', '[]'))
+    # Held until the stream ends or the client disconnects
+    release = stream_slots.acquire_slot()
+
+    def events():
+        # Each token is relayed as soon as OpenRouter sends it; nothing is accumulated here
+        failed = False
+        try:
+            for token in pipeline.generate_context_aware_response_stream(query, conversation_history):
+                yield f"data: {json.dumps({'token': token})}\n\n"
+            yield "event: done\ndata: {}\n\n"
+        except Exception as e:
+            app.logger.exception("Streaming response failed")
+            failed = True
+            yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+        finally:
+            release(failed=failed)
+
+    response = Response(stream_with_context(events()), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # Also frees the slot of a stream that is closed before it starts
+    response.call_on_close(release)
+    return response
+
+@app.route('/search_batch', methods=['POST'])
+def search_batch():
+    payload = request.get_json(silent=True) or {}
+    try:
+        queries = payload['queries'] if 'queries' in payload else json.loads(request.form.get('queries', '[]'))
+    except ValueError:
+        return jsonify({'error': 'queries must be a JSON list of strings'}), 400
+    k = payload.get('k', request.form.get('k', 5))
+    try:
+        k = int(k) if isinstance(k, (int, str)) and not isinstance(k, bool) else None
+    except ValueError:
+        k = None
+    if k is None or k < 1:
+        return jsonify({'error': 'k must be a positive integer'}), 400
+    if not isinstance(queries, list) or not all(isinstance(query, str) for query in queries):
+        return jsonify({'error': 'queries must be a list of strings'}), 400
+    if len(queries) > int(os.getenv('SEARCH_BATCH_MAX_QUERIES', 1000)):
+        return jsonify({'error': 'Too many queries in one batch'}), 400
+    task_id = start_task(query_executor, search_batch_task, queries, k)
     return jsonify({'task_id': task_id}), 202
 
 @app.route('/task_status/<task_id>')
 def task_status(task_id):
-    if task_id in task_results:
-        return jsonify({'state': 'SUCCESS', 'result': task_results[task_id]})
-    else:
-        return jsonify({'state': 'PENDING', 'status': 'Task is pending...'})
+    task = task_store.get(task_id)
+    if task is None:
+        return jsonify({'state': 'UNKNOWN', 'status': 'Unknown or expired task'}), 404
+    if task['state'] == PENDING:
+        return jsonify({'state': PENDING, 'status': 'Task is pending...'})
+    if task['state'] == PROGRESS:
+        return jsonify({'state': PROGRESS, **task['progress']})
+    if task['state'] == SUCCESS:
+        return jsonify({'state': SUCCESS, 'result': task['result']})
+    return jsonify({'state': task['state'], 'status': task['error']})
 
 @app.route('/conversation', methods=['POST'])
 def conversation():
@@ -105,9 +249,7 @@ def conversation():
     conversation_history = json.loads(request.form.get('conversation_history', '[]'))
     conversation_history.append({"role": "user", "content": query})
 
-    task_id = str(uuid.uuid4())
-    thread = threading.Thread(target=generate_context_aware_response_task, args=(task_id, query, conversation_history))
-    thread.start()
+    task_id = start_task(query_executor, generate_context_aware_response_task, query, conversation_history)
     return jsonify({'task_id': task_id}), 202
 
 @app.route('/clear_conversation', methods=['POST'])
@@ -0,0 +1,118 @@
+import logging
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+try:
+    from openai import APIConnectionError
+    OPENAI_TRANSIENT_ERRORS = (APIConnectionError,)  # Includes APITimeoutError
+except ImportError:
+    OPENAI_TRANSIENT_ERRORS = ()
+
+# Errors raised by embedding requests that may succeed when sent again
+TRANSIENT_ERRORS = (TimeoutError, ConnectionError, requests.Timeout, requests.ConnectionError) + OPENAI_TRANSIENT_ERRORS
+
+def estimate_tokens(text):
+    """
+    Cheap token estimate for embedding requests (about four characters per token).
+
+    :param text: Input text string
+    :return: Estimated number of tokens
+    """
+    return len(text) // 4 + 1
+
+def is_transient_error(error):
+    """
+    Whether a failed embedding request is worth retrying: timeouts, connection errors,
+    rate limiting (429) and server errors (5xx).
+
+    :param error: Exception raised by an embedding request
+    :return: True if the request may succeed when sent again
+    """
+    if isinstance(error, TRANSIENT_ERRORS):
+        return True
+    # The openai client's status errors carry the status code, requests' HTTPError its response
+    status_code = getattr(error, 'status_code', None) or getattr(getattr(error, 'response', None), 'status_code', None)
+    return isinstance(status_code, int) and (status_code == 429 or 500 <= status_code < 600)
+
+class BatchEmbedder:
+    """
+    Split embedding inputs into batches bounded by estimated tokens and item count,
+    embed the batches concurrently and return the vectors in input order.
+
+    embed_fn receives a list of strings and must return one vector per string.
+    A batch failing with a transient error (see is_transient_error) is retried on its
+    own with exponential backoff; batches that already succeeded are not sent again.
+    Other errors, e.g. an invalid request, are raised immediately. Use max_retries=0
+    when embed_fn already retries failed requests, so the retries do not multiply.
+    """
+
+    def __init__(self, embed_fn, max_batch_tokens=50_000, max_batch_items=256, max_concurrency=4, max_retries=3, retry_delay=1.0):
+        if max_batch_tokens <= 0 or max_batch_items <= 0 or max_concurrency <= 0:
+            raise ValueError("Batch limits and concurrency must be positive")
+        self.embed_fn = embed_fn
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_items = max_batch_items
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+
+    def make_batches(self, texts):
+        """
+        Group consecutive texts into batches.
+
+        A single text larger than max_batch_tokens gets a batch of its own.
+
+        :param texts: List of input text strings
+        :return: List of (start, end) index ranges into texts
+        """
+        batches = []
+        start = 0
+        tokens = 0
+        for i, text in enumerate(texts):
+            text_tokens = estimate_tokens(text)
+            if i > start and (tokens + text_tokens > self.max_batch_tokens or i - start >= self.max_batch_items):
+                batches.append((start, i))
+                start = i
+                tokens = 0
+            tokens += text_tokens
+        if start < len(texts):
+            batches.append((start, len(texts)))
+        return batches
+
+    def embed(self, texts):
+        """
+        Embed all texts.
+
+        :param texts: List of input text strings
+        :return: List of vectors in the same order as texts
+        """
+        batches = self.make_batches(texts)
+        if not batches:
+            return []
+        if len(batches) == 1:
+            return list(self._embed_batch(texts, *batches[0]))
+
+        results = [None] * len(texts)
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(batches))) as executor:
+            futures = {executor.submit(self._embed_batch, texts, start, end): start for start, end in batches}
+            for future, start in futures.items():
+                vectors = future.result()
+                results[start:start + len(vectors)] = vectors
+        return results
+
+    def _embed_batch(self, texts, start, end):
+        batch = texts[start:end]
+        for attempt in range(self.max_retries + 1):
+            try:
+                vectors = self.embed_fn(batch)
+                if len(vectors) != len(batch):
+                    raise ValueError(f"Expected {len(batch)} embeddings, got {len(vectors)}")
+                return vectors
+            except Exception as e:
+                if attempt == self.max_retries or not is_transient_error(e):
+                    raise
+                delay = self.retry_delay * (2 ** attempt) * (1 + random.random())
+                logging.warning(f"Embedding batch {start}-{end} failed (attempt {attempt + 1}/{self.max_retries + 1}): {e}. Retrying in {delay:.1f}s")
+                time.sleep(delay)
@@ -0,0 +1,641 @@
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+def _timed(func, repeat):
+    """
+    Call func repeat times and return the individual wall-clock timings in milliseconds.
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+def _report(label, timings):
+    print(f"{label:<40} mean {statistics.mean(timings):10.2f} ms   "
+          f"p50 {statistics.median(timings):10.2f} ms   max {max(timings):10.2f} ms")
+
+_WORDS = ("energy climate model data report analysis market health system network policy "
+          "research growth risk value process design study result method impact").split()
+
+def _synthetic_page_text(rng, words_per_page):
+    words = [rng.choice(_WORDS) for _ in range(words_per_page)]
+    return ' '.join(words[i] + ('.' if i % 12 == 11 else '') for i in range(len(words)))
+
+def write_synthetic_pdf(path, pages=20, words_per_page=300, seed=0):
+    """
+    Write a minimal text PDF with the given number of pages, for benchmarks that need input files.
+    """
+    rng = random.Random(seed)
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for _ in range(pages):
+        words = _synthetic_page_text(rng, words_per_page).split()
+        lines = [' '.join(words[i:i + 12]) for i in range(0, len(words), 12)]
+        stream = "BT /F1 10 Tf 12 TL 40 800 Td " + ' '.join(f"({line}) Tj T*" for line in lines) + " ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream".encode('latin-1'))
+        content_id = len(objects)
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Resources << /Font << /F1 3 0 R >> >> /Contents {content_id} 0 R >>".encode('latin-1'))
+        page_ids.append(len(objects))
+    kids = ' '.join(f"{page_id} 0 R" for page_id in page_ids)
+    objects[1] = f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>".encode('latin-1')
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n".encode('latin-1') + body + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode('latin-1')
+    out += b''.join(f"{offset:010d} 00000 n \n".encode('latin-1') for offset in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode('latin-1')
+    with open(path, 'wb') as f:
+        f.write(out)
+
+def _pdf_files(args, directory):
+    if args.pdf_dir:
+        return sorted(os.path.join(args.pdf_dir, f) for f in os.listdir(args.pdf_dir) if f.lower().endswith('.pdf'))
+    files = []
+    for i in range(args.files):
+        path = os.path.join(directory, f"synthetic_{i}.pdf")
+        write_synthetic_pdf(path, pages=args.pages, seed=i)
+        files.append(path)
+    return files
+
+def bench_extraction(args):
+    """
+    Measure PDF extraction throughput (files/sec) of thread and process pools by worker count.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from pdf_processor import extract_text_from_pdf, extract_texts_in_processes
+
+    with tempfile.TemporaryDirectory() as directory:
+        pdf_files = _pdf_files(args, directory)
+        worker_counts = sorted({1, 2, 4, 8, 16, 32, os.cpu_count() or 1})
+        worker_counts = [w for w in worker_counts if w <= (args.max_workers or os.cpu_count() or 1)]
+        print(f"{len(pdf_files)} files, {os.cpu_count()} CPUs")
+        for workers in worker_counts:
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                list(executor.map(lambda f: extract_text_from_pdf(f, args.max_pages), pdf_files))
+            thread_rate = len(pdf_files) / (time.perf_counter() - start)
+
+            start = time.perf_counter()
+            list(extract_texts_in_processes(pdf_files, args.max_pages, max_workers=workers))
+            process_rate = len(pdf_files) / (time.perf_counter() - start)
+            print(f"workers {workers:>3}   threads {thread_rate:8.2f} files/s   processes {process_rate:8.2f} files/s")
+
+def bench_mixed_sizes(args):
+    """
+    Wall-clock time of process_multiple_pdfs on small files only, large files only and both
+    together. The small files are parsed while the large ones are indexed, so the mixed batch
+    should take about as long as the slower of the two rather than their sum.
+    """
+    from database_manager import DatabaseManager
+    from embedding_model import EmbeddingModel
+    from pdf_processor import process_multiple_pdfs
+
+    with tempfile.TemporaryDirectory() as directory:
+        small, large = [], []
+        for i in range(args.small_files):
+            small.append(os.path.join(directory, f"small_{i}.pdf"))
+            write_synthetic_pdf(small[-1], pages=args.small_pages, seed=i)
+        for i in range(args.large_files):
+            large.append(os.path.join(directory, f"large_{i}.pdf"))
+            write_synthetic_pdf(large[-1], pages=args.large_pages, seed=args.small_files + i)
+        threshold = min(os.path.getsize(path) for path in large) if large else None
+        embedding_model = EmbeddingModel(backend='hashing')
+        print(f"{len(small)} files of {args.small_pages} pages, {len(large)} files of {args.large_pages} pages, "
+              f"{args.max_workers or os.cpu_count()} workers")
+        for label, pdf_files in (('small files', small), ('large files', large), ('mixed', large + small)):
+            db_manager = DatabaseManager(os.path.join(directory, f"{label.replace(' ', '_')}.db"))
+            start = time.perf_counter()
+            process_multiple_pdfs(pdf_files, use_faiss=False, use_processes=True, max_workers=args.max_workers,
+                                  large_file_threshold=threshold, db_manager=db_manager, embedding_model=embedding_model)
+            print(f"{label:<12} {time.perf_counter() - start:8.2f} s")
+
+def synthetic_vectors(count, dimension, clusters=100, seed=0):
+    """
+    Clustered random unit vectors, which resemble real embeddings more than uniform noise does.
+    """
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dimension)).astype('float32')
+    vectors = centers[rng.integers(0, clusters, count)] + 0.5 * rng.standard_normal((count, dimension)).astype('float32')
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+def bench_ann(args):
+    """
+    Recall@k and per-query latency of the ANN index types against the exact flat index.
+    """
+    import numpy as np
+    from faiss_manager import build_index, min_training_size, set_search_params
+
+    vectors = synthetic_vectors(args.vectors, args.dim, seed=0)
+    queries = synthetic_vectors(args.queries, args.dim, seed=1)
+    ids = np.arange(len(vectors), dtype='int64')
+
+    def build(index_type):
+        start = time.perf_counter()
+        index = build_index(index_type, args.dim, len(vectors))
+        if not index.is_trained:
+            sample = vectors[np.random.default_rng(2).choice(len(vectors), min(len(vectors), max(min_training_size(index_type, len(vectors)), 10_000)), replace=False)]
+            index.train(sample)
+        index.add_with_ids(vectors, ids)
+        return index, time.perf_counter() - start
+
+    def query_all(index):
+        timings = []
+        found = []
+        for query in queries:
+            start = time.perf_counter()
+            _, result = index.search(query.reshape(1, -1), args.k)
+            timings.append((time.perf_counter() - start) * 1000)
+            found.append(result[0])
+        return np.array(found), timings
+
+    flat, build_time = build('flat')
+    truth, timings = query_all(flat)
+    print(f"{len(vectors)} vectors, dim {args.dim}, {len(queries)} queries, recall@{args.k}")
+    print(f"{'flat':<24} build {build_time:8.2f} s   recall 1.000   p50 {statistics.median(timings):8.3f} ms   "
+          f"p99 {np.percentile(timings, 99):8.3f} ms")
+
+    settings = [('ivf_flat', 'nprobe', value) for value in args.nprobe] + \
+               [('hnsw', 'efSearch', value) for value in args.ef_search] + \
+               [('ivf_pq', 'nprobe', value) for value in args.nprobe]
+    built = {}
+    for index_type, param, value in settings:
+        if index_type not in built:
+            built[index_type] = build(index_type)
+        index, build_time = built[index_type]
+        set_search_params(index, nprobe=value if param == 'nprobe' else None, ef_search=value if param == 'efSearch' else None)
+        found, timings = query_all(index)
+        recall = np.mean([len(set(f) & set(t)) / args.k for f, t in zip(found, truth)])
+        print(f"{index_type + ' ' + param + '=' + str(value):<24} build {build_time:8.2f} s   recall {recall:.3f}   "
+              f"p50 {statistics.median(timings):8.3f} ms   p99 {np.percentile(timings, 99):8.3f} ms")
+
+def bench_storage(args):
+    """
+    Index memory per vector and recall@k of compressed vector storage, with and without
+    exact re-scoring, and of truncated (Matryoshka-style) embeddings.
+    """
+    import faiss
+    import numpy as np
+    from embedding_model import truncate_embedding
+    from faiss_manager import build_index, min_training_size
+
+    vectors = synthetic_vectors(args.vectors, args.dim, seed=0)
+    queries = synthetic_vectors(args.queries, args.dim, seed=1)
+    ids = np.arange(len(vectors), dtype='int64')
+    truth = faiss.IndexFlatL2(args.dim)
+    truth.add(vectors)
+    _, expected = truth.search(queries, args.k)
+
+    def recall(found):
+        return np.mean([len(set(f) & set(e)) / args.k for f, e in zip(found, expected)])
+
+    def rescore(query, candidates):
+        candidates = candidates[candidates != -1]
+        exact = ((vectors[candidates] - query) ** 2).sum(axis=1)
+        return candidates[np.argsort(exact)][:args.k]
+
+    print(f"{len(vectors)} vectors, dim {args.dim}, {len(queries)} queries, recall@{args.k}, re-scoring {args.rescore_factor}x k")
+    for storage in ('float32', 'fp16', 'sq8', 'pq'):
+        index = build_index('flat', args.dim, len(vectors), storage)
+        if not index.is_trained:
+            index.train(vectors[:max(min_training_size('flat', len(vectors), storage), 10_000)])
+        index.add_with_ids(vectors, ids)
+        # Includes the 8-byte id of each vector
+        bytes_per_vector = faiss.serialize_index(index).nbytes / len(vectors)
+        start = time.perf_counter()
+        _, found = index.search(queries, args.k * args.rescore_factor)
+        search_ms = (time.perf_counter() - start) * 1000 / len(queries)
+        rescored = [rescore(query, candidates) for query, candidates in zip(queries, found)]
+        print(f"{storage:<10} {bytes_per_vector:10.1f} bytes/vector   recall {recall(found[:, :args.k]):.3f}   "
+              f"rescored {recall(rescored):.3f}   {search_ms:8.3f} ms/query")
+
+    for dimensions in args.truncate:
+        if dimensions >= args.dim:
+            continue
+        short = np.vstack([truncate_embedding(vector, dimensions) for vector in vectors])
+        index = faiss.IndexFlatL2(dimensions)
+        index.add(short)
+        _, found = index.search(np.vstack([truncate_embedding(query, dimensions) for query in queries]), args.k * args.rescore_factor)
+        rescored = [rescore(query, candidates) for query, candidates in zip(queries, found)]
+        print(f"{'dim ' + str(dimensions):<10} {dimensions * 4:10.1f} bytes/vector   recall {recall(found[:, :args.k]):.3f}   "
+              f"rescored {recall(rescored):.3f}")
+
+def bench_concurrency(args):
+    """
+    Search latency on an idle index compared to while another thread ingests documents.
+    """
+    import threading
+    from database_manager import DatabaseManager
+    from faiss_manager import FAISSManager
+
+    with tempfile.TemporaryDirectory() as directory:
+        db_manager = DatabaseManager(os.path.join(directory, 'benchmark.db'))
+        faiss_manager = FAISSManager(args.dim)
+        db_manager.set_faiss_manager(faiss_manager)
+        documents = synthetic_vectors(args.documents * args.chunks, args.dim).reshape(args.documents, args.chunks, args.dim)
+
+        def ingest(start, end):
+            for i in range(start, end):
+                db_manager.insert_pdf_extract(f"doc_{i}.pdf", '', 1, False, documents[i],
+                                              chunks=[f"chunk {j}" for j in range(args.chunks)], source_path=f"/doc_{i}.pdf")
+
+        ingest(0, args.documents // 2)
+        queries = synthetic_vectors(args.queries, args.dim, seed=1)
+
+        def search_all():
+            return [_timed(lambda: faiss_manager.search(query, args.k), 1)[0] for query in queries]
+
+        _report("search (idle)", search_all())
+        writer = threading.Thread(target=ingest, args=(args.documents // 2, args.documents))
+        start = time.perf_counter()
+        writer.start()
+        timings = search_all()
+        writer.join()
+        _report("search (during ingest)", timings)
+        print(f"ingested {args.documents - args.documents // 2} documents in {time.perf_counter() - start:.2f} s")
+        db_manager.close()
+
+def bench_search_batch(args):
+    """
+    Sequential single-query searches compared to one batched search.
+    """
+    from faiss_manager import FAISSManager
+
+    faiss_manager = FAISSManager(args.dim)
+    vectors = synthetic_vectors(args.vectors, args.dim)
+    faiss_manager.add_vectors(vectors, [f"chunk {i}" for i in range(len(vectors))])
+    queries = synthetic_vectors(args.queries, args.dim, seed=1)
+
+    _report(f"{args.queries} sequential searches", _timed(lambda: [faiss_manager.search(query, args.k) for query in queries], args.repeat))
+    _report(f"search_batch of {args.queries}", _timed(lambda: faiss_manager.search_batch(queries, args.k), args.repeat))
+
+def bench_rerank(args):
+    """
+    Per-query cost of relevance scoring: tokenizing every chunk per result against
+    scoring precomputed chunk terms with numpy.
+    """
+    from query_processor import QueryProcessor
+
+    rng = random.Random(0)
+    query_processor = QueryProcessor(embedding_model=None)
+    chunks = [_synthetic_page_text(rng, args.chunk_words) for _ in range(args.k)]
+    chunk_terms = [query_processor.term_extractor.terms(chunk) for chunk in chunks]
+    queries = [_synthetic_page_text(rng, 8) for _ in range(args.queries)]
+    results = [list(zip(chunks, (rng.random() for _ in chunks))) for _ in queries]
+
+    def per_chunk():
+        return [[query_processor.calculate_relevance_score(query, chunk, distance) for chunk, distance in hits]
+                for query, hits in zip(queries, results)]
+
+    def precomputed():
+        return query_processor.calculate_relevance_scores(queries, results, [chunk_terms] * len(queries))
+
+    for label, func in (("per-chunk tokenization", per_chunk), ("precomputed terms", precomputed)):
+        timings = _timed(func, args.repeat)
+        _report(f"{label} (per query)", [timing / args.queries for timing in timings])
+
+def bench_bm25(args):
+    """
+    BM25 indexing throughput and single-core lexical query rate on a synthetic Zipf-distributed corpus.
+    """
+    import numpy as np
+    from bm25_index import BM25Index
+
+    rng = np.random.default_rng(0)
+    vocabulary = np.array([f"term{i}" for i in range(args.vocabulary)])
+    # Zipf-like term distribution, as in natural language
+    weights = 1.0 / np.arange(1, args.vocabulary + 1)
+    weights /= weights.sum()
+    documents = [vocabulary[rng.choice(args.vocabulary, size=args.doc_terms, p=weights)].tolist()
+                 for _ in range(args.documents)]
+    queries = [vocabulary[rng.integers(0, args.vocabulary // 10, size=args.query_terms)].tolist()
+               for _ in range(args.queries)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        index = BM25Index(os.path.join(directory, 'bm25.npz'))
+        start = time.perf_counter()
+        for first in range(0, args.documents, args.chunks_per_document):
+            ids = list(range(first, min(first + args.chunks_per_document, args.documents)))
+            index.add_documents(ids, documents[first:first + len(ids)])
+        elapsed = time.perf_counter() - start
+        print(f"indexed {args.documents} documents in {elapsed:.2f} s ({args.documents / elapsed:,.0f} docs/s, "
+              f"{len(index._state.segments)} segments)")
+        start = time.perf_counter()
+        index.save()
+        print(f"saved in {time.perf_counter() - start:.2f} s, {os.path.getsize(index.filename) / 1e6:.1f} MB")
+
+        for label in ("after save", "reloaded"):
+            if label == "reloaded":
+                index = BM25Index(index.filename)
+            timings = _timed(lambda: index.search_batch(queries, args.k), args.repeat)
+            print(f"{label:<12} {args.queries / (statistics.median(timings) / 1000):,.0f} queries/s "
+                  f"({statistics.median(timings) * 1000 / args.queries:.1f} us/query)")
+
+def bench_query_processing(args):
+    """
+    process_query latency for new queries, new queries over known words, and repeated queries.
+    """
+    from query_processor import QueryProcessor
+
+    rng = random.Random(0)
+    query_processor = QueryProcessor(embedding_model=None)
+    queries = [_synthetic_page_text(rng, args.query_words) for _ in range(args.queries)]
+    reworded = [' '.join(reversed(query.split())) for query in queries]
+
+    for label, batch in (("new queries", queries), ("new queries, known words", reworded), ("repeated queries", queries)):
+        timings = _timed(lambda: [query_processor.process_query(query) for query in batch], 1)
+        _report(f"{label} (per query)", [timing / len(batch) for timing in timings])
+    for name, stats in query_processor.cache_stats().items():
+        print(f"{name:<20} hits {stats['hits']:>8}   misses {stats['misses']:>8}   hit rate {stats['hit_rate']:.1%}")
+
+def bench_chunking(args):
+    """
+    TextChunker throughput in MB/s on a large synthetic corpus, from one string and from page texts.
+    """
+    from text_chunker import TextChunker
+
+    rng = random.Random(0)
+    page_texts = []
+    size = 0
+    while size < args.mb * 1e6:
+        page_texts.append(_synthetic_page_text(rng, args.words_per_page) + "\n")
+        size += len(page_texts[-1])
+    text = ''.join(page_texts)
+    text_chunker = TextChunker(args.chunk_size, args.overlap)
+    print(f"corpus: {size / 1e6:.1f} MB, {len(page_texts)} pages")
+
+    def count(chunks):
+        return sum(1 for _ in chunks)
+
+    for label, func in (("records, one string", lambda: count(text_chunker.iter_chunks(text))),
+                        ("records, page iterator", lambda: count(text_chunker.iter_chunks(iter(page_texts)))),
+                        ("chunk_text (copies texts)", lambda: text_chunker.chunk_text(text))):
+        timings = _timed(func, args.repeat)
+        print(f"{label:<30} {size / 1e6 / (statistics.median(timings) / 1000):8.1f} MB/s")
+
+_FIXTURE_EXTRAS = ("Cannot", "cannot,", "gonna", "WANNA", "gimme", "lemme", "Gotta", "don't", "It's", "U.S.", "e-mail",
+                   "3.5%", "(see", "p.", "12)", "2019-2024", "\"quoted\"", "--", "naïve", "Straße", "İstanbul", "café",
+                   "\u2014", "\xa0", "\t", "\n", "THE", "And", "More'n", "'tis")
+
+def _fixture_page_text(rng, words_per_page, ascii_only):
+    """
+    Page text mixing plain words with case, punctuation, digits, contractions and (unless ascii_only) non-ASCII text.
+    """
+    extras = [extra for extra in _FIXTURE_EXTRAS if extra.isascii()] if ascii_only else _FIXTURE_EXTRAS
+    words = [rng.choice(extras) if rng.random() < 0.2 else rng.choice(_WORDS) for _ in range(words_per_page)]
+    return ' '.join(word + ('.' if i % 12 == 11 else '') for i, word in enumerate(words))
+
+def _legacy_clean_text(text):
+    """
+    clean_and_preprocess_text as implemented before text_normalizer, as the reference output.
+    """
+    import re
+    from nltk.corpus import stopwords
+    from nltk.tokenize import word_tokenize
+
+    text = re.sub(r'[^a-zA-Z\s]', '', text.lower())
+    stop_words = set(stopwords.words('english'))
+    return ' '.join(token for token in word_tokenize(text) if token not in stop_words)
+
+def bench_normalization(args):
+    """
+    Index-time text cleaning in MB/s, and whether normalize_text matches the NLTK-based reference on a fixture corpus.
+    """
+    from text_normalizer import normalize_text
+
+    if args.pdf_dir:
+        from pdf_processor import iter_pdf_pages
+        pages = [page_text for pdf_file in _pdf_files(args, args.pdf_dir) for _, page_text in iter_pdf_pages(pdf_file)]
+    else:
+        rng = random.Random(0)
+        pages = [_fixture_page_text(rng, args.words_per_page, ascii_only=i % 2 == 0) for i in range(args.pages)]
+    size = sum(len(page_text.encode('utf-8')) for page_text in pages)
+    print(f"corpus: {len(pages)} pages, {size / 1e6:.1f} MB, {sum(page_text.isascii() for page_text in pages)} ASCII-only")
+
+    expected = [_legacy_clean_text(page_text) for page_text in pages]
+    for label, use_translate in (("regex", False), ("translate table", True)):
+        mismatches = [i for i, page_text in enumerate(pages) if normalize_text(page_text, use_translate) != expected[i]]
+        print(f"{label:<16} {len(mismatches)} of {len(pages)} pages differ from the reference"
+              + (f" (first: page {mismatches[0]})" if mismatches else ""))
+
+    for label, func in (("reference (NLTK)", lambda: [_legacy_clean_text(page_text) for page_text in pages]),
+                        ("regex", lambda: [normalize_text(page_text, False) for page_text in pages]),
+                        ("translate table", lambda: [normalize_text(page_text) for page_text in pages])):
+        timings = _timed(func, args.repeat)
+        print(f"{label:<20} {size / 1e6 / (statistics.median(timings) / 1000):8.1f} MB/s")
+
+def bench_local_embedding(args):
+    """
+    Throughput of a local embedding backend (texts/sec and MB/s) by batch size.
+    """
+    from local_embedders import create_local_embedder
+
+    rng = random.Random(0)
+    texts = [_synthetic_page_text(rng, args.words) for _ in range(args.texts)]
+    size = sum(len(text) for text in texts)
+    embedder = create_local_embedder(args.backend)
+    print(f"{embedder.model_name}: {embedder.dimension} dimensions, {args.texts} texts of {args.words} words")
+    for batch_size in args.batch_sizes:
+        def embed_all():
+            for start in range(0, len(texts), batch_size):
+                embedder.embed(texts[start:start + batch_size])
+        timings = _timed(embed_all, args.repeat)
+        seconds = statistics.median(timings) / 1000
+        print(f"batch size {batch_size:>5}   {len(texts) / seconds:10.0f} texts/s   {size / 1e6 / seconds:8.1f} MB/s")
+
+def bench_celery_ingest(args):
+    """
+    Ingest throughput (files/sec) of Celery indexing jobs by worker count.
+
+    Runs an in-process worker on the in-memory broker, so no Redis is needed. Its workers
+    are threads sharing one warm pipeline; --embedding-latency adds a delay per embedding
+    request, standing in for the embedding API round trip that thread workers overlap.
+    """
+    os.environ['CELERY_BROKER_URL'] = 'memory://'
+    os.environ['CELERY_RESULT_BACKEND'] = 'cache+memory://'
+    import celery_tasks
+    from celery.contrib.testing.worker import start_worker
+
+    with tempfile.TemporaryDirectory() as directory:
+        pdf_files = _pdf_files(args, directory)
+        print(f"{len(pdf_files)} files, embedding latency {args.embedding_latency} ms")
+        for workers in args.workers:
+            run_directory = tempfile.mkdtemp(dir=directory)
+            for name, filename in (('DB_NAME', 'benchmark.db'), ('EMBEDDING_CACHE_DB', 'embedding_cache.db'),
+                                   ('FAISS_INDEX_FILE', 'faiss_index.bin'), ('BM25_INDEX_FILE', 'bm25_index.npz')):
+                os.environ[name] = os.path.join(run_directory, filename)
+            celery_tasks.warm_up_worker()
+            embedding_model = celery_tasks.get_pipeline().embedding_model
+            get_embeddings = embedding_model.get_embeddings
+
+            def slow_get_embeddings(texts):
+                time.sleep(args.embedding_latency / 1000)
+                return get_embeddings(texts)
+
+            embedding_model.get_embeddings = slow_get_embeddings
+            with start_worker(celery_tasks.celery, pool='threads', concurrency=workers, perform_ping_check=False):
+                start = time.perf_counter()
+                summary = celery_tasks.run_indexing_pipeline.delay(pdf_files).get(timeout=3600)
+                elapsed = time.perf_counter() - start
+            print(f"workers {workers:>3}   {summary['indexed'] / elapsed:8.2f} files/s   "
+                  f"{summary['chunks'] / elapsed:10.1f} chunks/s   {len(summary['failed'])} failed")
+            celery_tasks.get_pipeline().close()
+
+def bench_pipeline(args):
+    """
+    Compare building an IndexingPipeline per request against reusing the shared one.
+    """
+    import indexing_pipeline
+    from indexing_pipeline import IndexingPipeline, get_pipeline
+
+    def cold_request():
+        pipeline = IndexingPipeline()
+        if args.query:
+            pipeline.search_similar_chunks(args.query, k=args.k)
+        pipeline.close()
+
+    def warm_request():
+        pipeline = get_pipeline()
+        if args.query:
+            pipeline.search_similar_chunks(args.query, k=args.k)
+
+    indexing_pipeline._shared_pipeline = None
+    _report("startup (shared pipeline)", _timed(get_pipeline, 1))
+    _report("per request (new pipeline)", _timed(cold_request, args.repeat))
+    _report("per request (shared pipeline)", _timed(warm_request, args.repeat))
+
+def main():
+    parser = argparse.ArgumentParser(description="PDFChatAI performance benchmarks")
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    pipeline_parser = subparsers.add_parser('pipeline', help="Startup and per-request latency of the indexing pipeline")
+    pipeline_parser.add_argument('--repeat', type=int, default=10)
+    pipeline_parser.add_argument('--query', default=None, help="Also run a similarity search per request")
+    pipeline_parser.add_argument('--k', type=int, default=5)
+    pipeline_parser.set_defaults(func=bench_pipeline)
+
+    extraction_parser = subparsers.add_parser('extraction', help="PDF extraction files/sec by worker count")
+    extraction_parser.add_argument('--pdf-dir', default=None, help="Directory of PDFs (default: generate synthetic PDFs)")
+    extraction_parser.add_argument('--files', type=int, default=64, help="Number of synthetic PDFs")
+    extraction_parser.add_argument('--pages', type=int, default=20, help="Pages per synthetic PDF")
+    extraction_parser.add_argument('--max-pages', type=int, default=None)
+    extraction_parser.add_argument('--max-workers', type=int, default=None)
+    extraction_parser.set_defaults(func=bench_extraction)
+
+    mixed_parser = subparsers.add_parser('mixed-sizes', help="Ingestion time of a batch mixing small and large PDFs")
+    mixed_parser.add_argument('--small-files', type=int, default=32)
+    mixed_parser.add_argument('--small-pages', type=int, default=10)
+    mixed_parser.add_argument('--large-files', type=int, default=2)
+    mixed_parser.add_argument('--large-pages', type=int, default=200)
+    mixed_parser.add_argument('--max-workers', type=int, default=None)
+    mixed_parser.set_defaults(func=bench_mixed_sizes)
+
+    ann_parser = subparsers.add_parser('ann', help="Recall vs. latency of ANN index types against exact search")
+    ann_parser.add_argument('--vectors', type=int, default=200_000)
+    ann_parser.add_argument('--queries', type=int, default=1_000)
+    ann_parser.add_argument('--dim', type=int, default=256)
+    ann_parser.add_argument('--k', type=int, default=10)
+    ann_parser.add_argument('--nprobe', type=int, nargs='+', default=[4, 16, 64])
+    ann_parser.add_argument('--ef-search', type=int, nargs='+', default=[16, 64, 256])
+    ann_parser.set_defaults(func=bench_ann)
+
+    storage_parser = subparsers.add_parser('storage', help="Memory per vector and recall of compressed vector storage")
+    storage_parser.add_argument('--vectors', type=int, default=100_000)
+    storage_parser.add_argument('--queries', type=int, default=500)
+    storage_parser.add_argument('--dim', type=int, default=1536)
+    storage_parser.add_argument('--k', type=int, default=10)
+    storage_parser.add_argument('--rescore-factor', type=int, default=4)
+    storage_parser.add_argument('--truncate', type=int, nargs='*', default=[256, 512, 1024],
+                                help="Embedding dimensions to compare (synthetic vectors are not Matryoshka-trained, "
+                                     "so use --truncate with real embeddings for meaningful recall)")
+    storage_parser.set_defaults(func=bench_storage)
+
+    concurrency_parser = subparsers.add_parser('concurrency', help="Search latency while documents are being ingested")
+    concurrency_parser.add_argument('--documents', type=int, default=400)
+    concurrency_parser.add_argument('--chunks', type=int, default=100, help="Chunks per document")
+    concurrency_parser.add_argument('--queries', type=int, default=500)
+    concurrency_parser.add_argument('--dim', type=int, default=256)
+    concurrency_parser.add_argument('--k', type=int, default=5)
+    concurrency_parser.set_defaults(func=bench_concurrency)
+
+    batch_parser = subparsers.add_parser('search-batch', help="Sequential searches vs. one batched search")
+    batch_parser.add_argument('--vectors', type=int, default=100_000)
+    batch_parser.add_argument('--queries', type=int, default=1_000)
+    batch_parser.add_argument('--dim', type=int, default=256)
+    batch_parser.add_argument('--k', type=int, default=5)
+    batch_parser.add_argument('--repeat', type=int, default=3)
+    batch_parser.set_defaults(func=bench_search_batch)
+
+    rerank_parser = subparsers.add_parser('rerank', help="Relevance scoring per query with and without precomputed chunk terms")
+    rerank_parser.add_argument('--queries', type=int, default=200)
+    rerank_parser.add_argument('--k', type=int, default=20, help="Results scored per query")
+    rerank_parser.add_argument('--chunk-words', type=int, default=150)
+    rerank_parser.add_argument('--repeat', type=int, default=3)
+    rerank_parser.set_defaults(func=bench_rerank)
+
+    bm25_parser = subparsers.add_parser('bm25', help="BM25 indexing throughput and lexical queries/sec")
+    bm25_parser.add_argument('--documents', type=int, default=200_000)
+    bm25_parser.add_argument('--doc-terms', type=int, default=150, help="Terms per document (chunk)")
+    bm25_parser.add_argument('--chunks-per-document', type=int, default=100, help="Chunks indexed per add")
+    bm25_parser.add_argument('--vocabulary', type=int, default=50_000)
+    bm25_parser.add_argument('--queries', type=int, default=2_000)
+    bm25_parser.add_argument('--query-terms', type=int, default=4)
+    bm25_parser.add_argument('--k', type=int, default=20)
+    bm25_parser.add_argument('--repeat', type=int, default=3)
+    bm25_parser.set_defaults(func=bench_bm25)
+
+    query_parser = subparsers.add_parser('query-processing', help="Query preprocessing and expansion with cold and warm caches")
+    query_parser.add_argument('--queries', type=int, default=1_000)
+    query_parser.add_argument('--query-words', type=int, default=8)
+    query_parser.set_defaults(func=bench_query_processing)
+
+    chunking_parser = subparsers.add_parser('chunking', help="Text chunking throughput in MB/s")
+    chunking_parser.add_argument('--mb', type=float, default=100, help="Size of the synthetic corpus in MB")
+    chunking_parser.add_argument('--words-per-page', type=int, default=300)
+    chunking_parser.add_argument('--chunk-size', type=int, default=1000)
+    chunking_parser.add_argument('--overlap', type=int, default=200)
+    chunking_parser.add_argument('--repeat', type=int, default=3)
+    chunking_parser.set_defaults(func=bench_chunking)
+
+    normalization_parser = subparsers.add_parser('normalization', help="Index-time text cleaning MB/s and equivalence with the NLTK-based reference")
+    normalization_parser.add_argument('--pdf-dir', default=None, help="Directory of PDFs (default: synthetic fixture pages)")
+    normalization_parser.add_argument('--pages', type=int, default=2_000)
+    normalization_parser.add_argument('--words-per-page', type=int, default=400)
+    normalization_parser.add_argument('--repeat', type=int, default=3)
+    normalization_parser.set_defaults(func=bench_normalization)
+
+    local_embedding_parser = subparsers.add_parser('local-embedding', help="Local embedding backend throughput by batch size")
+    local_embedding_parser.add_argument('--backend', choices=['hashing', 'sentence-transformers'], default='hashing')
+    local_embedding_parser.add_argument('--texts', type=int, default=10_000)
+    local_embedding_parser.add_argument('--words', type=int, default=150, help="Words per text (about one chunk)")
+    local_embedding_parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 32, 256])
+    local_embedding_parser.add_argument('--repeat', type=int, default=3)
+    local_embedding_parser.set_defaults(func=bench_local_embedding)
+
+    celery_parser = subparsers.add_parser('celery-ingest', help="Celery ingestion files/sec by worker count (in-memory broker)")
+    celery_parser.add_argument('--pdf-dir', default=None, help="Directory of PDFs (default: generate synthetic PDFs)")
+    celery_parser.add_argument('--files', type=int, default=32, help="Number of synthetic PDFs")
+    celery_parser.add_argument('--pages', type=int, default=10, help="Pages per synthetic PDF")
+    celery_parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    celery_parser.add_argument('--embedding-latency', type=float, default=100, help="Simulated ms per embedding request")
+    celery_parser.set_defaults(func=bench_celery_ingest)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,391 @@
+import json
+import logging
+import math
+import os
+import threading
+from collections import Counter
+import numpy as np
+
+# Version of the on-disk index written by save
+BM25_FORMAT_VERSION = 1
+
+def reciprocal_rank_fusion(rankings, constant=60):
+    """
+    Merge several rankings of the same kind of ids with reciprocal rank fusion.
+
+    Each id scores sum(1 / (constant + rank)) over the rankings it appears in, so ids
+    ranked well by several retrievers come first without having to calibrate their scores.
+
+    :param rankings: Lists of ids, best first
+    :param constant: Damping constant (60 in the original RRF paper)
+    :return: List of ids sorted by fused score, best first
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, 1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (constant + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+class _Segment:
+    """
+    Immutable postings of a batch of documents, grouped by term id.
+
+    The postings of terms[i] are rows[ptr[i]:ptr[i + 1]] with term frequencies tfs[ptr[i]:ptr[i + 1]].
+    """
+
+    __slots__ = ('terms', 'ptr', 'rows', 'tfs')
+
+    def __init__(self, term_ids, rows, tfs):
+        order = np.argsort(term_ids, kind='stable')
+        term_ids = term_ids[order]
+        self.terms, counts = np.unique(term_ids, return_counts=True)
+        self.ptr = np.zeros(len(self.terms) + 1, dtype=np.int64)
+        np.cumsum(counts, out=self.ptr[1:])
+        self.rows = rows[order]
+        self.tfs = tfs[order]
+
+    @property
+    def size(self):
+        return len(self.rows)
+
+    def postings(self, term_id):
+        """
+        :return: (rows, tfs) of the term, or None if the segment has no postings for it
+        """
+        i = np.searchsorted(self.terms, term_id)
+        if i == len(self.terms) or self.terms[i] != term_id:
+            return None
+        return self.rows[self.ptr[i]:self.ptr[i + 1]], self.tfs[self.ptr[i]:self.ptr[i + 1]]
+
+    def triples(self):
+        """
+        :return: (term_ids, rows, tfs) with one entry per posting
+        """
+        return np.repeat(self.terms, np.diff(self.ptr)), self.rows, self.tfs
+
+def _merge_segments(segments, live, row_map=None):
+    """
+    Merge segments into one, dropping the postings of removed documents.
+
+    :param live: Boolean array marking the rows of documents that are still indexed
+    :param row_map: Optional array mapping old row numbers to new ones
+    """
+    term_ids, rows, tfs = (np.concatenate(parts) for parts in zip(*(segment.triples() for segment in segments)))
+    keep = live[rows]
+    rows = rows[keep]
+    if row_map is not None:
+        rows = row_map[rows]
+    return _Segment(term_ids[keep], rows, tfs[keep])
+
+class _State:
+    """
+    What a search sees: the segments and the document arrays they index into.
+
+    Writers publish a new state instead of changing segments, so searches run without
+    locking. Document arrays are only appended to past the rows a state knows about,
+    apart from live flags, which removals clear in place.
+    """
+
+    __slots__ = ('segments', 'doc_ids', 'doc_lengths', 'live', 'nrows', 'live_count', 'total_length', '_norms')
+
+    def __init__(self, segments, doc_ids, doc_lengths, live, nrows, live_count, total_length):
+        self.segments = segments
+        self.doc_ids = doc_ids
+        self.doc_lengths = doc_lengths
+        self.live = live
+        self.nrows = nrows
+        self.live_count = live_count
+        self.total_length = total_length
+        self._norms = None
+
+    def norms(self, k1, b):
+        """
+        BM25 length normalization k1 * (1 - b + b * length / average length) of every row,
+        computed on the first search of the state.
+        """
+        if self._norms is None:
+            average_length = self.total_length / self.live_count
+            self._norms = (k1 * (1 - b + b * self.doc_lengths[:self.nrows] / average_length)).astype(np.float32)
+        return self._norms
+
+class BM25Index:
+    """
+    Inverted index of chunk terms with BM25 ranking.
+
+    Postings (document row and term frequency per term) are kept in numpy segments:
+    every add creates a small segment, and segments of similar size are merged like a
+    binary counter, so there are only logarithmically many of them. On disk the index
+    is an .npz file holding one compacted segment plus an append log of the adds and
+    removals made since it was saved, so appends do not rewrite the index.
+    """
+
+    def __init__(self, filename=None, k1=1.2, b=0.75):
+        """
+        :param filename: Path of the .npz index file; it is loaded if it exists, and changes are logged next to it
+        :param k1: BM25 term frequency saturation
+        :param b: BM25 document length normalization
+        """
+        self.filename = filename
+        self.k1 = k1
+        self.b = b
+        self.lock = threading.Lock()
+        self._vocabulary = {}
+        self._terms = []
+        self._rows = {}
+        self._state = _State((), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32),
+                             np.zeros(0, dtype=bool), 0, 0, 0.0)
+        if filename:
+            self.load()
+
+    @property
+    def document_count(self):
+        """
+        Number of indexed documents.
+        """
+        return self._state.live_count
+
+    def add_documents(self, ids, documents_terms, replace_ids=None):
+        """
+        Index documents, replacing documents already indexed under the same ids.
+
+        :param ids: Document ids (chunk ids)
+        :param documents_terms: One list of terms per document, with repeated terms counted as term frequency
+        :param replace_ids: Ids of documents to remove in the same update
+        """
+        documents = [(doc_id, Counter(terms)) for doc_id, terms in zip(ids, documents_terms)]
+        with self.lock:
+            self._apply(documents, replace_ids or [])
+            self._log({'add': [[doc_id, counts] for doc_id, counts in documents], 'remove': list(replace_ids or [])})
+
+    def remove_ids(self, ids):
+        """
+        Remove documents from the index.
+
+        :param ids: Document ids to remove; unknown ids are ignored
+        """
+        if not ids:
+            return
+        with self.lock:
+            self._apply([], ids)
+            self._log({'remove': list(ids)})
+
+    def clear(self):
+        """
+        Remove all documents, e.g. before rebuilding the index.
+        """
+        with self.lock:
+            self._vocabulary = {}
+            self._terms = []
+            self._rows = {}
+            self._state = _State((), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32),
+                                 np.zeros(0, dtype=bool), 0, 0, 0.0)
+            if self.filename and os.path.exists(self._log_filename()):
+                os.remove(self._log_filename())
+
+    def _apply(self, documents, removed_ids):
+        """
+        Publish a state with the given documents added and removed. Called with the lock held.
+
+        :param documents: List of (id, Counter of terms) tuples
+        """
+        state = self._state
+        live_count, total_length = state.live_count, state.total_length
+        doc_ids, doc_lengths, live = state.doc_ids, state.doc_lengths, state.live
+        for doc_id in list(removed_ids) + [doc_id for doc_id, _ in documents]:
+            row = self._rows.pop(doc_id, None)
+            if row is not None:
+                live[row] = False
+                live_count -= 1
+                total_length -= doc_lengths[row]
+
+        segments = state.segments
+        nrows = state.nrows
+        if documents:
+            if nrows + len(documents) > len(doc_ids):
+                capacity = max(2 * len(doc_ids), nrows + len(documents), 1024)
+                doc_ids = np.resize(doc_ids, capacity)
+                doc_lengths = np.resize(doc_lengths, capacity)
+                live = np.resize(live, capacity)
+            term_ids, rows, tfs = [], [], []
+            for row, (doc_id, counts) in enumerate(documents, nrows):
+                self._rows[doc_id] = row
+                doc_ids[row] = doc_id
+                doc_lengths[row] = sum(counts.values())
+                live[row] = True
+                total_length += doc_lengths[row]
+                for term, tf in counts.items():
+                    term_id = self._vocabulary.get(term)
+                    if term_id is None:
+                        term_id = self._vocabulary[term] = len(self._terms)
+                        self._terms.append(term)
+                    term_ids.append(term_id)
+                    rows.append(row)
+                    tfs.append(tf)
+            nrows += len(documents)
+            live_count += len(documents)
+            segments = list(segments)
+            if term_ids:
+                segments.append(_Segment(np.array(term_ids, dtype=np.int64), np.array(rows, dtype=np.int64),
+                                         np.array(tfs, dtype=np.float32)))
+            # Merge segments of similar size, like a binary counter, to keep their number logarithmic
+            while len(segments) > 1 and segments[-2].size <= 2 * segments[-1].size:
+                segments[-2:] = [_merge_segments(segments[-2:], live)]
+            segments = tuple(segments)
+
+        self._state = _State(segments, doc_ids, doc_lengths, live, nrows, live_count, total_length)
+
+    def search(self, query_terms, k=10):
+        """
+        Rank the indexed documents for a query with BM25.
+
+        :param query_terms: Terms of the query, e.g. from TermExtractor.terms
+        :param k: Number of results
+        :return: List of (id, score) tuples, best first
+        """
+        return self.search_batch([query_terms], k)[0]
+
+    def search_batch(self, queries_terms, k=10):
+        """
+        Rank the indexed documents for several queries with BM25.
+
+        :param queries_terms: One list of terms per query
+        :param k: Number of results per query
+        :return: One list of (id, score) tuples per query, best first
+        """
+        state = self._state
+        return [self._search(state, query_terms, k) for query_terms in queries_terms]
+
+    def _search(self, state, query_terms, k):
+        if not state.live_count or k <= 0:
+            return []
+        norms = state.norms(self.k1, self.b)
+        row_parts, score_parts = [], []
+        for term in set(query_terms):
+            term_id = self._vocabulary.get(term)
+            if term_id is None:
+                continue
+            postings = [p for p in (segment.postings(term_id) for segment in state.segments) if p is not None]
+            # Removed documents still count towards document frequency until their segment is merged
+            document_frequency = sum(len(rows) for rows, _ in postings)
+            if not document_frequency:
+                continue
+            idf = math.log(1 + (state.live_count - document_frequency + 0.5) / (document_frequency + 0.5))
+            for rows, tfs in postings:
+                row_parts.append(rows)
+                score_parts.append(np.float32(idf * (self.k1 + 1)) * tfs / (tfs + norms[rows]))
+        if not row_parts:
+            return []
+
+        rows = np.concatenate(row_parts)
+        scores = np.concatenate(score_parts)
+        if len(row_parts) > 1 and 8 * len(rows) > state.nrows:
+            # Many postings: accumulate into a dense array over all rows instead of sorting them
+            scores = np.bincount(rows, weights=scores, minlength=state.nrows) * state.live[:state.nrows]
+            rows = np.argpartition(-scores, k - 1)[:k] if len(scores) > k else np.arange(len(scores))
+            rows = rows[scores[rows] > 0]
+            scores = scores[rows]
+        else:
+            if len(row_parts) > 1:
+                rows, inverse = np.unique(rows, return_inverse=True)
+                scores = np.bincount(inverse, weights=scores)
+            live = state.live[rows]
+            rows, scores = rows[live], scores[live]
+            if len(rows) > k:
+                top = np.argpartition(-scores, k - 1)[:k]
+                rows, scores = rows[top], scores[top]
+        # Ties are broken by indexing order, so results do not depend on how segments were merged
+        order = np.lexsort((rows, -scores))
+        return list(zip(state.doc_ids[rows[order]].tolist(), scores[order].tolist()))
+
+    def save(self):
+        """
+        Compact the index into its .npz file and truncate the append log.
+
+        Removed documents are dropped and all segments are merged into one.
+        """
+        if not self.filename:
+            raise ValueError("BM25Index has no filename to save to")
+        with self.lock:
+            state = self._state
+            live = state.live[:state.nrows]
+            row_map = np.cumsum(live) - 1
+            segment = _merge_segments(state.segments, live, row_map) if state.segments else None
+            doc_ids = state.doc_ids[:state.nrows][live]
+            doc_lengths = state.doc_lengths[:state.nrows][live]
+
+            # Terms never contain whitespace, so the vocabulary is stored as one newline-separated string
+            vocabulary = np.frombuffer('\n'.join(self._terms).encode('utf-8'), dtype=np.uint8)
+            arrays = {
+                'format_version': np.array(BM25_FORMAT_VERSION),
+                'vocabulary': vocabulary,
+                'doc_ids': doc_ids,
+                'doc_lengths': doc_lengths.astype(np.uint32),
+                'terms': segment.terms if segment else np.zeros(0, dtype=np.int64),
+                'ptr': segment.ptr if segment else np.zeros(1, dtype=np.int64),
+                'rows': (segment.rows if segment else np.zeros(0)).astype(np.uint32),
+                'tfs': np.minimum(segment.tfs if segment else np.zeros(0), np.iinfo(np.uint16).max).astype(np.uint16),
+            }
+            temp_filename = f"{self.filename}.tmp.npz"
+            np.savez(temp_filename, **arrays)
+            os.replace(temp_filename, self.filename)
+            if os.path.exists(self._log_filename()):
+                os.remove(self._log_filename())
+
+            segments = (segment,) if segment and segment.size else ()
+            self._rows = {doc_id: row for row, doc_id in enumerate(doc_ids.tolist())}
+            self._state = _State(segments, doc_ids.copy(), doc_lengths.copy(), np.ones(len(doc_ids), dtype=bool),
+                                 len(doc_ids), len(doc_ids), float(doc_lengths.sum()))
+        logging.info(f"Saved BM25 index with {len(doc_ids)} documents to {self.filename}")
+
+    def load(self):
+        """
+        Load the index from its .npz file and replay the append log.
+        """
+        with self.lock:
+            if os.path.exists(self.filename):
+                try:
+                    with np.load(self.filename) as data:
+                        if int(data['format_version']) != BM25_FORMAT_VERSION:
+                            raise ValueError(f"unsupported format version {int(data['format_version'])}")
+                        vocabulary = bytes(data['vocabulary']).decode('utf-8')
+                        self._terms = vocabulary.split('\n') if vocabulary else []
+                        self._vocabulary = {term: term_id for term_id, term in enumerate(self._terms)}
+                        doc_ids = data['doc_ids'].astype(np.int64)
+                        doc_lengths = data['doc_lengths'].astype(np.float32)
+                        segment = _Segment.__new__(_Segment)
+                        segment.terms = data['terms']
+                        segment.ptr = data['ptr']
+                        segment.rows = data['rows'].astype(np.int64)
+                        segment.tfs = data['tfs'].astype(np.float32)
+                except (OSError, KeyError, ValueError) as e:
+                    logging.warning(f"Could not load BM25 index from {self.filename}: {e}")
+                else:
+                    self._rows = {doc_id: row for row, doc_id in enumerate(doc_ids.tolist())}
+                    self._state = _State((segment,) if segment.size else (), doc_ids, doc_lengths,
+                                         np.ones(len(doc_ids), dtype=bool), len(doc_ids), len(doc_ids),
+                                         float(doc_lengths.sum()))
+
+            if os.path.exists(self._log_filename()):
+                replayed = 0
+                with open(self._log_filename(), encoding='utf-8') as f:
+                    for line in f:
+                        try:
+                            entry = json.loads(line)
+                        except ValueError:
+                            # An interrupted write leaves a partial last line
+                            break
+                        self._apply([(doc_id, Counter(counts)) for doc_id, counts in entry.get('add', [])],
+                                    entry.get('remove', []))
+                        replayed += 1
+                logging.info(f"Replayed {replayed} BM25 index updates from {self._log_filename()}")
+
+    def _log(self, entry):
+        """
+        Append an update to the log. Called with the lock held.
+        """
+        if self.filename:
+            with open(self._log_filename(), 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry) + '\n')
+
+    def _log_filename(self):
+        return f"{self.filename}.log"
@@ -0,0 +1,160 @@
+import math
+import statistics
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+class QueueFull(RuntimeError):
+    """
+    Raised when a BoundedExecutor has no free worker and its queue is full.
+    """
+
+    def __init__(self, name, retry_after):
+        super().__init__(f"The {name} queue is full")
+        self.retry_after = retry_after
+
+class BoundedExecutor:
+    """
+    Thread pool with a bounded queue and admission control.
+
+    At most max_workers jobs run at once and at most max_queue more wait for a worker;
+    submit raises QueueFull beyond that instead of queueing without limit. Queue wait
+    and run times of recent jobs are kept for stats() and the Retry-After estimate.
+    """
+
+    def __init__(self, name, max_workers=4, max_queue=32, window=1000):
+        """
+        :param name: Pool name, used in thread names and errors
+        :param max_workers: Number of worker threads
+        :param max_queue: Number of jobs that may wait for a worker
+        :param window: Number of recent jobs the timing statistics are computed over
+        """
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{name}-worker")
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._wait_times = deque(maxlen=window)
+        self._run_times = deque(maxlen=window)
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Run fn(*args, **kwargs) on a worker thread.
+
+        :return: concurrent.futures.Future
+        :raises QueueFull: If max_workers jobs are running and max_queue jobs are waiting
+        """
+        with self._lock:
+            if self._queued + self._running >= self.max_workers + self.max_queue:
+                self._rejected += 1
+                raise QueueFull(self.name, self._retry_after())
+            self._queued += 1
+        submitted = time.perf_counter()
+
+        def run():
+            started = time.perf_counter()
+            with self._lock:
+                self._queued -= 1
+                self._running += 1
+                self._wait_times.append(started - submitted)
+            failed = True
+            try:
+                result = fn(*args, **kwargs)
+                failed = False
+                return result
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self._completed += 1
+                    self._failed += failed
+                    self._run_times.append(time.perf_counter() - started)
+
+        try:
+            return self._executor.submit(run)
+        except RuntimeError:
+            with self._lock:
+                self._queued -= 1
+            raise
+
+    def acquire_slot(self):
+        """
+        Admit a job that runs on the calling thread instead of a worker, e.g. a streamed
+        response, under the same limit and with the same statistics as submitted jobs.
+
+        :return: Function release(failed=False) to call once the job has finished; later calls are ignored
+        :raises QueueFull: If max_workers + max_queue jobs are already admitted
+        """
+        with self._lock:
+            if self._queued + self._running >= self.max_workers + self.max_queue:
+                self._rejected += 1
+                raise QueueFull(self.name, self._retry_after())
+            self._running += 1
+        started = time.perf_counter()
+        released = []
+
+        def release(failed=False):
+            with self._lock:
+                if released:
+                    return
+                released.append(True)
+                self._running -= 1
+                self._completed += 1
+                self._failed += failed
+                self._run_times.append(time.perf_counter() - started)
+
+        return release
+
+    def retry_after(self):
+        """
+        Seconds a rejected client should wait before retrying.
+        """
+        with self._lock:
+            return self._retry_after()
+
+    def _retry_after(self):
+        """
+        Estimated time until a queue slot frees up: one average job run time per worker
+        round needed to drain the queue, at least one second. Called with the lock held.
+        """
+        if not self._run_times:
+            return 1
+        rounds = (self._queued + 1) / self.max_workers
+        return max(1, math.ceil(statistics.fmean(self._run_times) * rounds))
+
+    def stats(self):
+        """
+        Return the pool's load and timing counters.
+
+        :return: Dictionary with in-flight, queued and completed job counts and queue wait / run time statistics in ms
+        """
+        with self._lock:
+            wait_times = sorted(self._wait_times)
+            run_times = list(self._run_times)
+            return {
+                'max_workers': self.max_workers,
+                'max_queue': self.max_queue,
+                'in_flight': self._running,
+                'queued': self._queued,
+                'completed': self._completed,
+                'failed': self._failed,
+                'rejected': self._rejected,
+                'queue_wait_ms': {
+                    'mean': statistics.fmean(wait_times) * 1000 if wait_times else 0.0,
+                    'p50': wait_times[len(wait_times) // 2] * 1000 if wait_times else 0.0,
+                    'p95': wait_times[int(len(wait_times) * 0.95)] * 1000 if wait_times else 0.0,
+                    'max': wait_times[-1] * 1000 if wait_times else 0.0,
+                },
+                'run_time_ms': {
+                    'mean': statistics.fmean(run_times) * 1000 if run_times else 0.0,
+                    'max': max(run_times) * 1000 if run_times else 0.0,
+                }
+            }
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
@@ -1,28 +1,145 @@
-from celery import Celery
-from indexing_pipeline import IndexingPipeline
+from celery import Celery, chord
+from celery.signals import worker_process_init
+import indexing_pipeline
+from indexing_pipeline import get_pipeline
+from database_manager import DatabaseManager
+from pdf_processor import process_multiple_pdfs
+import logging
 import os
+import threading
 from dotenv import load_dotenv
 
 load_dotenv()
 
 redis_url = f"redis://{os.getenv('REDIS_HOST', 'localhost')}:{os.getenv('REDIS_PORT', '6379')}/{os.getenv('REDIS_DB', '0')}"
-celery = Celery('tasks', broker=redis_url, backend=redis_url)
+# CELERY_BROKER_URL=memory:// with CELERY_RESULT_BACKEND=cache+memory:// runs everything in one process, e.g. for tests
+celery = Celery('tasks', broker=os.getenv('CELERY_BROKER_URL') or redis_url, backend=os.getenv('CELERY_RESULT_BACKEND') or redis_url)
+
+_chunk_writer = None
+_chunk_writer_lock = threading.Lock()
+
+@worker_process_init.connect
+def warm_up_worker(**kwargs):
+    """
+    Build the worker process's pipeline when the process starts instead of on its first task.
+    A pipeline inherited from the parent process is dropped, since its database connections
+    and index state must not be shared across a fork.
+    """
+    global _chunk_writer
+    indexing_pipeline._shared_pipeline = None
+    _chunk_writer = None
+    get_pipeline()
+
+def get_chunk_writer():
+    """
+    Return the worker process's database manager for storing chunks.
+
+    It is not connected to the FAISS and BM25 indexes: ingestion tasks only write chunks to
+    the shared database, and merge_indexed_documents adds them to the served indexes.
+    """
+    global _chunk_writer
+    if _chunk_writer is None:
+        with _chunk_writer_lock:
+            if _chunk_writer is None:
+                _chunk_writer = DatabaseManager(os.getenv('DB_NAME', 'pdf_extracts.db'))
+    return _chunk_writer
+
+@celery.task(bind=True)
+def run_indexing_pipeline(self, pdf_files, save_to_file=False, keyword_filter=None, max_pages=None, clean_text=False, chunk_size=1000, chunk_overlap=200, incremental=True):
+    """
+    Index PDF files across the Celery workers.
+
+    The job fans out into one index_document task per new or changed file, so files are
+    extracted, embedded and stored in parallel on all workers; a chord then runs
+    merge_indexed_documents once they have all finished. The files must be readable under
+    the same paths by every worker.
+
+    :param pdf_files: List of PDF file paths
+    :return: Summary of the job once the merge has run (see merge_indexed_documents)
+    """
+    if isinstance(pdf_files, str):
+        pdf_files = [pdf_files]
+    if keyword_filter:
+        pdf_files = [f for f in pdf_files if keyword_filter.lower() in os.path.basename(f).lower()]
+
+    pipeline = get_pipeline()
+    manifest_updates = {}
+    if incremental:
+        params_hash = pipeline.indexing_params_hash(max_pages, clean_text, chunk_size, chunk_overlap)
+        pdf_files, manifest_updates = pipeline._select_changed_files(pdf_files, params_hash)
+    if not pdf_files:
+        return {'indexed': 0, 'chunks': 0, 'failed': {}}
+
+    header = [index_document.s(pdf_file, save_to_file, max_pages, clean_text, chunk_size, chunk_overlap, manifest_updates.get(pdf_file))
+              for pdf_file in pdf_files]
+    return self.replace(chord(header, merge_indexed_documents.s()))
 
 @celery.task
-def run_indexing_pipeline(save_to_file=False, keyword_filter=None, max_pages=None, clean_text=False, chunk_size=1000, chunk_overlap=200):
-    pipeline = IndexingPipeline()
-    results = pipeline.run(
-        save_to_file=save_to_file,
-        keyword_filter=keyword_filter,
-        max_pages=max_pages,
-        clean_text=clean_text,
-        chunk_size=chunk_size,
-        chunk_overlap=chunk_overlap
+def index_document(pdf_file, save_to_file=False, max_pages=None, clean_text=False, chunk_size=1000, chunk_overlap=200, manifest_row=None):
+    """
+    Extract, chunk, embed and store one PDF file, without touching the served indexes.
+
+    Failures are returned instead of raised, so one bad file does not fail the whole chord.
+
+    :param manifest_row: Document manifest row to record once the file's chunks are merged
+    :return: Dictionary with the file, its new chunk ids and the ids of the chunks they replace,
+             or with the file and an error message
+    """
+    pipeline = get_pipeline()
+    chunk_writer = get_chunk_writer()
+    source_path = os.path.abspath(pdf_file)
+    try:
+        previous_ids = chunk_writer.get_chunk_ids(source_path)
+        results = process_multiple_pdfs(
+            [pdf_file],
+            save_to_file=save_to_file,
+            max_pages=max_pages,
+            clean_text=clean_text,
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            use_faiss=False,
+            db_manager=chunk_writer,
+            embedding_model=pipeline.embedding_model,
+            term_extractor=pipeline.query_processor.term_extractor
+        )
+        if not results:
+            return {'file': pdf_file, 'error': 'No text could be extracted'}
+        chunk_ids = chunk_writer.get_chunk_ids(source_path)
+    except Exception as e:
+        logging.exception(f"Indexing {pdf_file} failed")
+        return {'file': pdf_file, 'error': str(e)}
+    return {
+        'file': pdf_file,
+        'chunk_ids': chunk_ids,
+        'replaced_ids': sorted(set(previous_ids) - set(chunk_ids)),
+        'manifest_row': manifest_row
+    }
+
+@celery.task
+def merge_indexed_documents(documents):
+    """
+    Merge the chunks stored by the index_document tasks of a job into the served FAISS and BM25
+    indexes, save them and record the indexed files in the document manifest. Processes serving
+    searches pick the saved indexes up through IndexingPipeline.refresh_index.
+
+    :param documents: Results of the job's index_document tasks
+    :return: Dictionary with the number of indexed files and chunks and the errors of failed files
+    """
+    pipeline = get_pipeline()
+    indexed = [document for document in documents if 'error' not in document]
+    added = pipeline.merge_indexed_chunks(
+        [chunk_id for document in indexed for chunk_id in document['chunk_ids']],
+        [chunk_id for document in indexed for chunk_id in document['replaced_ids']]
     )
-    return f'Indexed {len(results)} PDF files successfully.'
+    pipeline.db_manager.upsert_documents(tuple(document['manifest_row']) for document in indexed if document['manifest_row'])
+    return {
+        'indexed': len(indexed),
+        'chunks': added,
+        'failed': {document['file']: document['error'] for document in documents if 'error' in document}
+    }
 
 @celery.task
 def generate_context_aware_response(query_text, conversation_history, k=5):
-    pipeline = IndexingPipeline()
+    pipeline = get_pipeline()
     response = pipeline.generate_context_aware_response(query_text, conversation_history, k)
     return {'response': response, 'conversation_history': conversation_history + [{"role": "assistant", "content": response}]}
@@ -1,14 +1,61 @@
 import sqlite3
+import threading
+import logging
+import time
 from datetime import datetime
 import json
+from contextlib import contextmanager
 import numpy as np
 
+# Version of the schema created by create_tables, stored in PRAGMA user_version
+SCHEMA_VERSION = 1
+# Staged documents older than this were left behind by a writer that stopped, and are deleted
+STALE_STAGE_SECONDS = 24 * 3600
+
 class DatabaseManager:
     def __init__(self, db_name='pdf_extracts.db'):
-        self.conn = sqlite3.connect(db_name)
-        self.cursor = self.conn.cursor()
+        # Every thread gets its own connection and the database runs in WAL mode, so searches
+        # read concurrently with each other and with an ongoing ingest. Writers are serialized
+        # through self.lock, which also keeps chunk ids and FAISS vector ids in step.
+        self.db_name = db_name or 'pdf_extracts.db'
+        self.lock = threading.RLock()
+        self._local = threading.local()
+        self._connections = {}
+        self._connections_lock = threading.Lock()
+        self.migrated = False
+        self.conn.execute('PRAGMA journal_mode = WAL')
         self.create_tables()
         self.faiss_manager = None
+        self.bm25_index = None
+        # Incremented whenever chunks are added or removed, so caches of search results can tell they are stale
+        self.version = 0
+
+    @property
+    def conn(self):
+        """
+        The calling thread's connection.
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_name, check_same_thread=False, timeout=30)
+            conn.execute('PRAGMA foreign_keys = ON')
+            conn.execute('PRAGMA synchronous = NORMAL')  # Durable with WAL; only the last commits may be lost on power failure
+            self._local.conn = conn
+            self._local.cursor = conn.cursor()
+            with self._connections_lock:
+                # Close the connections of worker threads that have exited
+                for thread in [thread for thread in self._connections if not thread.is_alive()]:
+                    self._connections.pop(thread).close()
+                self._connections[threading.current_thread()] = conn
+        return conn
+
+    @property
+    def cursor(self):
+        """
+        The calling thread's cursor.
+        """
+        self.conn
+        return self._local.cursor
 
     def create_tables(self):
         self.cursor.execute('''
@@ -22,39 +69,568 @@ class DatabaseManager:
             embedding TEXT
         )
         ''')
-        self.conn.commit()
-
-    def insert_pdf_extract(self, filename, extracted_text, page_count, cleaned, chunk_embeddings):
+        columns = {row[1] for row in self.cursor.execute('PRAGMA table_info(pdf_extracts)')}
+        if 'source_path' not in columns:
+            self.cursor.execute('ALTER TABLE pdf_extracts ADD COLUMN source_path TEXT')
+        self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_pdf_extracts_source_path ON pdf_extracts (source_path)')
+        self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_pdf_extracts_filename ON pdf_extracts (filename)')
+        # One row per chunk; the chunk id is also the chunk's vector id in the FAISS index
+        self.cursor.execute('''
+        CREATE TABLE IF NOT EXISTS chunks (
+            id INTEGER PRIMARY KEY,
+            doc_id INTEGER NOT NULL REFERENCES pdf_extracts (id) ON DELETE CASCADE,
+            ordinal INTEGER NOT NULL,
+            start_char INTEGER,
+            end_char INTEGER,
+            page INTEGER,
+            text TEXT NOT NULL,
+            embedding BLOB NOT NULL,
+            terms TEXT
+        )
+        ''')
+        # Lemmatized terms of each chunk, sorted and separated by spaces; repeated terms give the
+        # term frequencies of the BM25 index, distinct terms the keyword overlap score
+        chunk_columns = {row[1] for row in self.cursor.execute('PRAGMA table_info(chunks)')}
+        if 'terms' not in chunk_columns:
+            self.cursor.execute('ALTER TABLE chunks ADD COLUMN terms TEXT')
+        self.cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_chunks_doc_id ON chunks (doc_id, ordinal)')
+        # Next chunk id to assign. Ids are never reused, because the FAISS index tombstones removed
+        # ids; processes that write chunks without holding the index allocate ids from here
+        self.cursor.execute('CREATE TABLE IF NOT EXISTS chunk_id_sequence (next_id INTEGER NOT NULL)')
+        # Manifest of indexed files, used to skip files whose content and indexing parameters are unchanged
+        self.cursor.execute('''
+        CREATE TABLE IF NOT EXISTS documents (
+            source_path TEXT PRIMARY KEY,
+            content_hash TEXT NOT NULL,
+            params_hash TEXT NOT NULL,
+            file_size INTEGER,
+            mtime REAL,
+            indexed_at DATETIME
+        )
+        ''')
+        self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_documents_content_hash ON documents (content_hash)')
+        # Text of documents written page window by page window (see pdf_extract_writer), whose
+        # pdf_extracts.extracted_text is NULL
+        self.cursor.execute('''
+        CREATE TABLE IF NOT EXISTS pdf_extract_parts (
+            doc_id INTEGER NOT NULL REFERENCES pdf_extracts (id) ON DELETE CASCADE,
+            ordinal INTEGER NOT NULL,
+            text TEXT NOT NULL,
+            PRIMARY KEY (doc_id, ordinal)
+        )
+        ''')
+        # Documents being written by pdf_extract_writer. Their chunks and text parts are committed
+        # here batch by batch and only moved to the tables above once the document is complete.
+        self.cursor.execute('CREATE TABLE IF NOT EXISTS staged_extracts (id INTEGER PRIMARY KEY AUTOINCREMENT, created REAL NOT NULL)')
         self.cursor.execute('''
-        INSERT INTO pdf_extracts (filename, extracted_text, page_count, extraction_date, cleaned, embedding)
-        VALUES (?, ?, ?, ?, ?, ?)
-        ''', (filename, extracted_text, page_count, datetime.now(), cleaned, json.dumps(chunk_embeddings)))
+        CREATE TABLE IF NOT EXISTS staged_chunks (
+            stage_id INTEGER NOT NULL REFERENCES staged_extracts (id) ON DELETE CASCADE,
+            ordinal INTEGER NOT NULL,
+            start_char INTEGER,
+            end_char INTEGER,
+            page INTEGER,
+            text TEXT NOT NULL,
+            embedding BLOB NOT NULL,
+            terms TEXT,
+            PRIMARY KEY (stage_id, ordinal)
+        )
+        ''')
+        self.cursor.execute('''
+        CREATE TABLE IF NOT EXISTS staged_extract_parts (
+            stage_id INTEGER NOT NULL REFERENCES staged_extracts (id) ON DELETE CASCADE,
+            ordinal INTEGER NOT NULL,
+            text TEXT NOT NULL,
+            PRIMARY KEY (stage_id, ordinal)
+        )
+        ''')
+        self.cursor.execute('DELETE FROM staged_extracts WHERE created < ?', (time.time() - STALE_STAGE_SECONDS,))
         self.conn.commit()
 
-        if self.faiss_manager:
-            vectors = [np.array(emb) for emb in chunk_embeddings]
+        version = self.cursor.execute('PRAGMA user_version').fetchone()[0]
+        if version < SCHEMA_VERSION:
+            self.migrate_json_embeddings()
+            self.cursor.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+            self.conn.commit()
+
+    def migrate_json_embeddings(self):
+        """
+        Move chunk embeddings stored as JSON in pdf_extracts.embedding into the chunks table.
+
+        Older databases did not store chunk texts, so they are recovered by re-chunking the
+        extracted text with the default TextChunker settings. Rows where that does not reproduce
+        the stored number of embeddings keep their vectors with empty chunk texts. Sets
+        self.migrated so the caller can rebuild its FAISS index from the chunks table.
+        """
+        from text_chunker import TextChunker
+        text_chunker = TextChunker()
+        columns = {row[1] for row in self.cursor.execute('PRAGMA table_info(pdf_extracts)')}
+        vector_ids_column = 'vector_ids' if 'vector_ids' in columns else 'NULL'
+        rows = self.cursor.execute(f'''
+        SELECT id, filename, extracted_text, embedding, {vector_ids_column} FROM pdf_extracts
+        WHERE embedding IS NOT NULL AND id NOT IN (SELECT doc_id FROM chunks)
+        ''').fetchall()
+        for doc_id, filename, extracted_text, embedding_json, vector_ids in rows:
+            embeddings = json.loads(embedding_json) or []
+            spans = text_chunker.chunk_spans(extracted_text or '')
+            if len(spans) != len(embeddings):
+                logging.warning(f"Could not recover chunk texts for {filename} during migration; storing vectors without text.")
+                spans = [(None, None)] * len(embeddings)
+            ids = json.loads(vector_ids) if vector_ids else None
+            if ids is None or len(ids) != len(embeddings):
+                ids = [None] * len(embeddings)
+            self.cursor.executemany('''
+            INSERT INTO chunks (id, doc_id, ordinal, start_char, end_char, page, text, embedding)
+            VALUES (?, ?, ?, ?, ?, NULL, ?, ?)
+            ''', [(chunk_id, doc_id, ordinal, start, end,
+                   extracted_text[start:end] if start is not None else '',
+                   np.asarray(embedding, dtype=np.float32).tobytes())
+                  for ordinal, (chunk_id, (start, end), embedding) in enumerate(zip(ids, spans, embeddings))])
+            self.cursor.execute('UPDATE pdf_extracts SET embedding = NULL WHERE id = ?', (doc_id,))
+        if rows:
+            logging.info(f"Migrated chunk embeddings of {len(rows)} PDF extracts to the chunks table.")
+            self.migrated = True
+
+    def insert_pdf_extract(self, filename, extracted_text, page_count, cleaned, chunk_embeddings, chunks=None, source_path=None, chunk_offsets=None, chunk_pages=None, chunk_terms=None):
+        """
+        Store a PDF extract with its chunks and add the chunk vectors to the FAISS index
+        (and the chunk terms to the BM25 index, if one is set).
+
+        The document row and all chunk rows are written in one transaction. When source_path
+        is given, extracts previously stored for the same file are replaced, including their
+        vectors in the FAISS index.
+
+        :param chunk_embeddings: One embedding per chunk (numpy arrays or lists of floats)
+        :param chunks: Chunk texts
+        :param chunk_offsets: Optional (start, end) character offsets of each chunk in extracted_text
+        :param chunk_pages: Optional page number of each chunk
+        :param chunk_terms: Optional lemmatized terms of each chunk (see TermExtractor)
+        :return: Id of the inserted pdf_extracts row
+        """
+        if chunks is None:
             chunks = extracted_text.split('\n\n')  # Assuming chunks are separated by double newlines
-            if len(vectors) == len(chunks):
-                self.faiss_manager.add_vectors(vectors, chunks)
-            else:
-                print(f"Warning: Mismatch in number of vectors ({len(vectors)}) and chunks ({len(chunks)}) for {filename}. Skipping FAISS insertion.")
+        if len(chunk_embeddings) != len(chunks):
+            raise ValueError(f"Mismatch in number of embeddings ({len(chunk_embeddings)}) and chunks ({len(chunks)}) for {filename}")
+        vectors = np.asarray(chunk_embeddings, dtype=np.float32).reshape(len(chunks), -1) if len(chunks) else []
+        chunk_offsets = chunk_offsets or [(None, None)] * len(chunks)
+        chunk_pages = chunk_pages or [None] * len(chunks)
+        documents_terms = chunk_terms
+        chunk_terms = [self._join_terms(terms) for terms in chunk_terms] if chunk_terms else [None] * len(chunks)
+
+        with self.lock:
+            try:
+                replaced_ids = []
+                if source_path is not None:
+                    replaced_ids = self.delete_pdf_extracts(source_path, commit=False, remove_vectors=False)
+
+                self.cursor.execute('''
+                INSERT INTO pdf_extracts (filename, extracted_text, page_count, extraction_date, cleaned, source_path)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ''', (filename, extracted_text, page_count, datetime.now(), cleaned, source_path))
+                doc_id = self.cursor.lastrowid
+
+                first_id = self._first_free_chunk_id(replaced_ids)
+                ids = list(range(first_id, first_id + len(chunks)))
+                self._set_next_chunk_id(first_id + len(chunks))
+                self.cursor.executemany('''
+                INSERT INTO chunks (id, doc_id, ordinal, start_char, end_char, page, text, embedding, terms)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', [(chunk_id, doc_id, ordinal, start, end, page, text, vector.tobytes(), terms)
+                      for ordinal, (chunk_id, text, (start, end), page, vector, terms)
+                      in enumerate(zip(ids, chunks, chunk_offsets, chunk_pages, vectors, chunk_terms))])
+
+                self.conn.commit()
+                self.version += 1
+            except Exception:
+                self.conn.rollback()
+                raise
+            # The index is updated after the commit, so an index rebuild scanning the chunks
+            # table concurrently either sees this document or receives the update afterwards
+            if self.faiss_manager and (len(chunks) or replaced_ids):
+                # Swap the document's old vectors for the new ones in a single index update
+                self.faiss_manager.add_vectors(vectors if len(chunks) else np.zeros((0, self.faiss_manager.dimension), dtype=np.float32),
+                                               chunks, ids=ids, replace_ids=replaced_ids)
+            if self.bm25_index is not None and (documents_terms or replaced_ids):
+                self.bm25_index.add_documents(ids if documents_terms else [], documents_terms or [], replace_ids=replaced_ids)
+        return doc_id
+
+    @contextmanager
+    def pdf_extract_writer(self, filename, cleaned, source_path=None):
+        """
+        Store a PDF extract whose text and chunks arrive in batches, e.g. while a large PDF is
+        still being parsed, so the whole document never has to be held in memory.
+
+        Each batch is committed to staging tables as soon as it is appended, with the lock held
+        only while it is written, so other writers are not blocked while the document is parsed
+        and embedded. When the with block exits, the staged document replaces the extracts
+        previously stored for source_path in one transaction, as with insert_pdf_extract, and
+        its chunk vectors are added to the FAISS index (and its chunk terms to the BM25 index)
+        batch by batch. If the block raises, the staged batches are deleted.
+
+        :return: Context manager yielding a PdfExtractWriter
+        """
+        with self.lock:
+            self.cursor.execute('INSERT INTO staged_extracts (created) VALUES (?)', (time.time(),))
+            writer = PdfExtractWriter(self, self.cursor.lastrowid)
+            self.conn.commit()
+        try:
+            yield writer
+        except Exception:
+            self._discard_stage(writer.stage_id)
+            raise
+
+        with self.lock:
+            try:
+                replaced_ids = []
+                if source_path is not None:
+                    replaced_ids = self.delete_pdf_extracts(source_path, commit=False, remove_vectors=False)
+
+                self.cursor.execute('''
+                INSERT INTO pdf_extracts (filename, extracted_text, page_count, extraction_date, cleaned, source_path)
+                VALUES (?, NULL, ?, ?, ?, ?)
+                ''', (filename, writer.page_count, datetime.now(), cleaned, source_path))
+                doc_id = self.cursor.lastrowid
+                first_id = self._first_free_chunk_id(replaced_ids)
+                self.cursor.execute('''
+                INSERT INTO chunks (id, doc_id, ordinal, start_char, end_char, page, text, embedding, terms)
+                SELECT ? + ordinal, ?, ordinal, start_char, end_char, page, text, embedding, terms
+                FROM staged_chunks WHERE stage_id = ?
+                ''', (first_id, doc_id, writer.stage_id))
+                self.cursor.execute('''
+                INSERT INTO pdf_extract_parts (doc_id, ordinal, text)
+                SELECT ?, ordinal, text FROM staged_extract_parts WHERE stage_id = ?
+                ''', (doc_id, writer.stage_id))
+                self.cursor.execute('DELETE FROM staged_extracts WHERE id = ?', (writer.stage_id,))
+                self._set_next_chunk_id(first_id + writer.chunk_count)
+
+                self.conn.commit()
+                self.version += 1
+            except Exception:
+                self.conn.rollback()
+                self._discard_stage(writer.stage_id)
+                raise
+            self._index_document_chunks(doc_id, replaced_ids)
+
+    def _discard_stage(self, stage_id):
+        """
+        Delete a staged document and its staged batches.
+        """
+        with self.lock:
+            self.cursor.execute('DELETE FROM staged_extracts WHERE id = ?', (stage_id,))
+            self.conn.commit()
+
+    def _first_free_chunk_id(self, replaced_ids):
+        """
+        First id to assign to new chunks. Called with the lock held, inside a transaction.
+        """
+        first_id = max(self.cursor.execute('SELECT COALESCE(MAX(id), -1) + 1 FROM chunks').fetchone()[0],
+                       self.cursor.execute('SELECT COALESCE(MAX(next_id), 0) FROM chunk_id_sequence').fetchone()[0],
+                       max(replaced_ids, default=-1) + 1)
+        if self.faiss_manager:
+            first_id = max(first_id, self.faiss_manager.next_id)
+        return first_id
+
+    def _index_document_chunks(self, doc_id, replaced_ids, batch_size=10_000):
+        """
+        Add the stored chunks of a document to the FAISS and BM25 indexes, reading them from the
+        chunks table in batches. The first batch replaces the chunks of replaced_ids.
+        """
+        if not self.faiss_manager and self.bm25_index is None:
+            return
+        last_ordinal = -1
+        while True:
+            rows = self.cursor.execute(
+                'SELECT ordinal, id, text, embedding, terms FROM chunks WHERE doc_id = ? AND ordinal > ? ORDER BY ordinal LIMIT ?',
+                (doc_id, last_ordinal, batch_size)
+            ).fetchall()
+            if not rows and not replaced_ids:
+                return
+            ids = [row[1] for row in rows]
+            if self.faiss_manager:
+                vectors = (np.vstack([np.frombuffer(row[3], dtype=np.float32) for row in rows]) if rows
+                           else np.zeros((0, self.faiss_manager.dimension), dtype=np.float32))
+                self.faiss_manager.add_vectors(vectors, [row[2] for row in rows], ids=ids, replace_ids=replaced_ids)
+            if self.bm25_index is not None:
+                with_terms = [(row[1], row[4].split()) for row in rows if row[4] is not None]
+                self.bm25_index.add_documents([chunk_id for chunk_id, _ in with_terms], [terms for _, terms in with_terms],
+                                              replace_ids=replaced_ids)
+            if not rows:
+                return
+            replaced_ids = []
+            last_ordinal = rows[-1][0]
+
+    def delete_pdf_extracts(self, source_path, commit=True, remove_vectors=True):
+        """
+        Delete the extracts stored for a source file and remove their vectors from the FAISS index.
+
+        :param source_path: Path of the indexed PDF file
+        :param remove_vectors: Also remove the chunks from the FAISS and BM25 indexes
+        :return: Ids of the deleted chunks
+        """
+        with self.lock:
+            ids = [row[0] for row in self.cursor.execute('''
+            SELECT chunks.id FROM chunks JOIN pdf_extracts ON chunks.doc_id = pdf_extracts.id
+            WHERE pdf_extracts.source_path = ?
+            ''', (source_path,))]
+            self.cursor.execute('DELETE FROM pdf_extracts WHERE source_path = ?', (source_path,))
+            if commit:
+                self.conn.commit()
+                self.version += 1
+            if self.faiss_manager and remove_vectors:
+                self.faiss_manager.remove_ids(ids)
+            if self.bm25_index is not None and remove_vectors:
+                self.bm25_index.remove_ids(ids)
+        return ids
+
+    def get_chunk_ids(self, source_path):
+        """
+        :param source_path: Path of an indexed PDF file
+        :return: Ids of the chunks stored for the file
+        """
+        return [row[0] for row in self.cursor.execute('''
+        SELECT chunks.id FROM chunks JOIN pdf_extracts ON chunks.doc_id = pdf_extracts.id
+        WHERE pdf_extracts.source_path = ? ORDER BY chunks.id
+        ''', (source_path,))]
+
+    def reserve_chunk_ids(self, next_id):
+        """
+        Make sure chunks are assigned ids of at least next_id, e.g. the next id of a loaded FAISS index.
+        """
+        with self.lock:
+            self._set_next_chunk_id(next_id)
+            self.conn.commit()
+
+    def _set_next_chunk_id(self, next_id):
+        """
+        Raise the chunk id sequence to next_id. Called with the lock held, inside a transaction.
+        """
+        if self.cursor.execute('UPDATE chunk_id_sequence SET next_id = MAX(next_id, ?)', (next_id,)).rowcount == 0:
+            self.cursor.execute('INSERT INTO chunk_id_sequence (next_id) VALUES (?)', (next_id,))
 
     def get_pdf_extract(self, filename):
         self.cursor.execute('SELECT * FROM pdf_extracts WHERE filename = ?', (filename,))
         result = self.cursor.fetchone()
         if result:
-            # Convert the chunk embeddings back to a list of lists
+            # Replace the legacy JSON column with the chunk embeddings from the chunks table
             result = list(result)
-            result[6] = json.loads(result[6])
+            if result[2] is None:
+                # Text of a document written page window by page window
+                result[2] = ''.join(text for (text,) in self.cursor.execute(
+                    'SELECT text FROM pdf_extract_parts WHERE doc_id = ? ORDER BY ordinal', (result[0],)))
+            result[6] = [np.frombuffer(blob, dtype=np.float32) for (blob,) in self.cursor.execute(
+                'SELECT embedding FROM chunks WHERE doc_id = ? ORDER BY ordinal', (result[0],))]
         return result
 
+    def iter_chunk_embeddings(self, batch_size=10_000, dimension=None):
+        """
+        Iterate over all stored chunk vectors.
+
+        :param batch_size: Number of chunks loaded per batch
+        :param dimension: Only return vectors of this dimension, e.g. after the embedding dimension was changed
+        :return: Iterator of (ids, texts, vectors) batches, with vectors as a float32 matrix
+        """
+        last_id = -1
+        while True:
+            rows = self.cursor.execute(
+                'SELECT id, text, embedding FROM chunks WHERE id > ? AND (? IS NULL OR length(embedding) = ?) ORDER BY id LIMIT ?',
+                (last_id, dimension, dimension and dimension * 4, batch_size)
+            ).fetchall()
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            yield ([row[0] for row in rows], [row[1] for row in rows],
+                   np.vstack([np.frombuffer(row[2], dtype=np.float32) for row in rows]))
+
+    def iter_chunk_texts(self, batch_size=10_000):
+        """
+        Iterate over all stored chunk texts.
+
+        :param batch_size: Number of chunks loaded per batch
+        :return: Iterator of (ids, texts) batches
+        """
+        last_id = -1
+        while True:
+            rows = self.cursor.execute('SELECT id, text FROM chunks WHERE id > ? ORDER BY id LIMIT ?',
+                                       (last_id, batch_size)).fetchall()
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            yield [row[0] for row in rows], [row[1] for row in rows]
+
+    def count_chunks(self, dimension=None):
+        return self.cursor.execute('SELECT COUNT(*) FROM chunks WHERE ? IS NULL OR length(embedding) = ?',
+                                   (dimension, dimension and dimension * 4)).fetchone()[0]
+
+    def sample_chunk_embeddings(self, count, dimension=None):
+        """
+        Random sample of stored chunk vectors, e.g. for training an IVF index.
+
+        :param count: Maximum number of vectors to return
+        :param dimension: Only sample vectors of this dimension
+        :return: float32 matrix with one vector per row
+        """
+        rows = self.cursor.execute('SELECT embedding FROM chunks WHERE ? IS NULL OR length(embedding) = ? ORDER BY RANDOM() LIMIT ?',
+                                   (dimension, dimension and dimension * 4, count)).fetchall()
+        return np.vstack([np.frombuffer(row[0], dtype=np.float32) for row in rows])
+
+    def get_chunk_embeddings(self, ids):
+        """
+        Look up the full-precision chunk vectors by chunk id.
+
+        :param ids: List of chunk ids
+        :return: Dictionary mapping chunk id to float32 vector; unknown ids are left out
+        """
+        if not ids:
+            return {}
+        placeholders = ','.join('?' * len(ids))
+        rows = self.cursor.execute(f'SELECT id, embedding FROM chunks WHERE id IN ({placeholders})', list(ids)).fetchall()
+        return {chunk_id: np.frombuffer(blob, dtype=np.float32) for chunk_id, blob in rows}
+
+    def get_chunk_texts(self, ids):
+        """
+        Look up chunk texts by chunk id (which is also the FAISS vector id).
+
+        :param ids: List of chunk ids
+        :return: Dictionary mapping chunk id to chunk text; unknown ids are left out
+        """
+        if not ids:
+            return {}
+        placeholders = ','.join('?' * len(ids))
+        rows = self.cursor.execute(f'SELECT id, text FROM chunks WHERE id IN ({placeholders})', list(ids)).fetchall()
+        return dict(rows)
+
+    def get_chunk_terms(self, ids):
+        """
+        Look up the precomputed terms of chunks by chunk id.
+
+        :param ids: List of chunk ids
+        :return: Dictionary mapping chunk id to a list of terms, or None for chunks stored without terms
+        """
+        if not ids:
+            return {}
+        placeholders = ','.join('?' * len(ids))
+        rows = self.cursor.execute(f'SELECT id, terms FROM chunks WHERE id IN ({placeholders})', list(ids)).fetchall()
+        return {chunk_id: terms.split() if terms is not None else None for chunk_id, terms in rows}
+
+    def set_chunk_terms(self, chunk_terms):
+        """
+        Store terms for chunks that were indexed without them.
+
+        :param chunk_terms: Dictionary mapping chunk id to a list of terms
+        """
+        with self.lock:
+            self.cursor.executemany('UPDATE chunks SET terms = ? WHERE id = ?',
+                                    [(self._join_terms(terms), chunk_id) for chunk_id, terms in chunk_terms.items()])
+            self.conn.commit()
+
+    def _join_terms(self, terms):
+        return ' '.join(sorted(terms))
+
+    def get_documents(self):
+        """
+        Return the manifest of indexed files.
+
+        :return: Dictionary mapping source path to a dict with content_hash, params_hash, file_size and mtime
+        """
+        rows = self.cursor.execute('SELECT source_path, content_hash, params_hash, file_size, mtime FROM documents').fetchall()
+        return {row[0]: {'content_hash': row[1], 'params_hash': row[2], 'file_size': row[3], 'mtime': row[4]} for row in rows}
+
+    def find_documents(self, content_hash):
+        """
+        :param content_hash: SHA-256 of a file's content
+        :return: Source paths of the indexed files with this content
+        """
+        return [row[0] for row in self.cursor.execute('SELECT source_path FROM documents WHERE content_hash = ?', (content_hash,))]
+
+    def upsert_documents(self, documents):
+        """
+        Insert or update manifest entries.
+
+        :param documents: Iterable of (source_path, content_hash, params_hash, file_size, mtime) tuples
+        """
+        now = datetime.now()
+        with self.lock:
+            self.cursor.executemany('''
+            INSERT INTO documents (source_path, content_hash, params_hash, file_size, mtime, indexed_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(source_path) DO UPDATE SET
+                content_hash = excluded.content_hash,
+                params_hash = excluded.params_hash,
+                file_size = excluded.file_size,
+                mtime = excluded.mtime,
+                indexed_at = excluded.indexed_at
+            ''', [(*document, now) for document in documents])
+            self.conn.commit()
+
     def close(self):
-        self.conn.close()
+        with self.lock, self._connections_lock:
+            for conn in self._connections.values():
+                conn.close()
+            self._connections.clear()
+            self._local = threading.local()
 
     def set_faiss_manager(self, faiss_manager):
         self.faiss_manager = faiss_manager
+        # Chunk texts are served from the chunks table instead of being held by the index
+        faiss_manager.set_text_lookup(self.get_chunk_texts)
+        faiss_manager.set_vector_lookup(self.get_chunk_embeddings)
+
+    def set_bm25_index(self, bm25_index):
+        self.bm25_index = bm25_index
 
     def search_similar_chunks(self, query_vector, k=5):
         if not self.faiss_manager:
             raise ValueError("FAISS manager not set")
         return self.faiss_manager.search(query_vector, k)
+
+class PdfExtractWriter:
+    """
+    Stages the text and chunks of one PDF extract batch by batch for
+    DatabaseManager.pdf_extract_writer.
+    """
+
+    def __init__(self, db_manager, stage_id):
+        self.db_manager = db_manager
+        self.stage_id = stage_id
+        self.chunk_count = 0
+        self.page_count = 0
+        self.part_count = 0
+
+    def append(self, text, page_count, chunk_embeddings, chunks, chunk_offsets=None, chunk_pages=None, chunk_terms=None):
+        """
+        Store the next part of the extracted text and the next chunks. They are committed
+        before this returns, so the caller can release them.
+
+        :param text: Text to append to the extracted text
+        :param page_count: Number of pages in text
+        :param chunk_embeddings: One embedding per chunk (numpy arrays or lists of floats)
+        :param chunks: Chunk texts
+        :param chunk_offsets: Optional (start, end) character offsets of each chunk in the whole extracted text
+        :param chunk_pages: Optional page number of each chunk
+        :param chunk_terms: Optional lemmatized terms of each chunk (see TermExtractor)
+        """
+        if len(chunk_embeddings) != len(chunks):
+            raise ValueError(f"Mismatch in number of embeddings ({len(chunk_embeddings)}) and chunks ({len(chunks)})")
+        db_manager = self.db_manager
+        vectors = np.asarray(chunk_embeddings, dtype=np.float32).reshape(len(chunks), -1) if chunks else []
+        chunk_offsets = chunk_offsets or [(None, None)] * len(chunks)
+        chunk_pages = chunk_pages or [None] * len(chunks)
+        chunk_terms = [db_manager._join_terms(terms) for terms in chunk_terms] if chunk_terms else [None] * len(chunks)
+
+        with db_manager.lock:
+            try:
+                if text:
+                    db_manager.cursor.execute('INSERT INTO staged_extract_parts (stage_id, ordinal, text) VALUES (?, ?, ?)',
+                                              (self.stage_id, self.part_count, text))
+                db_manager.cursor.executemany('''
+                INSERT INTO staged_chunks (stage_id, ordinal, start_char, end_char, page, text, embedding, terms)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ''', [(self.stage_id, self.chunk_count + i, start, end, page, chunk, vector.tobytes(), terms)
+                      for i, (chunk, (start, end), page, vector, terms)
+                      in enumerate(zip(chunks, chunk_offsets, chunk_pages, vectors, chunk_terms))])
+                db_manager.conn.commit()
+            except Exception:
+                db_manager.conn.rollback()
+                raise
+        self.part_count += bool(text)
+        self.page_count += page_count
+        self.chunk_count += len(chunks)
@@ -0,0 +1,185 @@
+import hashlib
+import sqlite3
+import threading
+import time
+import numpy as np
+from lru_cache import LRUCache
+
+# SQLite limits the number of bound parameters per statement
+_SQL_BATCH_SIZE = 500
+
+def normalize_text(text):
+    """
+    Normalize text before hashing so whitespace-only differences share a cache entry.
+
+    :param text: Input text string
+    :return: Normalized text string
+    """
+    return ' '.join(text.split())
+
+class EmbeddingCache:
+    """
+    Persistent, content-addressed embedding cache.
+
+    Vectors are keyed by (model name, dimension, hash of the normalized text) and
+    stored as float32 BLOBs in SQLite, with an in-memory LRU in front of the table.
+    The table is bounded to max_entries rows; the least recently used rows are
+    evicted first. Access times of hits served from memory are buffered and written
+    to the table in batches, at the latest before rows are evicted, so keys that stay
+    hot in memory are not the first to go.
+    """
+
+    def __init__(self, db_path='embedding_cache.db', max_entries=1_000_000, memory_entries=10_000, touch_batch_size=1000, touch_interval=60.0):
+        """
+        :param touch_batch_size: Number of buffered memory hits that triggers writing their access times
+        :param touch_interval: Seconds after which buffered access times are written anyway
+        """
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.memory = LRUCache(memory_entries)
+        self.hits = 0
+        self.misses = 0
+        self.touch_batch_size = touch_batch_size
+        self.touch_interval = touch_interval
+        # Keys hit in memory since the last write, with their latest access time
+        self._touched = {}
+        self._touched_since = time.monotonic()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS embedding_cache (
+                key BLOB PRIMARY KEY,
+                vector BLOB NOT NULL,
+                last_access REAL NOT NULL
+            )
+            ''')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS idx_embedding_cache_last_access ON embedding_cache (last_access)')
+            self.conn.commit()
+            self._size = self.conn.execute('SELECT COUNT(*) FROM embedding_cache').fetchone()[0]
+
+    @staticmethod
+    def make_key(model_name, dimension, text):
+        """
+        Build the cache key for a text embedded with the given model and dimension.
+
+        :return: 32-byte SHA-256 digest
+        """
+        payload = f"{model_name}\0{dimension}\0{normalize_text(text)}"
+        return hashlib.sha256(payload.encode('utf-8')).digest()
+
+    def get_many(self, keys):
+        """
+        Look up several keys at once.
+
+        :param keys: List of cache keys
+        :return: List with a float32 numpy array for each hit and None for each miss
+        """
+        now = time.time()
+        results = [None] * len(keys)
+        pending = {}
+        memory_hits = []
+        for i, key in enumerate(keys):
+            vector = self.memory.get(key)
+            if vector is not None:
+                results[i] = vector
+                memory_hits.append(key)
+            else:
+                pending.setdefault(key, []).append(i)
+
+        if memory_hits:
+            with self.lock:
+                self._touched.update(dict.fromkeys(memory_hits, now))
+                if len(self._touched) >= self.touch_batch_size or time.monotonic() - self._touched_since >= self.touch_interval:
+                    self._write_touched()
+                    self.conn.commit()
+
+        if pending:
+            found = {}
+            pending_keys = list(pending)
+            with self.lock:
+                for start in range(0, len(pending_keys), _SQL_BATCH_SIZE):
+                    batch = pending_keys[start:start + _SQL_BATCH_SIZE]
+                    placeholders = ','.join('?' * len(batch))
+                    rows = self.conn.execute(
+                        f'SELECT key, vector FROM embedding_cache WHERE key IN ({placeholders})', batch
+                    ).fetchall()
+                    for key, blob in rows:
+                        found[bytes(key)] = np.frombuffer(blob, dtype=np.float32)
+                if found:
+                    self.conn.executemany('UPDATE embedding_cache SET last_access = ? WHERE key = ?',
+                                          [(now, key) for key in found])
+                    self.conn.commit()
+            for key, vector in found.items():
+                self.memory.put(key, vector)
+                for i in pending[key]:
+                    results[i] = vector
+
+        hits = sum(1 for vector in results if vector is not None)
+        with self.lock:
+            self.hits += hits
+            self.misses += len(keys) - hits
+        return results
+
+    def put_many(self, keys, vectors):
+        """
+        Store several vectors and evict the least recently used rows beyond max_entries.
+
+        :param keys: List of cache keys
+        :param vectors: List of vectors matching keys
+        """
+        now = time.time()
+        rows = []
+        for key, vector in zip(keys, vectors):
+            vector = np.asarray(vector, dtype=np.float32)
+            self.memory.put(key, vector)
+            rows.append((key, vector.tobytes(), now))
+        with self.lock:
+            before = self.conn.total_changes
+            self.conn.executemany('INSERT OR IGNORE INTO embedding_cache (key, vector, last_access) VALUES (?, ?, ?)', rows)
+            self._size += self.conn.total_changes - before
+            overflow = self._size - self.max_entries
+            if overflow > 0:
+                self._write_touched()
+                self.conn.execute('''
+                DELETE FROM embedding_cache WHERE key IN (
+                    SELECT key FROM embedding_cache ORDER BY last_access LIMIT ?
+                )
+                ''', (overflow,))
+                self._size -= overflow
+            self.conn.commit()
+
+    def _write_touched(self):
+        """
+        Write the buffered access times of memory hits to the table. Called with the lock held;
+        the caller commits.
+        """
+        if self._touched:
+            self.conn.executemany('UPDATE embedding_cache SET last_access = MAX(last_access, ?) WHERE key = ?',
+                                  [(last_access, key) for key, last_access in self._touched.items()])
+            self._touched.clear()
+        self._touched_since = time.monotonic()
+
+    def stats(self):
+        """
+        Return hit/miss counters for the persistent cache and its in-memory LRU.
+
+        :return: Dictionary of cache statistics
+        """
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': self._size,
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'memory': self.memory.stats()
+            }
+
+    def close(self):
+        with self.lock:
+            self._write_touched()
+            self.conn.commit()
+            self.conn.close()
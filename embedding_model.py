@@ -1,25 +1,83 @@
+import os
 import numpy as np
+from batch_embedder import BatchEmbedder
+from local_embedders import LOCAL_BACKENDS, create_local_embedder
 
 try:
     from openai import OpenAI
     OPENAI_AVAILABLE = True
 except ImportError:
     OPENAI_AVAILABLE = False
-    print("OpenAI module not found. Using fallback embedding method.")
+    print("OpenAI module not found. Using the local hashing embedder unless another backend is configured.")
+
+EMBEDDING_BACKENDS = ('openai', 'openrouter') + LOCAL_BACKENDS
+
+def supports_dimensions(model_name):
+    """
+    True if the model accepts a "dimensions" parameter (text-embedding-3 models, which are
+    trained so that a prefix of the embedding is itself a usable embedding).
+    """
+    return 'text-embedding-3' in model_name
+
+def truncate_embedding(embedding, dimensions):
+    """
+    Keep the first dimensions values of an embedding and re-normalize it to unit length.
+
+    :param embedding: Numpy array
+    :param dimensions: Number of dimensions to keep
+    :return: float32 numpy array
+    """
+    truncated = np.asarray(embedding[:dimensions], dtype=np.float32)
+    norm = np.linalg.norm(truncated)
+    return truncated / norm if norm else truncated
 
 class EmbeddingModel:
-    def __init__(self, model_name='text-embedding-3-small', use_openrouter=False):
+    def __init__(self, model_name='text-embedding-3-small', use_openrouter=False, cache=None, dimensions=None, backend=None):
+        """
+        :param model_name: Remote embedding model; local backends use their own model name
+        :param dimensions: Optional smaller embedding dimension. Of the remote models, only
+                           text-embedding-3 models support it (they return shortened embeddings
+                           directly); for other remote models a ValueError is raised, since cutting
+                           down embeddings of models not trained for it degrades retrieval.
+        :param backend: 'openai', 'openrouter', 'hashing' or 'sentence-transformers'. By default
+                        OpenRouter if use_openrouter is set, else OpenAI if the openai package is
+                        installed, else the local hashing embedder.
+        """
+        if backend is None:
+            backend = 'openrouter' if use_openrouter else 'openai' if OPENAI_AVAILABLE else 'hashing'
+        if backend not in EMBEDDING_BACKENDS:
+            raise ValueError(f"Unknown embedding backend {backend}; expected one of {', '.join(EMBEDDING_BACKENDS)}")
+        if dimensions and backend in ('openai', 'openrouter') and not supports_dimensions(model_name):
+            raise ValueError(f"Embedding model {model_name} does not support shortened embeddings; "
+                             "leave EMBEDDING_DIMENSIONS empty or use a text-embedding-3 model")
+        self.backend = backend
         self.model_name = model_name
-        self.use_openrouter = use_openrouter
-        if OPENAI_AVAILABLE and not use_openrouter:
-            self.client = OpenAI()
-        else:
-            # Fallback to a simple embedding method
-            self.dimension = 100
-        
-        if use_openrouter:
+        self.use_openrouter = backend == 'openrouter'
+        self.cache = cache
+        self.dimensions = dimensions
+        self.local_embedder = None
+        if backend == 'openai':
+            if not OPENAI_AVAILABLE:
+                raise ImportError("The openai embedding backend requires the openai package (pip install openai).")
+            # The openai client retries timeouts, connection errors, 429 and 5xx itself, honouring Retry-After
+            self.client = OpenAI(max_retries=int(os.getenv('EMBEDDING_MAX_RETRIES', 3)))
+        elif backend == 'openrouter':
             from openrouter_client import OpenRouterClient
+            # Retries transient errors itself (OPENROUTER_MAX_RETRIES)
             self.openrouter_client = OpenRouterClient()
+        else:
+            self.local_embedder = create_local_embedder(backend, dimensions)
+            # Cache keys and the FAISS index metadata refer to the model that actually embeds
+            self.model_name = self.local_embedder.model_name
+
+        # Failed requests are retried by the API clients, so batches are not retried on top of that
+        self.batch_embedder = BatchEmbedder(
+            self._embed_batch,
+            max_batch_tokens=int(os.getenv('EMBEDDING_BATCH_TOKENS', 50_000)),
+            max_batch_items=int(os.getenv('EMBEDDING_BATCH_SIZE', 256)),
+            max_concurrency=int(os.getenv('EMBEDDING_CONCURRENCY', 4)),
+            max_retries=0
+        )
 
     def get_embedding(self, text):
         """
@@ -28,27 +86,66 @@ class EmbeddingModel:
         :param text: Input text string
         :return: Numpy array representing the embedding
         """
-        text = text.replace("\n", " ")
-        if OPENAI_AVAILABLE and not self.use_openrouter:
-            return np.array(self.client.embeddings.create(input=[text], model=self.model_name).data[0].embedding)
-        elif self.use_openrouter:
-            return np.array(self.openrouter_client.generate_embedding(text, model=self.model_name))
-        else:
-            return self._fallback_embedding(text)
+        return self.get_embeddings([text])[0]
 
     def get_embeddings(self, texts):
         """
         Generate embeddings for a list of texts.
+
+        Cached embeddings are looked up in bulk and only the misses are sent to the API.
         
         :param texts: List of input text strings
         :return: List of numpy arrays representing the embeddings
         """
         texts = [text.replace("\n", " ") for text in texts]
-        if OPENAI_AVAILABLE:
-            embeddings = self.client.embeddings.create(input=texts, model=self.model_name).data
-            return [np.array(embedding.embedding) for embedding in embeddings]
+        if self.cache is None:
+            return self._embed_texts(texts)
+
+        dimension = self.get_embedding_dimension()
+        keys = [self.cache.make_key(self.model_name, dimension, text) for text in texts]
+        embeddings = self.cache.get_many(keys)
+
+        # Embed each distinct missing key once, even if it appears several times in the batch
+        missing = {}
+        for i, embedding in enumerate(embeddings):
+            if embedding is None:
+                missing.setdefault(keys[i], i)
+        if missing:
+            new_embeddings = self._embed_texts([texts[i] for i in missing.values()])
+            self.cache.put_many(list(missing), new_embeddings)
+            by_key = dict(zip(missing, new_embeddings))
+            embeddings = [by_key[key] if embedding is None else embedding for key, embedding in zip(keys, embeddings)]
+        return embeddings
+
+    def _embed_texts(self, texts):
+        """
+        Embed texts with the configured backend, bypassing the cache.
+
+        Remote backends are called through the batch embedder, which splits the
+        texts into token-bounded batches and sends them concurrently; local backends
+        embed all texts as one matrix.
+
+        :param texts: List of input text strings
+        :return: List of float32 numpy arrays
+        """
+        if self.local_embedder is not None:
+            return list(self.local_embedder.embed(texts))
+        return self.batch_embedder.embed(texts)
+
+    def _embed_batch(self, texts):
+        """
+        Send one batch of texts to the remote embedding API.
+
+        :param texts: List of input text strings
+        :return: List of float32 numpy arrays
+        """
+        dimension = self.get_embedding_dimension()
+        if self.use_openrouter:
+            embeddings = self.openrouter_client.generate_embeddings(texts, model=self.model_name, dimensions=dimension)
         else:
-            return [self._fallback_embedding(text) for text in texts]
+            kwargs = {'dimensions': self.dimensions} if self.dimensions else {}
+            embeddings = [embedding.embedding for embedding in self.client.embeddings.create(input=texts, model=self.model_name, **kwargs).data]
+        return [np.array(embedding, dtype=np.float32) for embedding in embeddings]
 
     def cosine_similarity(self, embedding1, embedding2):
         """
@@ -66,21 +163,8 @@ class EmbeddingModel:
         
         :return: Integer representing the embedding dimension
         """
-        if OPENAI_AVAILABLE:
-            return 1536  # OpenAI's text-embedding-3-small model produces 1536-dimensional embeddings
-        else:
-            return self.dimension
-
-    def _fallback_embedding(self, text):
-        """
-        A simple fallback method to generate embeddings when OpenAI is not available.
-        
-        :param text: Input text string
-        :return: Numpy array representing the embedding
-        """
-        # This is a very simplistic embedding method and should be replaced with a more sophisticated one
-        words = text.lower().split()
-        embedding = np.zeros(self.dimension)
-        for i, word in enumerate(words[:self.dimension]):
-            embedding[i] = hash(word) % 100  # Using hash for simplicity
-        return embedding / np.linalg.norm(embedding)
+        if self.local_embedder is not None:
+            return self.local_embedder.dimension
+        if self.dimensions:
+            return self.dimensions
+        return 1536  # OpenAI's text-embedding-3-small model produces 1536-dimensional embeddings
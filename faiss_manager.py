@@ -1,34 +1,679 @@
 import faiss
+import itertools
+import json
+import logging
+import os
+import threading
+import time
 import numpy as np
 
+# Version of the on-disk index bundle written by save_index
+INDEX_FORMAT_VERSION = 3
+
+INDEX_TYPES = ('flat', 'ivf_flat', 'hnsw', 'ivf_pq')
+
+# How vectors are encoded in flat, IVF-Flat and HNSW indexes: full precision, float16,
+# 8-bit scalar quantization or product quantization
+STORAGE_TYPES = ('float32', 'fp16', 'sq8', 'pq')
+
+# Vector counts at which index_type 'auto' switches from exact search to IVF-Flat and to IVF-PQ
+AUTO_IVF_THRESHOLD = 50_000
+AUTO_IVF_PQ_THRESHOLD = 2_000_000
+
+# Identifies base indexes, so unchanged ones are not written again on save
+_base_generations = itertools.count()
+
+# FAISS asks for at least this many training points per k-means centroid
+TRAINING_POINTS_PER_CENTROID = 39
+
+def choose_index_type(ntotal, index_type='auto'):
+    """
+    Pick the index type for a corpus of ntotal vectors.
+
+    'auto' uses exact search for small corpora, IVF-Flat for medium ones and IVF-PQ
+    for very large ones. A trained type is only used once there are enough vectors to
+    train it; below that the exact flat index is used.
+
+    :param ntotal: Number of vectors to index
+    :param index_type: 'auto' or one of INDEX_TYPES
+    :return: One of INDEX_TYPES
+    """
+    if index_type == 'auto':
+        if ntotal < AUTO_IVF_THRESHOLD:
+            return 'flat'
+        return 'ivf_flat' if ntotal < AUTO_IVF_PQ_THRESHOLD else 'ivf_pq'
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type {index_type}; expected 'auto' or one of {', '.join(INDEX_TYPES)}")
+    if ntotal < min_training_size(index_type, ntotal):
+        return 'flat'
+    return index_type
+
+def ivf_nlist(ntotal):
+    """
+    Number of IVF lists for a corpus of ntotal vectors (about 4 * sqrt(ntotal)).
+    """
+    return max(1, min(65_536, int(4 * np.sqrt(max(ntotal, 1)))))
+
+def pq_subquantizers(dimension):
+    """
+    Number of PQ sub-quantizers for the dimension: the largest of the common sizes that
+    divides it with at least four dimensions per sub-vector.
+    """
+    for m in (64, 48, 32, 24, 16, 12, 8, 4, 2):
+        if dimension % m == 0 and dimension // m >= 4:
+            return m
+    return 1
+
+def min_training_size(index_type, ntotal, storage='float32'):
+    """
+    Minimum number of training vectors for an index type and storage built for ntotal vectors.
+    """
+    size = storage_training_size(storage)
+    if index_type == 'ivf_flat':
+        size = max(size, ivf_nlist(ntotal) * TRAINING_POINTS_PER_CENTROID)
+    if index_type == 'ivf_pq':
+        size = max(size, max(ivf_nlist(ntotal), 256) * TRAINING_POINTS_PER_CENTROID)
+    return size
+
+def storage_training_size(storage):
+    """
+    Minimum number of training vectors for a vector storage type.
+    """
+    if storage not in STORAGE_TYPES:
+        raise ValueError(f"Unknown vector storage {storage}; expected one of {', '.join(STORAGE_TYPES)}")
+    if storage == 'sq8':
+        return 1_000  # Only per-dimension value ranges are learned
+    if storage == 'pq':
+        return 256 * TRAINING_POINTS_PER_CENTROID
+    return 0
+
+def choose_storage(ntotal, storage='float32'):
+    """
+    Vector storage to use for ntotal vectors: the configured one once there are enough
+    vectors to train it, full precision before that.
+    """
+    return storage if ntotal >= storage_training_size(storage) else 'float32'
+
+def _codec(storage, dimension):
+    return {
+        'float32': 'Flat',
+        'fp16': 'SQfp16',
+        'sq8': 'SQ8',
+        'pq': f'PQ{pq_subquantizers(dimension)}x8'
+    }[storage]
+
+def build_index(index_type, dimension, ntotal=0, storage='float32'):
+    """
+    Create an empty, untrained FAISS index with explicit vector ids.
+
+    :param index_type: One of INDEX_TYPES
+    :param dimension: Vector dimension
+    :param ntotal: Expected number of vectors, used to size the IVF lists
+    :param storage: One of STORAGE_TYPES; ignored for ivf_pq, which always stores PQ codes
+    :return: faiss.IndexIDMap2 wrapping the requested index
+    """
+    if storage not in STORAGE_TYPES:
+        raise ValueError(f"Unknown vector storage {storage}; expected one of {', '.join(STORAGE_TYPES)}")
+    codec = _codec(storage, dimension)
+    if index_type == 'flat':
+        factory = codec
+    elif index_type == 'ivf_flat':
+        factory = f'IVF{ivf_nlist(ntotal)},{codec}'
+    elif index_type == 'hnsw':
+        factory = 'HNSW32' if storage == 'float32' else f'HNSW32,{codec}'
+    elif index_type == 'ivf_pq':
+        factory = f'IVF{ivf_nlist(ntotal)},PQ{pq_subquantizers(dimension)}x8'
+    else:
+        raise ValueError(f"Unknown index type {index_type}; expected one of {', '.join(INDEX_TYPES)}")
+    return faiss.IndexIDMap2(faiss.index_factory(dimension, factory))
+
+def set_search_params(index, nprobe=None, ef_search=None):
+    """
+    Set the query-time accuracy/speed parameters of an index.
+
+    :param nprobe: Number of IVF lists visited per query (IVF indexes)
+    :param ef_search: Size of the HNSW candidate list per query (HNSW indexes)
+    """
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap2) else index
+    if nprobe is not None and isinstance(inner, faiss.IndexIVF):
+        inner.nprobe = min(nprobe, inner.nlist)
+    if ef_search is not None and isinstance(inner, faiss.IndexHNSW):
+        inner.hnsw.efSearch = ef_search
+
+def search_parameters(index, selector=None, nprobe=None, ef_search=None):
+    """
+    Per-query search parameters for an index built by build_index.
+
+    FAISS temporarily modifies the parameters object during a search, so a new one is
+    needed for every call; the selector itself can be shared.
+
+    :param selector: Optional faiss.IDSelector restricting the searched ids
+    :return: faiss.SearchParameters, or None if the defaults apply
+    """
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap2) else index
+    if isinstance(inner, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(sel=selector, nprobe=min(nprobe or inner.nprobe, inner.nlist))
+    if isinstance(inner, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=ef_search or inner.hnsw.efSearch)
+    if selector is not None:
+        return faiss.SearchParameters(sel=selector)
+    return None
+
+def index_type_of(index):
+    """
+    Name in INDEX_TYPES of a FAISS index built by build_index.
+    """
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap2) else index
+    if isinstance(inner, faiss.IndexHNSW):
+        return 'hnsw'
+    if isinstance(inner, faiss.IndexIVFPQ):
+        return 'ivf_pq'
+    if isinstance(inner, faiss.IndexIVF):
+        return 'ivf_flat'
+    return 'flat'
+
+class IndexSnapshot:
+    """
+    Immutable state of the index that searches run against.
+
+    base is the index built by the last rebuild, deltas are small exact indexes with the
+    vectors added since, and tombstones are ids removed since. Writers never modify a
+    published snapshot; they build a new one and swap it in, so searches need no lock.
+    """
+
+    def __init__(self, base, deltas=(), tombstones=frozenset(), index_type='flat', storage='float32', generation=None):
+        self.base = base
+        self.generation = next(_base_generations) if generation is None else generation
+        self.deltas = tuple(deltas)
+        self.tombstones = frozenset(tombstones)
+        self.index_type = index_type
+        self.storage = storage
+        self._tombstone_ids = np.fromiter(self.tombstones, dtype='int64', count=len(self.tombstones))
+        self.selector = faiss.IDSelectorNot(faiss.IDSelectorBatch(self._tombstone_ids)) if self.tombstones else None
+
+    @property
+    def ntotal(self):
+        """
+        Number of live vectors.
+        """
+        return self.base.ntotal + self.delta_ntotal - len(self.tombstones)
+
+    @property
+    def delta_ntotal(self):
+        return sum(delta.ntotal for delta in self.deltas)
+
+    @property
+    def lossy(self):
+        """
+        True if the base index stores compressed vectors, so its distances are approximate.
+        """
+        return self.storage != 'float32' or self.index_type == 'ivf_pq'
+
+    def replace(self, **changes):
+        state = {'base': self.base, 'deltas': self.deltas, 'tombstones': self.tombstones,
+                 'index_type': self.index_type, 'storage': self.storage, 'generation': self.generation}
+        state.update(changes)
+        return IndexSnapshot(**state)
+
+    def search(self, queries, k, nprobe=None, ef_search=None):
+        """
+        Search the base and delta indexes and merge their results.
+
+        :param queries: float32 matrix with one query vector per row
+        :return: Tuple of (distances, ids) matrices of shape (len(queries), k); missing results have id -1
+        """
+        results = [index.search(queries, k, params=search_parameters(index, self.selector, nprobe, ef_search))
+                   for index in (self.base,) + self.deltas if index.ntotal]
+        if not results:
+            return np.full((len(queries), k), np.inf, dtype='float32'), np.full((len(queries), k), -1, dtype='int64')
+        if len(results) == 1:
+            return results[0]
+        distances = np.hstack([result[0] for result in results])
+        ids = np.hstack([result[1] for result in results])
+        order = np.argsort(distances, axis=1, kind='stable')[:, :k]
+        return np.take_along_axis(distances, order, axis=1), np.take_along_axis(ids, order, axis=1)
+
+def merge_flat_indexes(dimension, indexes):
+    """
+    Copy the vectors of several flat ID-mapped indexes into one.
+    """
+    merged = build_index('flat', dimension)
+    for index in indexes:
+        if index.ntotal:
+            merged.add_with_ids(faiss.downcast_index(index.index).reconstruct_n(0, index.ntotal), faiss.vector_to_array(index.id_map))
+    return merged
+
 class FAISSManager:
-    def __init__(self, dimension):
+    """
+    FAISS index of chunk vectors.
+
+    Vector ids are chunk ids from the database. Chunk texts are resolved through
+    text_lookup (set by DatabaseManager.set_faiss_manager) so they are not held in
+    memory; without a lookup, texts passed to add_vectors are kept in id_to_text.
+
+    Searches run lock-free against the current IndexSnapshot. Writers are serialized by
+    self.lock: added vectors go into a new small delta index, removed ids become
+    tombstones, and the new snapshot is swapped in with a single assignment. Delta
+    indexes are merged as they grow (each vector is copied O(log n) times); rebuild()
+    folds everything into a new base index on the side.
+
+    An index is saved as a bundle: the base index file, "<file>.delta" with the delta
+    vectors and a "<file>.meta.json" with the format version, dimension, embedding
+    model, id space and tombstones.
+
+    index_type selects the base index structure ('auto' or one of INDEX_TYPES). The index
+    starts out as an exact flat index; rebuild() switches to the type that
+    target_index_type() picks for the corpus size.
+
+    storage selects how base vectors are encoded (one of STORAGE_TYPES) and also takes effect
+    on rebuild(). With lossy storage, search() fetches rescore_factor * k candidates and
+    re-ranks them by exact distance to the full-precision vectors from vector_lookup.
+    """
+
+    def __init__(self, dimension, model_name=None, index_type='flat', nprobe=16, ef_search=64, storage='float32', rescore_factor=4):
         self.dimension = dimension
-        self.index = faiss.IndexFlatL2(dimension)  # Create a CPU index
+        self.model_name = model_name
+        self.configured_index_type = index_type
+        self.configured_storage = storage
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        self.rescore_factor = rescore_factor
+        # Vectors get explicit, stable ids so a document's vectors can be removed and replaced
+        self.snapshot = IndexSnapshot(build_index('flat', dimension))  # Create a CPU index
+        self.id_to_text = {}
+        self.text_lookup = None
+        self.vector_lookup = None
+        self.next_id = 0
+        self.lock = threading.RLock()
+        # Writes made while a rebuild is running, replayed onto the rebuilt index
+        self._pending = None
+        self._saved_base = None
+
+    def set_text_lookup(self, text_lookup):
+        """
+        :param text_lookup: Callable taking a list of ids and returning a dict of id to chunk text
+        """
+        self.text_lookup = text_lookup
         self.id_to_text = {}
 
-    def add_vectors(self, vectors, texts):
+    def set_vector_lookup(self, vector_lookup):
+        """
+        :param vector_lookup: Callable taking a list of ids and returning a dict of id to float32 vector, used for re-scoring
+        """
+        self.vector_lookup = vector_lookup
+
+    @property
+    def index(self):
+        """
+        Base FAISS index of the current snapshot.
+        """
+        return self.snapshot.base
+
+    @property
+    def index_type(self):
+        return self.snapshot.index_type
+
+    @property
+    def storage(self):
+        return self.snapshot.storage
+
+    @property
+    def tombstones(self):
+        return self.snapshot.tombstones
+
+    @property
+    def lossy(self):
+        return self.snapshot.lossy
+
+    @property
+    def ntotal(self):
+        """
+        Number of live vectors in the index.
+        """
+        return self.snapshot.ntotal
+
+    def add_vectors(self, vectors, texts, ids=None, replace_ids=None):
+        """
+        Add vectors and their texts to the index.
+
+        :param ids: Optional vector ids (e.g. chunk ids from the database); assigned sequentially if omitted
+        :param replace_ids: Optional ids to remove in the same snapshot swap, so searches never see
+                            a document with both or neither of its old and new vectors
+        :return: List of the ids assigned to the vectors
+        """
         if len(vectors) != len(texts):
             raise ValueError("Number of vectors and texts must be the same")
-        
-        start_id = len(self.id_to_text)
-        vectors = np.array(vectors).astype('float32')
-        self.index.add(vectors)
-        
-        for i, text in enumerate(texts):
-            self.id_to_text[start_id + i] = text
+
+        # No copy when the vectors already are a contiguous float32 matrix
+        vectors = np.ascontiguousarray(vectors, dtype='float32').reshape(len(texts), self.dimension)
+        with self.lock:
+            if ids is None:
+                ids = np.arange(self.next_id, self.next_id + len(texts), dtype='int64')
+            else:
+                ids = np.asarray(ids, dtype='int64')
+            delta = build_index('flat', self.dimension)
+            delta.add_with_ids(vectors, ids)
+            if len(ids):
+                self.next_id = max(self.next_id, int(ids.max()) + 1)
+
+            if self.text_lookup is None:
+                for vector_id, text in zip(ids.tolist(), texts):
+                    self.id_to_text[vector_id] = text
+            self._apply(delta if len(ids) else None, replace_ids or ())
+        return ids.tolist()
+
+    def remove_ids(self, ids):
+        """
+        Remove vectors from the index.
+
+        The vectors are tombstoned and excluded from searches; they are dropped physically
+        on the next rebuild.
+
+        :param ids: Ids returned by add_vectors
+        :return: Number of removed vectors
+        """
+        if not ids:
+            return 0
+        with self.lock:
+            self._apply(None, ids)
+        return len(ids)
+
+    def contains(self, ids):
+        """
+        Tell which ids have a live vector in the index.
+
+        :param ids: List of vector ids
+        :return: Boolean numpy array aligned with ids
+        """
+        snapshot = self.snapshot
+        ids = np.asarray(ids, dtype='int64')
+        found = np.zeros(len(ids), dtype=bool)
+        for index in (snapshot.base,) + snapshot.deltas:
+            if index.ntotal:
+                found |= np.isin(ids, faiss.vector_to_array(index.id_map))
+        return found & ~np.isin(ids, snapshot._tombstone_ids)
+
+    def _apply(self, delta, removed_ids):
+        """
+        Publish a snapshot with a new delta index and/or additional tombstones.
+        """
+        for vector_id in removed_ids:
+            self.id_to_text.pop(vector_id, None)
+        if self._pending is not None:
+            self._pending.append((delta, tuple(removed_ids)))
+        snapshot = self.snapshot
+        deltas = list(snapshot.deltas)
+        if delta is not None:
+            deltas.append(delta)
+            # Merge deltas of similar size, like a binary counter, to keep their number logarithmic
+            while len(deltas) > 1 and deltas[-2].ntotal <= 2 * deltas[-1].ntotal:
+                deltas[-2:] = [merge_flat_indexes(self.dimension, deltas[-2:])]
+        tombstones = snapshot.tombstones.union(removed_ids) if removed_ids else snapshot.tombstones
+        self.snapshot = snapshot.replace(deltas=deltas, tombstones=tombstones)
+
+    def target_index_type(self, ntotal=None):
+        """
+        Index type the configured index_type resolves to for ntotal vectors (default: the current count).
+        """
+        return choose_index_type(self.ntotal if ntotal is None else ntotal, self.configured_index_type)
+
+    def target_storage(self, ntotal=None):
+        """
+        Vector storage the configured storage resolves to for ntotal vectors (default: the current count).
+        """
+        return choose_storage(self.ntotal if ntotal is None else ntotal, self.configured_storage)
+
+    def needs_rebuild(self):
+        """
+        True if the corpus size calls for a different index type or storage, or many vectors
+        are tombstoned or held in delta indexes.
+        """
+        snapshot = self.snapshot
+        indexed = snapshot.base.ntotal + snapshot.delta_ntotal
+        return (snapshot.index_type != self.target_index_type() or snapshot.storage != self.target_storage()
+                or len(snapshot.tombstones) > 0.1 * max(indexed, 1)
+                or snapshot.delta_ntotal > max(0.1 * snapshot.base.ntotal, 10_000))
+
+    def reset(self, index_type='flat', training_vectors=None, ntotal=0, storage='float32'):
+        """
+        Remove all vectors from the index and start a new one of the given type.
+
+        :param index_type: One of INDEX_TYPES
+        :param training_vectors: Sample of vectors to train IVF and quantized indexes on
+        :param ntotal: Expected number of vectors, used to size the IVF lists
+        :param storage: One of STORAGE_TYPES
+        """
+        index = build_index(index_type, self.dimension, ntotal, storage)
+        if not index.is_trained:
+            if training_vectors is None or len(training_vectors) == 0:
+                raise ValueError(f"Index type {index_type} needs training vectors")
+            index.train(np.ascontiguousarray(training_vectors, dtype='float32'))
+        with self.lock:
+            self.snapshot = IndexSnapshot(index, index_type=index_type, storage=storage)
+            self.id_to_text = {}
+            self.next_id = 0
+
+    def rebuild(self, batches, ntotal, sample_vectors=None):
+        """
+        Build a new base index of the target type for ntotal vectors and swap it in.
+
+        The new index is built on the side, so searches keep using the current snapshot until
+        it is ready. Vectors added and removed in the meantime are applied to the new index
+        before the swap.
+
+        :param batches: Iterable of (ids, texts, vectors) batches with all vectors to index
+        :param ntotal: Number of vectors in batches
+        :param sample_vectors: Callable taking a count and returning up to that many random vectors for training
+        """
+        with self.lock:
+            if self._pending is not None:
+                raise RuntimeError("A rebuild of this index is already running")
+            self._pending = []
+        try:
+            index_type = self.target_index_type(ntotal)
+            storage = self.target_storage(ntotal)
+            index = build_index(index_type, self.dimension, ntotal, storage)
+            if not index.is_trained:
+                training_vectors = sample_vectors(max(min_training_size(index_type, ntotal, storage), 10_000))
+                index.train(np.ascontiguousarray(training_vectors, dtype='float32'))
+
+            id_to_text = {}
+            next_id = 0
+            for ids, texts, vectors in batches:
+                ids = np.asarray(ids, dtype='int64')
+                index.add_with_ids(np.ascontiguousarray(vectors, dtype='float32'), ids)
+                if len(ids):
+                    next_id = max(next_id, int(ids.max()) + 1)
+                if self.text_lookup is None:
+                    id_to_text.update(zip(ids.tolist(), texts))
+        except Exception:
+            with self.lock:
+                self._pending = None
+            raise
+
+        with self.lock:
+            pending, self._pending = self._pending, None
+            base_ids = faiss.vector_to_array(index.id_map)
+            snapshot = IndexSnapshot(index, index_type=index_type, storage=storage)
+            self.snapshot = snapshot
+            self.id_to_text.update(id_to_text)
+            self.next_id = max(self.next_id, next_id)
+            # Replay the writes the scan may have missed; vectors it already found are skipped,
+            # and only ids that are actually indexed are tombstoned
+            replayed_ids = set()
+            for delta, removed_ids in pending:
+                if delta is not None:
+                    delta_ids = faiss.vector_to_array(delta.id_map)
+                    missing = ~np.isin(delta_ids, base_ids)
+                    if not missing.all():
+                        vectors = faiss.downcast_index(delta.index).reconstruct_n(0, delta.ntotal)
+                        delta = build_index('flat', self.dimension)
+                        delta.add_with_ids(vectors[missing], delta_ids[missing])
+                    replayed_ids.update(delta_ids[missing].tolist())
+                removed_ids = np.asarray(removed_ids, dtype='int64')
+                removed_ids = removed_ids[np.isin(removed_ids, base_ids)].tolist() + \
+                              [vector_id for vector_id in removed_ids.tolist() if vector_id in replayed_ids]
+                self._apply(delta if delta is not None and delta.ntotal else None, removed_ids)
+        logging.info(f"Built {index_type} FAISS index with {storage} storage and {ntotal} vectors.")
+
+    def set_search_params(self, nprobe=None, ef_search=None):
+        """
+        Change the query-time parameters (IVF nprobe, HNSW efSearch) used by later searches.
+        """
+        self.nprobe = nprobe if nprobe is not None else self.nprobe
+        self.ef_search = ef_search if ef_search is not None else self.ef_search
 
     def search(self, query_vector, k=5):
-        query_vector = np.array([query_vector]).astype('float32')
-        distances, indices = self.index.search(query_vector, k)
-        results = []
-        for i, idx in enumerate(indices[0]):
-            if idx != -1:  # -1 indicates no match found
-                results.append((self.id_to_text[idx], distances[0][i]))
-        return results
+        return self.search_batch([query_vector], k)[0]
+
+    def search_batch(self, query_vectors, k=5, with_ids=False):
+        """
+        Search several query vectors with one FAISS call.
+
+        Re-scoring and text lookups are done once for the candidates of all queries.
+
+        :param query_vectors: Query vectors (a list of vectors or a matrix with one query per row)
+        :param k: Number of results per query
+        :param with_ids: Return (id, text, distance) tuples instead of (text, distance)
+        :return: One list of (text, distance) tuples per query
+        """
+        queries = np.ascontiguousarray(query_vectors, dtype='float32').reshape(-1, self.dimension)
+        snapshot = self.snapshot
+        rescore = snapshot.lossy and self.vector_lookup is not None and self.rescore_factor > 1
+        candidates = k * self.rescore_factor if rescore else k
+        distances, indices = snapshot.search(queries, candidates, self.nprobe, self.ef_search)
+        if rescore:
+            distances, indices = self._rescore(queries, distances, indices)
+        distances, indices = distances[:, :k], indices[:, :k]
+        texts = self._lookup_texts(np.unique(indices[indices != -1]).tolist())
+        # -1 indicates no match found
+        return [[(idx, texts[idx], distance) if with_ids else (texts[idx], distance)
+                 for idx, distance in zip(row_ids.tolist(), row_distances) if idx in texts]
+                for row_ids, row_distances in zip(indices, distances)]
+
+    def _rescore(self, queries, distances, indices):
+        """
+        Re-rank candidates by exact squared L2 distance to their full-precision vectors.
+
+        Candidates without a stored vector keep their approximate distance.
+        """
+        candidate_ids = np.unique(indices[indices != -1])
+        vectors = self.vector_lookup(candidate_ids.tolist())
+        if not vectors:
+            return distances, indices
+        known = np.array([idx in vectors for idx in candidate_ids.tolist()], dtype=bool)
+        matrix = np.vstack([vectors[idx] for idx in candidate_ids[known].tolist()])
+        positions = np.searchsorted(candidate_ids, np.where(indices == -1, candidate_ids[0], indices))
+        has_vector = (indices != -1) & known[positions]
+        rows = np.where(known, np.cumsum(known) - 1, 0)[positions]
+        exact = np.empty(indices.shape, dtype='float32')
+        for start in range(0, len(queries), 256):  # Bounds the (queries, candidates, dimension) temporary
+            block = slice(start, start + 256)
+            exact[block] = ((matrix[rows[block]] - queries[block, None, :]) ** 2).sum(axis=2)
+        distances = np.where(has_vector, exact, np.where(indices == -1, np.inf, distances)).astype('float32')
+        order = np.argsort(distances, axis=1, kind='stable')
+        return np.take_along_axis(distances, order, axis=1), np.take_along_axis(indices, order, axis=1)
+
+    def _lookup_texts(self, ids):
+        if self.text_lookup is not None:
+            return self.text_lookup(ids)
+        return {idx: self.id_to_text[idx] for idx in ids if idx in self.id_to_text}
 
     def save_index(self, filename):
-        faiss.write_index(self.index, filename)
+        """
+        Write the index bundle. Files are replaced atomically, so processes that
+        memory-mapped the previous version keep a consistent view of it. The base index
+        is only rewritten if it changed since it was last saved to or loaded from filename.
+        """
+        with self.lock:
+            snapshot = self.snapshot
+            next_id = self.next_id
+        replacements = []
+        if self._saved_base != (filename, snapshot.generation) or not os.path.exists(filename):
+            faiss.write_index(snapshot.base, f"{filename}.tmp")
+            replacements.append((f"{filename}.tmp", filename))
+        delta_filename = self._delta_filename(filename)
+        if snapshot.deltas:
+            faiss.write_index(merge_flat_indexes(self.dimension, snapshot.deltas), f"{delta_filename}.tmp")
+            replacements.append((f"{delta_filename}.tmp", delta_filename))
+        metadata = {
+            'format_version': INDEX_FORMAT_VERSION,
+            'dimension': self.dimension,
+            'model_name': self.model_name,
+            'index_type': snapshot.index_type,
+            'storage': snapshot.storage,
+            'tombstones': sorted(snapshot.tombstones),
+            'ntotal': int(snapshot.ntotal),
+            'delta': bool(snapshot.deltas),
+            'next_id': next_id,
+            'id_space': 'chunks.id',
+            'saved_at': time.time()
+        }
+        meta_filename = self.metadata_filename(filename)
+        with open(f"{meta_filename}.tmp", 'w', encoding='utf-8') as f:
+            json.dump(metadata, f)
+        replacements.append((f"{meta_filename}.tmp", meta_filename))
+        for tmp_filename, target in replacements:
+            os.replace(tmp_filename, target)
+        if not snapshot.deltas and os.path.exists(delta_filename):
+            os.remove(delta_filename)
+        self._saved_base = (filename, snapshot.generation)
+
+    def load_index(self, filename, mmap=True):
+        """
+        Load an index bundle.
+
+        With mmap=True the base vectors are memory-mapped instead of copied into RAM where the
+        index type allows it, so cold starts are fast and processes on one host share the
+        page cache. The base index is never modified, so it can stay mapped.
+        """
+        metadata = {}
+        meta_filename = self.metadata_filename(filename)
+        if os.path.exists(meta_filename):
+            with open(meta_filename, 'r', encoding='utf-8') as f:
+                metadata = json.load(f)
+            if metadata.get('format_version', 0) > INDEX_FORMAT_VERSION:
+                raise ValueError(f"Index format version {metadata['format_version']} is newer than supported version {INDEX_FORMAT_VERSION}")
+            if self.model_name and metadata.get('model_name') and metadata['model_name'] != self.model_name:
+                raise ValueError(f"Index was built with embedding model {metadata['model_name']}, not {self.model_name}")
+
+        index = self._read_index(filename, mmap)
+        if index.d != self.dimension:
+            raise ValueError(f"Index dimension {index.d} does not match embedding dimension {self.dimension}")
+        if not isinstance(index, faiss.IndexIDMap2):
+            # Indexes written before vectors had explicit ids use their position as id
+            vectors = index.reconstruct_n(0, index.ntotal) if index.ntotal else np.zeros((0, self.dimension), dtype='float32')
+            index = build_index('flat', self.dimension)
+            index.add_with_ids(vectors, np.arange(len(vectors), dtype='int64'))
+        deltas = []
+        if metadata.get('delta') and os.path.exists(self._delta_filename(filename)):
+            deltas.append(faiss.read_index(self._delta_filename(filename)))
+
+        next_id = metadata.get('next_id')
+        if next_id is None:
+            ids = faiss.vector_to_array(index.id_map)
+            next_id = int(ids.max()) + 1 if len(ids) else 0
+        snapshot = IndexSnapshot(index, deltas, metadata.get('tombstones', []), index_type_of(index), metadata.get('storage', 'float32'))
+        with self.lock:
+            self.snapshot = snapshot
+            self.id_to_text = {}
+            self.next_id = next_id
+            self._saved_base = (filename, snapshot.generation)
+
+    def _read_index(self, filename, mmap):
+        if mmap:
+            try:
+                return faiss.read_index(filename, faiss.IO_FLAG_MMAP_IFC)
+            except RuntimeError as e:
+                logging.info(f"Index {filename} cannot be memory-mapped, reading it into memory: {e}")
+        return faiss.read_index(filename)
+
+    def _delta_filename(self, filename):
+        return f"{filename}.delta"
 
-    def load_index(self, filename):
-        self.index = faiss.read_index(filename)
+    def metadata_filename(self, filename):
+        """
+        Path of the JSON metadata file that belongs to an index file. It is written last
+        when the bundle is saved, so its modification time tells when the index changed.
+        """
+        return f"{filename}.meta.json"
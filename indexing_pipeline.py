@@ -3,55 +3,258 @@ from dotenv import load_dotenv
 from pdf_processor import process_multiple_pdfs
 from database_manager import DatabaseManager
 from embedding_model import EmbeddingModel
+from embedding_cache import EmbeddingCache
 import numpy as np
 from faiss_manager import FAISSManager
+from bm25_index import BM25Index, reciprocal_rank_fusion
+from answer_cache import SemanticAnswerCache
 from query_processor import QueryProcessor
 from openrouter_client import OpenRouterClient
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
 import time
 
 load_dotenv()
 
+# Where search candidates come from: the FAISS index, the BM25 index, or both merged by reciprocal rank fusion
+RETRIEVAL_MODES = ('dense', 'bm25', 'hybrid')
+
+_shared_pipeline = None
+_shared_pipeline_lock = threading.Lock()
+
+def get_pipeline():
+    """
+    Return the process-wide IndexingPipeline, creating it on first use.
+
+    Building a pipeline opens the database, creates the API clients, downloads
+    the NLTK resources and loads the persisted FAISS index, so it is done once
+    per process and shared by every request thread.
+
+    :return: Shared IndexingPipeline instance
+    """
+    global _shared_pipeline
+    if _shared_pipeline is None:
+        with _shared_pipeline_lock:
+            if _shared_pipeline is None:
+                _shared_pipeline = IndexingPipeline()
+    return _shared_pipeline
+
+def file_content_hash(path, block_size=1024 * 1024):
+    """
+    SHA-256 of a file's content, read in blocks.
+
+    :param path: File path
+    :return: Hex digest string
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
 class IndexingPipeline:
     def __init__(self):
-        self.db_manager = DatabaseManager(os.getenv('DB_NAME'))
+        self.db_manager = DatabaseManager(os.getenv('DB_NAME', 'pdf_extracts.db'))
         use_openrouter = os.getenv('USE_OPENROUTER', 'false')
+        self.embedding_cache = EmbeddingCache(
+            os.getenv('EMBEDDING_CACHE_DB', 'embedding_cache.db'),
+            max_entries=int(os.getenv('EMBEDDING_CACHE_MAX_ENTRIES', 1_000_000)),
+            memory_entries=int(os.getenv('EMBEDDING_CACHE_MEMORY_ENTRIES', 10_000))
+        )
         self.embedding_model = EmbeddingModel(
             use_openrouter=use_openrouter.lower() == 'true',
-            model_name=os.getenv('OPENAI_EMBEDDING_MODEL', 'openai/text-embedding-3-small')
+            model_name=os.getenv('OPENAI_EMBEDDING_MODEL', 'openai/text-embedding-3-small'),
+            cache=self.embedding_cache,
+            dimensions=int(os.getenv('EMBEDDING_DIMENSIONS') or 0) or None,
+            backend=os.getenv('EMBEDDING_BACKEND', '').lower() or None
+        )
+        self.faiss_manager = FAISSManager(
+            self.embedding_model.get_embedding_dimension(),
+            model_name=self.embedding_model.model_name,
+            index_type=os.getenv('FAISS_INDEX_TYPE', 'auto'),
+            nprobe=int(os.getenv('FAISS_NPROBE', 16)),
+            ef_search=int(os.getenv('FAISS_EF_SEARCH', 64)),
+            storage=os.getenv('FAISS_STORAGE', 'float32'),
+            rescore_factor=int(os.getenv('FAISS_RESCORE_FACTOR', 4))
         )
-        self.faiss_manager = FAISSManager(self.embedding_model.get_embedding_dimension())
         self.db_manager.set_faiss_manager(self.faiss_manager)
-        self.faiss_index_file = os.getenv('FAISS_INDEX_FILE')
-        self.query_processor = QueryProcessor(self.embedding_model)
+        self.faiss_index_file = os.getenv('FAISS_INDEX_FILE', 'faiss_index.bin')
+        self.retrieval_mode = os.getenv('RETRIEVAL_MODE', 'hybrid').lower()
+        if self.retrieval_mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode {self.retrieval_mode}; expected one of {', '.join(RETRIEVAL_MODES)}")
+        self.retrieval_candidates = int(os.getenv('RETRIEVAL_CANDIDATE_FACTOR', 4))
+        self.rrf_constant = int(os.getenv('RRF_CONSTANT', 60))
+        self.bm25_index = None
+        if self.retrieval_mode != 'dense':
+            self._open_bm25_index()
+        self.query_processor = QueryProcessor(
+            self.embedding_model,
+            query_cache_size=int(os.getenv('QUERY_CACHE_SIZE', 10_000)),
+            token_cache_size=int(os.getenv('TOKEN_CACHE_SIZE', 100_000)),
+            max_synonyms=int(os.getenv('QUERY_EXPANSION_MAX_SYNONYMS', 5))
+        )
         self.openrouter_client = OpenRouterClient()
+        self.answer_cache = SemanticAnswerCache(
+            max_entries=int(os.getenv('ANSWER_CACHE_SIZE', 1000)),
+            ttl=float(os.getenv('ANSWER_CACHE_TTL', 3600)),
+            threshold=float(os.getenv('ANSWER_CACHE_THRESHOLD', 0.95))
+        )
+        # Seconds between checks whether another process saved newer index files (0 disables the checks)
+        self.index_refresh_interval = float(os.getenv('INDEX_REFRESH_INTERVAL', 5))
+        self._last_refresh_check = time.monotonic()
+        self._index_files_thread_lock = threading.RLock()
+        self._index_files_lock_depth = 0
+        self._index_files_lock_conn = None
+        with self.index_files_lock():
+            if self.db_manager.migrated:
+                self.rebuild_index()
+            elif os.path.exists(self.faiss_index_file):
+                self.load_index()
+            if self.bm25_index is not None and self.bm25_index.document_count != self.db_manager.count_chunks():
+                self.rebuild_bm25_index()
+            self.db_manager.reserve_chunk_ids(self.faiss_manager.next_id)
+            self._index_signature = self._index_files_signature()
+
+    def run(self, pdf_files, save_to_file=False, keyword_filter=None, max_pages=None, clean_text=False, chunk_size=1000, chunk_overlap=200, progress_callback=None, extraction_mode=None, max_workers=None, file_timeout=None, large_file_threshold=None, incremental=True):
+        """
+        Extract, embed and index the given PDF files.
+
+        With incremental=True, files whose content and indexing parameters match the document
+        manifest are skipped, and the vectors of changed files replace their previous ones.
 
-    def run(self, pdf_files, save_to_file=False, keyword_filter=None, max_pages=None, clean_text=False, chunk_size=1000, chunk_overlap=200, progress_callback=None):
+        :param extraction_mode: 'process' parses PDFs in a process pool (default, set EXTRACTION_MODE),
+                                'thread' runs the whole per-file pipeline in a thread pool
+        :param max_workers: Number of extraction workers (default: EXTRACTION_WORKERS or os.cpu_count())
+        :param file_timeout: Per-file extraction timeout in seconds for process mode (default: EXTRACTION_TIMEOUT)
+        :param large_file_threshold: In process mode, PDFs of at least this many bytes are extracted page range
+                                     by page range in parallel and embedded while they are parsed
+                                     (default: LARGE_PDF_THRESHOLD_MB)
+        :return: Number of processed files
+        """
         if isinstance(pdf_files, str):
             pdf_files = [pdf_files]
+
+        manifest_updates = {}
+        if incremental:
+            params_hash = self.indexing_params_hash(max_pages, clean_text, chunk_size, chunk_overlap)
+            pdf_files, manifest_updates = self._select_changed_files(pdf_files, params_hash)
+            if not pdf_files:
+                logging.info("All files are already indexed with the current parameters.")
+                return 0
+
+        extraction_mode = extraction_mode or os.getenv('EXTRACTION_MODE', 'process')
+        max_workers = max_workers or int(os.getenv('EXTRACTION_WORKERS') or 0) or os.cpu_count()
+        if file_timeout is None and os.getenv('EXTRACTION_TIMEOUT'):
+            file_timeout = float(os.getenv('EXTRACTION_TIMEOUT'))
+        if large_file_threshold is None:
+            large_file_threshold = int(float(os.getenv('LARGE_PDF_THRESHOLD_MB', 50)) * 1024 * 1024)
+
+        if extraction_mode == 'process':
+            results = process_multiple_pdfs(
+                pdf_files,
+                save_to_file=save_to_file,
+                keyword_filter=keyword_filter,
+                max_pages=max_pages,
+                clean_text=clean_text,
+                chunk_size=chunk_size,
+                chunk_overlap=chunk_overlap,
+                use_faiss=True,
+                db_manager=self.db_manager,
+                embedding_model=self.embedding_model,
+                faiss_manager=self.faiss_manager,
+                use_processes=True,
+                max_workers=max_workers,
+                file_timeout=file_timeout,
+                progress_callback=progress_callback,
+                large_file_threshold=large_file_threshold,
+                term_extractor=self.query_processor.term_extractor
+            )
+            self.save_index()
+            self._record_indexed_files(manifest_updates, results)
+            return len(results)
         
         total_files = len(pdf_files)
         processed_files = 0
         start_time = time.time()
+        results = {}
 
-        with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
             future_to_file = {executor.submit(self.process_single_pdf, file, save_to_file, keyword_filter, max_pages, clean_text, chunk_size, chunk_overlap): file for file in pdf_files}
             
             for future in as_completed(future_to_file):
                 file = future_to_file[future]
                 try:
-                    result = future.result()
+                    results.update(future.result())
                     processed_files += 1
                     if progress_callback:
                         progress_callback(processed_files, total_files, time.time() - start_time)
                 except Exception as exc:
                     print(f'{file} generated an exception: {exc}')
 
-        self.faiss_manager.save_index(self.faiss_index_file)
-        self.db_manager.close()
-        
+        self.save_index()
+        self._record_indexed_files(manifest_updates, results)
+
         return processed_files
 
+    def indexing_params_hash(self, max_pages, clean_text, chunk_size, chunk_overlap):
+        """
+        Hash of the parameters that determine a file's chunks and vectors.
+        """
+        params = {
+            'max_pages': max_pages,
+            'clean_text': clean_text,
+            'chunk_size': chunk_size,
+            'chunk_overlap': chunk_overlap,
+            'embedding_model': self.embedding_model.model_name
+        }
+        if self.embedding_model.dimensions:
+            params['embedding_dimensions'] = self.embedding_model.dimensions
+        return hashlib.sha256(json.dumps(params, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def _select_changed_files(self, pdf_files, params_hash):
+        """
+        Split pdf_files into files that need indexing and manifest entries to record once they are indexed.
+
+        Files whose size and modification time match the manifest are skipped without reading
+        them; otherwise the content hash decides.
+
+        :return: Tuple of (files to process, {path: manifest row})
+        """
+        manifest = self.db_manager.get_documents()
+        to_process = []
+        manifest_updates = {}
+        touched = []
+        for pdf_file in pdf_files:
+            if not isinstance(pdf_file, str):
+                to_process.append(pdf_file)
+                continue
+            path = os.path.abspath(pdf_file)
+            stat = os.stat(pdf_file)
+            entry = manifest.get(path)
+            if entry and entry['params_hash'] == params_hash and entry['file_size'] == stat.st_size and entry['mtime'] == stat.st_mtime:
+                continue
+            content_hash = file_content_hash(pdf_file)
+            row = (path, content_hash, params_hash, stat.st_size, stat.st_mtime)
+            if entry and entry['params_hash'] == params_hash and entry['content_hash'] == content_hash:
+                touched.append(row)
+                continue
+            to_process.append(pdf_file)
+            manifest_updates[pdf_file] = row
+
+        if touched:
+            self.db_manager.upsert_documents(touched)
+        logging.info(f"{len(to_process)} of {len(pdf_files)} files are new or changed.")
+        return to_process, manifest_updates
+
+    def _record_indexed_files(self, manifest_updates, results):
+        # Results are keyed by absolute path, so same-named files in different directories stay apart
+        self.db_manager.upsert_documents(row for row in manifest_updates.values() if row[0] in results)
+
     def process_single_pdf(self, pdf_file, save_to_file, keyword_filter, max_pages, clean_text, chunk_size, chunk_overlap):
         return process_multiple_pdfs(
             [pdf_file],
@@ -64,46 +267,190 @@ class IndexingPipeline:
             use_faiss=True,
             db_manager=self.db_manager,
             embedding_model=self.embedding_model,
-            faiss_manager=self.faiss_manager
+            faiss_manager=self.faiss_manager,
+            term_extractor=self.query_processor.term_extractor
         )
 
-    def search_similar_chunks(self, query_text, k=5):
-        query_vector = self.query_processor.query_to_embedding(query_text)
-        similar_chunks = self.faiss_manager.search(query_vector, k)
-        
-        # Calculate relevance scores and rank results
+    def search_similar_chunks(self, query_text, k=5, processed=False):
+        return self.search_similar_chunks_batch([query_text], k, processed=processed)[0]
+
+    def search_similar_chunks_batch(self, query_texts, k=5, processed=False):
+        """
+        Search for several queries at once.
+
+        The queries are embedded in bulk, searched with a single FAISS call and reranked together.
+        In 'bm25' and 'hybrid' retrieval mode (RETRIEVAL_MODE) the candidates come from the BM25
+        index, or from both indexes merged by reciprocal rank fusion, before they are reranked.
+
+        :param query_texts: List of input query strings
+        :param k: Number of chunks per query (default: 5)
+        :param processed: The queries are already the output of QueryProcessor.process_query
+        :return: One list of (chunk, distance, relevance_score) tuples per query, sorted by relevance
+        """
+        if not query_texts:
+            return []
+        query_vectors = self.query_processor.queries_to_embeddings(query_texts, processed=processed)
+        return [[(chunk, distance, score) for _, chunk, distance, score in ranked]
+                for ranked in self._search(query_texts, query_vectors, k)]
+
+    def _search(self, query_texts, query_vectors, k):
+        """
+        Retrieve and rerank the chunks for embedded queries.
+
+        :return: One list of (chunk_id, chunk, distance, relevance_score) tuples per query, sorted by relevance
+        """
+        self.refresh_index()
+        if self.retrieval_mode == 'dense':
+            hits_with_ids = self.faiss_manager.search_batch(query_vectors, k, with_ids=True)
+        else:
+            hits_with_ids = self._fused_candidates(query_texts, query_vectors, k)
+        results = [[(chunk, distance) for _, chunk, distance in hits] for hits in hits_with_ids]
+        chunk_terms = self._chunk_terms([chunk_id for hits in hits_with_ids for chunk_id, _, _ in hits],
+                                        {chunk_id: chunk for hits in hits_with_ids for chunk_id, chunk, _ in hits})
+        scores = self.query_processor.calculate_relevance_scores(
+            query_texts, results, [[chunk_terms[chunk_id] for chunk_id, _, _ in hits] for hits in hits_with_ids])
+
         ranked_results = []
-        for chunk, distance in similar_chunks:
-            relevance_score = self.query_processor.calculate_relevance_score(query_text, chunk, distance)
-            ranked_results.append((chunk, distance, relevance_score))
-        
-        # Sort results by relevance score in descending order
-        ranked_results.sort(key=lambda x: x[2], reverse=True)
-        
+        for hits, hit_scores in zip(hits_with_ids, scores):
+            ranked = [(chunk_id, chunk, distance, score) for (chunk_id, chunk, distance), score in zip(hits, hit_scores)]
+            ranked.sort(key=lambda x: x[3], reverse=True)
+            ranked_results.append(ranked)
         return ranked_results
 
-    def get_top_k_relevant_chunks(self, query_text, k=5):
+    def search_lexical(self, query_texts, k=5):
+        """
+        Rank chunks for several queries by BM25 alone, without embedding the queries.
+
+        :param query_texts: List of input query strings
+        :param k: Number of chunks per query (default: 5)
+        :return: One list of (chunk, bm25_score) tuples per query, best first
+        """
+        if self.bm25_index is None:
+            raise ValueError("BM25 index is disabled (RETRIEVAL_MODE=dense)")
+        results = self.bm25_index.search_batch([self.query_processor.term_extractor.terms(query) for query in query_texts], k)
+        texts = self.db_manager.get_chunk_texts(list({chunk_id for hits in results for chunk_id, _ in hits}))
+        return [[(texts[chunk_id], score) for chunk_id, score in hits if chunk_id in texts] for hits in results]
+
+    def _fused_candidates(self, query_texts, query_vectors, k):
+        """
+        Top-k candidate chunks per query from the BM25 index, fused with the FAISS results in hybrid mode.
+
+        Each retriever contributes k * RETRIEVAL_CANDIDATE_FACTOR candidates. Chunks found only by
+        BM25 get their exact distance to the query from the stored vectors, so all candidates are
+        reranked the same way.
+
+        :return: One list of (chunk_id, chunk, distance) tuples per query
+        """
+        candidates = k * self.retrieval_candidates
+        lexical = self.bm25_index.search_batch([self.query_processor.term_extractor.terms(query) for query in query_texts], candidates)
+        if self.retrieval_mode == 'hybrid':
+            dense = self.faiss_manager.search_batch(query_vectors, candidates, with_ids=True)
+            rankings = [reciprocal_rank_fusion([[chunk_id for chunk_id, _, _ in dense_hits], [chunk_id for chunk_id, _ in lexical_hits]],
+                                               self.rrf_constant)[:k]
+                        for dense_hits, lexical_hits in zip(dense, lexical)]
+        else:
+            dense = [[] for _ in query_texts]
+            rankings = [[chunk_id for chunk_id, _ in lexical_hits[:k]] for lexical_hits in lexical]
+
+        known = {chunk_id: (chunk, distance) for hits in dense for chunk_id, chunk, distance in hits}
+        missing = list({chunk_id for ranking in rankings for chunk_id in ranking} - known.keys())
+        texts = self.db_manager.get_chunk_texts(missing)
+        vectors = self.db_manager.get_chunk_embeddings(missing)
+        query_vectors = np.asarray(query_vectors, dtype=np.float32).reshape(len(query_texts), -1)
+
+        results = []
+        for query_vector, ranking in zip(query_vectors, rankings):
+            hits = []
+            for chunk_id in ranking:
+                if chunk_id in known:
+                    hits.append((chunk_id, *known[chunk_id]))
+                elif chunk_id in texts and len(vectors.get(chunk_id, ())) == len(query_vector):
+                    # Squared L2, like the distances reported by the FAISS index
+                    hits.append((chunk_id, texts[chunk_id], float(np.sum((vectors[chunk_id] - query_vector) ** 2))))
+            results.append(hits)
+        return results
+
+    def _chunk_terms(self, chunk_ids, chunk_texts):
+        """
+        Precomputed terms of the given chunks. Chunks indexed before terms were stored get
+        their terms computed now and saved, so this happens only once per chunk.
+        """
+        chunk_terms = self.db_manager.get_chunk_terms(list(set(chunk_ids)))
+        missing = {chunk_id: self.query_processor.term_extractor.terms(chunk_texts[chunk_id])
+                   for chunk_id in chunk_texts if chunk_terms.get(chunk_id) is None}
+        if missing:
+            self.db_manager.set_chunk_terms(missing)
+            chunk_terms.update(missing)
+        return chunk_terms
+
+    def get_top_k_relevant_chunks(self, query_text, k=5, processed=False):
         """
         Return the top-k most relevant chunks for a given query.
         
         :param query_text: Input query string
         :param k: Number of top chunks to return (default: 5)
+        :param processed: The query is already the output of QueryProcessor.process_query
         :return: List of tuples containing (chunk, relevance_score)
         """
-        ranked_results = self.search_similar_chunks(query_text, k)
+        ranked_results = self.search_similar_chunks(query_text, k, processed=processed)
         return [(chunk, relevance_score) for chunk, _, relevance_score in ranked_results[:k]]
 
     def generate_context_aware_response(self, query_text, conversation_history, k=5):
         """
         Generate a context-aware response for the given query using OpenRouter.
+
+        A cached answer is returned instead when a similar query was answered from the same
+        chunks and conversation context (see SemanticAnswerCache).
         
         :param query_text: Input query string
         :param conversation_history: List of previous messages in the conversation
         :param k: Number of top chunks to use for context (default: 5)
         :return: Generated response string
         """
+        messages, cache_key = self._build_messages(query_text, conversation_history, k)
+        response = self.answer_cache.get(*cache_key)
+        if response is None:
+            response = self.openrouter_client.chat_completion(messages)
+            self.answer_cache.put(cache_key[0], cache_key[1], response, *cache_key[2:])
+        return response
+
+    def generate_context_aware_response_stream(self, query_text, conversation_history, k=5):
+        """
+        Stream a context-aware response for the given query using OpenRouter.
+
+        :param query_text: Input query string
+        :param conversation_history: List of previous messages in the conversation
+        :param k: Number of top chunks to use for context (default: 5)
+        :return: Iterator over the generated text fragments
+        """
+        messages, cache_key = self._build_messages(query_text, conversation_history, k)
+        response = self.answer_cache.get(*cache_key)
+        if response is not None:
+            return iter([response])
+        return self._stream_and_cache(self.openrouter_client.chat_completion_stream(messages), cache_key)
+
+    def _stream_and_cache(self, fragments, cache_key):
+        """
+        Pass the streamed fragments through and cache the answer once the stream has completed.
+        """
+        answer = []
+        for fragment in fragments:
+            answer.append(fragment)
+            yield fragment
+        self.answer_cache.put(cache_key[0], cache_key[1], ''.join(answer), *cache_key[2:])
+
+    def _build_messages(self, query_text, conversation_history, k):
+        """
+        Retrieve the top-k chunks for the query and build the chat messages for the LLM.
+
+        :return: Tuple of (messages, answer cache key), where the key is the
+                 (query vector, chunk ids, context key, index version) to look the answer up by
+        """
+        version = self.db_manager.version
         processed_query = self.query_processor.process_query(query_text, conversation_history)
-        top_chunks = self.get_top_k_relevant_chunks(processed_query, k)
+        query_vector = self.query_processor.query_to_embedding(processed_query, processed=True)
+        ranked = self._search([processed_query], [query_vector], k)[0][:k]
+        top_chunks = [(chunk, relevance_score) for _, chunk, _, relevance_score in ranked]
         prompt = self.query_processor.generate_context_aware_prompt(query_text, top_chunks, conversation_history)
         
         messages = [
@@ -111,12 +458,184 @@ class IndexingPipeline:
         ] + conversation_history + [
             {"role": "user", "content": prompt}
         ]
-        
-        response = self.openrouter_client.chat_completion(messages)
-        return response
+        # Answers are only shared within the same conversation context
+        context_key = hashlib.sha256(json.dumps(conversation_history, sort_keys=True).encode('utf-8')).hexdigest()
+        return messages, (query_vector, [chunk_id for chunk_id, _, _, _ in ranked], context_key, version)
 
     def load_index(self):
-        self.faiss_manager.load_index(self.faiss_index_file)
+        try:
+            self.faiss_manager.load_index(self.faiss_index_file, mmap=os.getenv('FAISS_MMAP', 'true').lower() == 'true')
+        except (RuntimeError, ValueError) as e:
+            logging.warning(f"Could not load FAISS index from {self.faiss_index_file}: {e}")
+
+    def save_index(self):
+        """
+        Save the FAISS index, rebuilding it first if the corpus has outgrown its index type,
+        and compact the BM25 index.
+        """
+        with self.index_files_lock():
+            if self.faiss_manager.needs_rebuild():
+                self.rebuild_index()
+            else:
+                self.faiss_manager.save_index(self.faiss_index_file)
+            if self.bm25_index is not None:
+                self.bm25_index.save()
+            self._index_signature = self._index_files_signature()
+
+    def refresh_index(self, force=False):
+        """
+        Reload the FAISS and BM25 indexes if another process saved them since this pipeline
+        loaded or saved them, e.g. a Celery worker that merged newly ingested documents.
+
+        The index files are checked at most every INDEX_REFRESH_INTERVAL seconds unless force
+        is set. Changes this process has not saved yet are discarded by a reload, so a process
+        that ingests documents itself should not share its index files with Celery workers.
+
+        :return: True if the indexes were reloaded
+        """
+        now = time.monotonic()
+        if not force and (self.index_refresh_interval <= 0 or now - self._last_refresh_check < self.index_refresh_interval):
+            return False
+        self._last_refresh_check = now
+        if self._index_files_signature() == self._index_signature:
+            return False
+        with self.index_files_lock():
+            signature = self._index_files_signature()
+            if signature == self._index_signature:
+                return False
+            logging.info("The index files were saved by another process; reloading them.")
+            self.load_index()
+            if self.bm25_index is not None:
+                self._open_bm25_index()
+            self.db_manager.reserve_chunk_ids(self.faiss_manager.next_id)
+            # Cached answers may have been generated without the new chunks
+            self.db_manager.version += 1
+            self._index_signature = signature
+        return True
+
+    def merge_indexed_chunks(self, chunk_ids, replaced_ids=(), batch_size=500):
+        """
+        Add chunks that other processes stored in the database to the indexes and save them.
+
+        Celery ingestion tasks (see celery_tasks) only write chunks to the shared database;
+        the last step of a job merges them here. The indexes are first brought up to date with
+        the files saved by other merges, all under the index files lock. Chunks already in the
+        FAISS index, e.g. picked up by a rebuild, are not added again.
+
+        :param chunk_ids: Ids of the new chunks
+        :param replaced_ids: Ids of the chunks they replace, removed from the indexes
+        :param batch_size: Number of chunks loaded from the database at once
+        :return: Number of chunks added to the FAISS index
+        """
+        chunk_ids = sorted(set(chunk_ids))
+        added = 0
+        with self.index_files_lock():
+            self.refresh_index(force=True)
+            replaced_ids = list(replaced_ids)
+            batches = [chunk_ids[start:start + batch_size] for start in range(0, len(chunk_ids), batch_size)] or [[]]
+            for batch in batches:
+                vectors = self.db_manager.get_chunk_embeddings(batch)
+                texts = self.db_manager.get_chunk_texts(batch)
+                # Chunks deleted again since they were stored are skipped
+                batch = [chunk_id for chunk_id in batch if chunk_id in vectors and chunk_id in texts]
+                if self.bm25_index is not None and (batch or replaced_ids):
+                    terms = self._chunk_terms(batch, texts)
+                    self.bm25_index.add_documents(batch, [terms[chunk_id] for chunk_id in batch], replace_ids=replaced_ids)
+                new_ids = [chunk_id for chunk_id, indexed in zip(batch, self.faiss_manager.contains(batch)) if not indexed]
+                if new_ids or replaced_ids:
+                    self.faiss_manager.add_vectors(
+                        np.vstack([vectors[chunk_id] for chunk_id in new_ids]) if new_ids else np.zeros((0, self.faiss_manager.dimension), dtype=np.float32),
+                        [texts[chunk_id] for chunk_id in new_ids], ids=new_ids, replace_ids=replaced_ids)
+                    added += len(new_ids)
+                replaced_ids = []
+            self.db_manager.version += 1
+            self.save_index()
+        return added
+
+    @contextmanager
+    def index_files_lock(self):
+        """
+        Hold the lock that serializes saving and reloading the index files across processes,
+        so no process reads a half-written index bundle and concurrent merges do not overwrite
+        each other's additions. The lock is an exclusive transaction on a small SQLite file
+        next to the FAISS index, which works on every platform; it is reentrant within a thread.
+        """
+        with self._index_files_thread_lock:
+            if self._index_files_lock_depth == 0:
+                conn = sqlite3.connect(f"{self.faiss_index_file}.lock", timeout=600, isolation_level=None)
+                try:
+                    conn.execute('BEGIN IMMEDIATE')
+                except sqlite3.Error:
+                    conn.close()
+                    raise
+                self._index_files_lock_conn = conn
+            self._index_files_lock_depth += 1
+            try:
+                yield
+            finally:
+                self._index_files_lock_depth -= 1
+                if self._index_files_lock_depth == 0:
+                    self._index_files_lock_conn.execute('ROLLBACK')
+                    self._index_files_lock_conn.close()
+                    self._index_files_lock_conn = None
+
+    def _index_files_signature(self):
+        """
+        Modification times and sizes of the files that change whenever the indexes are saved.
+        """
+        filenames = [self.faiss_manager.metadata_filename(self.faiss_index_file)]
+        if self.bm25_index is not None:
+            filenames.append(self.bm25_index.filename)
+        signature = []
+        for filename in filenames:
+            try:
+                stat = os.stat(filename)
+                signature.append((stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                signature.append(None)
+        return tuple(signature)
+
+    def _open_bm25_index(self):
+        self.bm25_index = BM25Index(
+            os.getenv('BM25_INDEX_FILE', 'bm25_index.npz'),
+            k1=float(os.getenv('BM25_K1', 1.2)),
+            b=float(os.getenv('BM25_B', 0.75))
+        )
+        self.db_manager.set_bm25_index(self.bm25_index)
+
+    def rebuild_index(self):
+        """
+        Rebuild the FAISS index from the chunk vectors stored in the database and save it.
+
+        The index type is chosen for the number of stored chunks (FAISS_INDEX_TYPE), and
+        IVF indexes are trained on a random sample of the stored vectors.
+        """
+        dimension = self.faiss_manager.dimension
+        with self.index_files_lock():
+            self.faiss_manager.rebuild(
+                self.db_manager.iter_chunk_embeddings(dimension=dimension),
+                self.db_manager.count_chunks(dimension=dimension),
+                sample_vectors=lambda count: self.db_manager.sample_chunk_embeddings(count, dimension=dimension)
+            )
+            self.faiss_manager.save_index(self.faiss_index_file)
+            self._index_signature = self._index_files_signature()
+
+    def rebuild_bm25_index(self):
+        """
+        Rebuild the BM25 index from the chunk texts stored in the database and save it.
+        """
+        logging.info("Rebuilding the BM25 index from the stored chunks.")
+        with self.index_files_lock():
+            self.bm25_index.clear()
+            term_extractor = self.query_processor.term_extractor
+            for ids, texts in self.db_manager.iter_chunk_texts():
+                self.bm25_index.add_documents(ids, [term_extractor.terms(text) for text in texts])
+            self.bm25_index.save()
+            self._index_signature = self._index_files_signature()
+
+    def close(self):
+        self.db_manager.close()
+        self.embedding_cache.close()
 
 if __name__ == "__main__":
     pipeline = IndexingPipeline()
@@ -0,0 +1,155 @@
+import os
+import re
+import zlib
+import numpy as np
+
+# Backends that embed on this machine, without an API
+LOCAL_BACKENDS = ('hashing', 'sentence-transformers')
+
+TOKEN = re.compile(r'\w+')
+
+class HashingEmbedder:
+    """
+    Deterministic embeddings from hashed word unigrams and bigrams.
+
+    Words are hashed with CRC-32, which unlike Python's salted hash() is the same in every
+    process, and bigrams are hashed from the hashes of their words. Each feature is mapped to
+    a signed dimension with weight 1 + log(term frequency). Vectors are
+    L2-normalized, so texts sharing many words have a high cosine similarity. Needs no model
+    files or network access, e.g. for air-gapped deployments and tests.
+    """
+
+    def __init__(self, dimension=1024, hash_cache_size=1_000_000):
+        """
+        :param dimension: Embedding dimension
+        :param hash_cache_size: Number of word hashes kept in memory
+        """
+        self.dimension = dimension
+        self.model_name = f"hashing-tf-v1-{dimension}"
+        self.hash_cache_size = hash_cache_size
+        self._hashes = {}
+
+    def embed(self, texts):
+        """
+        Embed a batch of texts.
+
+        :param texts: List of input text strings
+        :return: float32 numpy array of shape (len(texts), dimension); empty texts get zero vectors
+        """
+        tokens = []
+        counts = []
+        for text in texts:
+            text_tokens = TOKEN.findall(text.lower())
+            tokens.extend(text_tokens)
+            counts.append(len(text_tokens))
+        if not tokens:
+            return np.zeros((len(texts), self.dimension), dtype=np.float32)
+
+        hashes = list(map(self._hashes.get, tokens))
+        if None in hashes:
+            hashes = [self._hash(token) if value is None else value for token, value in zip(tokens, hashes)]
+        unigrams = np.array(hashes, dtype=np.int64)
+        rows = np.repeat(np.arange(len(texts), dtype=np.int64), counts)
+        # Bigram hashes are computed from the hashes of their words, within each text
+        same_text = rows[1:] == rows[:-1]
+        bigrams = _mix32((unigrams[:-1][same_text] * 0x9E3779B1 + unigrams[1:][same_text]) & 0xFFFFFFFF)
+        rows = np.concatenate((rows, rows[1:][same_text]))
+        hashes = np.concatenate((unigrams, bigrams))
+        # Term frequency of each distinct feature per text
+        keys, counts = np.unique((rows << 32) | hashes, return_counts=True)
+        rows, hashes = keys >> 32, keys & 0xFFFFFFFF
+        # The top bit of the hash gives the sign, the others the dimension
+        weights = np.where(hashes & 0x80000000, -1.0, 1.0) * (1.0 + np.log(counts))
+        matrix = np.bincount(rows * self.dimension + (hashes & 0x7FFFFFFF) % self.dimension,
+                             weights=weights, minlength=len(texts) * self.dimension)
+        matrix = matrix.astype(np.float32).reshape(len(texts), self.dimension)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return np.divide(matrix, norms, out=matrix, where=norms > 0)
+
+    def _hash(self, token):
+        value = self._hashes.get(token)
+        if value is None:
+            value = zlib.crc32(token.encode('utf-8'))
+            if len(self._hashes) >= self.hash_cache_size:
+                self._hashes.clear()
+            self._hashes[token] = value
+        return value
+
+def _mix32(values):
+    """
+    MurmurHash3's 32-bit finalizer, applied to an int64 array of 32-bit values.
+    """
+    values = values ^ (values >> 16)
+    values = (values * 0x85EBCA6B) & 0xFFFFFFFF
+    values ^= values >> 13
+    values = (values * 0xC2B2AE35) & 0xFFFFFFFF
+    return values ^ (values >> 16)
+
+class SentenceTransformerEmbedder:
+    """
+    Embeddings from a sentence-transformers model run on the CPU.
+
+    The model is loaded from the local sentence-transformers cache, or downloaded once;
+    set HF_HUB_OFFLINE=1 to never go to the network.
+    """
+
+    def __init__(self, model_name='all-MiniLM-L6-v2', dimensions=None, batch_size=32, threads=None, cache_folder=None):
+        """
+        :param model_name: Name or local path of the sentence-transformers model
+        :param dimensions: Optional smaller dimension; embeddings are truncated and re-normalized
+        :param batch_size: Number of texts encoded at a time
+        :param threads: Number of CPU threads used by torch (default: torch's default)
+        :param cache_folder: Directory of downloaded models (default: the sentence-transformers cache)
+        """
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError:
+            raise ImportError("The sentence-transformers embedding backend requires the sentence-transformers package (pip install sentence-transformers).")
+        if threads:
+            import torch
+            torch.set_num_threads(threads)
+        self.model = SentenceTransformer(model_name, device='cpu', cache_folder=cache_folder)
+        self.model_name = model_name
+        self.batch_size = batch_size
+        model_dimension = self.model.get_sentence_embedding_dimension()
+        self.dimension = min(dimensions, model_dimension) if dimensions else model_dimension
+
+    def embed(self, texts):
+        """
+        Embed a batch of texts.
+
+        :param texts: List of input text strings
+        :return: float32 numpy array of shape (len(texts), dimension)
+        """
+        if not texts:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+        matrix = self.model.encode(list(texts), batch_size=self.batch_size, convert_to_numpy=True,
+                                   normalize_embeddings=True, show_progress_bar=False).astype(np.float32, copy=False)
+        if matrix.shape[1] > self.dimension:
+            matrix = np.ascontiguousarray(matrix[:, :self.dimension])
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            matrix = np.divide(matrix, norms, out=matrix, where=norms > 0)
+        return matrix
+
+def create_local_embedder(backend, dimensions=None):
+    """
+    Create the local embedder of the given backend ('hashing' or 'sentence-transformers').
+
+    The hashing backend produces HASHING_EMBEDDING_DIMENSION dimensions unless dimensions is
+    given. The sentence-transformers backend loads LOCAL_EMBEDDING_MODEL and encodes
+    LOCAL_EMBEDDING_BATCH_SIZE texts at a time on EMBEDDING_THREADS CPU threads.
+
+    :param dimensions: Optional embedding dimension
+    :return: HashingEmbedder or SentenceTransformerEmbedder
+    """
+    if backend == 'hashing':
+        return HashingEmbedder(dimensions or int(os.getenv('HASHING_EMBEDDING_DIMENSION', 1024)))
+    if backend == 'sentence-transformers':
+        return SentenceTransformerEmbedder(
+            os.getenv('LOCAL_EMBEDDING_MODEL', 'all-MiniLM-L6-v2'),
+            dimensions=dimensions,
+            batch_size=int(os.getenv('LOCAL_EMBEDDING_BATCH_SIZE', 32)),
+            threads=int(os.getenv('EMBEDDING_THREADS', 0)) or None,
+            cache_folder=os.getenv('SENTENCE_TRANSFORMERS_HOME') or None
+        )
+    raise ValueError(f"Unknown local embedding backend {backend}; expected one of {', '.join(LOCAL_BACKENDS)}")
@@ -1,16 +1,56 @@
 import requests
+from requests.adapters import HTTPAdapter
+import json
 import os
-from typing import List, Dict, Any
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import List, Dict, Any, Iterator, Optional
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Status codes that are worth retrying: rate limiting and transient server errors
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+def get_session(pool_size: int = 10) -> requests.Session:
+    """
+    Return the process-wide keep-alive session for the given connection pool size.
+
+    Sharing the session lets every OpenRouterClient in the process reuse pooled
+    TCP/TLS connections instead of opening a new one per request.
+
+    :param pool_size: Maximum number of pooled connections per host
+    :return: Shared requests.Session
+    """
+    with _sessions_lock:
+        session = _sessions.get(pool_size)
+        if session is None:
+            session = requests.Session()
+            # Retries are handled by OpenRouterClient so Retry-After and jitter apply
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _sessions[pool_size] = session
+        return session
+
 class OpenRouterClient:
-    def __init__(self):
+    def __init__(self, base_url: Optional[str] = None, session: Optional[requests.Session] = None):
         self.api_key = os.getenv("OPENROUTER_API_KEY")
         if not self.api_key:
             raise ValueError("OpenRouter API key is required. Set it in the .env file as OPENROUTER_API_KEY.")
-        self.base_url = "https://openrouter.ai/api/v1"
+        self.base_url = (base_url or os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")).rstrip("/")
+        self.site_url = os.getenv("OPENROUTER_SITE_URL")
+        self.site_name = os.getenv("OPENROUTER_SITE_NAME")
+        self.session = session or get_session(int(os.getenv("OPENROUTER_POOL_SIZE", 10)))
+        self.timeout = (float(os.getenv("OPENROUTER_CONNECT_TIMEOUT", 5)), float(os.getenv("OPENROUTER_READ_TIMEOUT", 60)))
+        self.max_retries = int(os.getenv("OPENROUTER_MAX_RETRIES", 3))
+        self.backoff_base = float(os.getenv("OPENROUTER_BACKOFF_BASE", 0.5))
+        self.backoff_max = float(os.getenv("OPENROUTER_BACKOFF_MAX", 30))
 
     def chat_completion(self, messages: List[Dict[str, str]], model: str = "anthropic/claude-3.5-sonnet") -> str:
         """
@@ -20,21 +60,50 @@ class OpenRouterClient:
         :param model: The model to use for completion
         :return: The generated response as a string
         """
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
-        
-
         data = {
             "model": model,
             "messages": messages
         }
 
-        response = requests.post(f"{self.base_url}/chat/completions", headers=headers, json=data)
-        response.raise_for_status()
+        response = self._post("/chat/completions", data)
         return response.json()["choices"][0]["message"]["content"]
 
+    def chat_completion_stream(self, messages: List[Dict[str, str]], model: str = "anthropic/claude-3.5-sonnet") -> Iterator[str]:
+        """
+        Send a streamed chat completion request to OpenRouter.
+
+        Tokens are yielded as soon as they arrive on the server-sent event stream.
+
+        :param messages: List of message dictionaries
+        :param model: The model to use for completion
+        :return: Iterator over the generated text fragments
+        """
+        data = {
+            "model": model,
+            "messages": messages,
+            "stream": True
+        }
+
+        response = self._post("/chat/completions", data, stream=True)
+        try:
+            # chunk_size=None hands over data as it arrives instead of waiting for a full buffer
+            for line in response.iter_lines(chunk_size=None):
+                # Blank lines separate events and lines starting with ':' are keep-alive comments
+                if not line or not line.startswith(b"data:"):
+                    continue
+                payload = line[len(b"data:"):].strip().decode("utf-8")
+                if payload == "[DONE]":
+                    break
+                chunk = json.loads(payload)
+                if "error" in chunk:
+                    raise RuntimeError(f"OpenRouter stream error: {chunk['error']}")
+                choices = chunk.get("choices") or [{}]
+                content = (choices[0].get("delta") or {}).get("content")
+                if content:
+                    yield content
+        finally:
+            response.close()
+
     def generate_embedding(self, text: str, model: str = "openai/text-embedding-3-small", dimensions: int = 1536) -> List[float]:
         """
         Generate an embedding for the given text using OpenRouter.
@@ -44,22 +113,86 @@ class OpenRouterClient:
         :param dimensions: The number of dimensions for the embedding (default: 1536)
         :return: The embedding as a list of floats
         """
+        return self.generate_embeddings([text], model=model, dimensions=dimensions)[0]
+
+    def generate_embeddings(self, texts: List[str], model: str = "openai/text-embedding-3-small", dimensions: int = 1536) -> List[List[float]]:
+        """
+        Generate embeddings for several texts in a single OpenRouter request.
+
+        :param texts: The input texts to embed
+        :param model: The model to use for embedding
+        :param dimensions: The number of dimensions for the embeddings (default: 1536)
+        :return: The embeddings as lists of floats, in the order of texts
+        """
+        data = {
+            "model": model,
+            "input": texts,
+            "dimensions": dimensions
+        }
+
+        response = self._post("/embeddings", data)
+        items = sorted(response.json()["data"], key=lambda item: item.get("index", 0))
+        return [item["embedding"] for item in items]
+
+    def _headers(self) -> Dict[str, str]:
         headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         }
-        
         if self.site_url:
             headers["HTTP-Referer"] = self.site_url
         if self.site_name:
             headers["X-Title"] = self.site_name
+        return headers
 
-        data = {
-            "model": model,
-            "input": text,
-            "dimensions": dimensions
-        }
+    def _post(self, path: str, data: Dict[str, Any], **kwargs) -> requests.Response:
+        """
+        POST to the API through the pooled session, retrying connection errors,
+        timeouts, 429 and 5xx responses with jittered exponential backoff.
+
+        :param path: API path relative to base_url
+        :param data: JSON request body
+        :return: The successful response
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.session.post(f"{self.base_url}{path}", headers=self._headers(), json=data,
+                                             timeout=self.timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(self._backoff_delay(attempt))
+                continue
 
-        response = requests.post(f"{self.base_url}/embeddings", headers=headers, json=data)
-        response.raise_for_status()
-        return response.json()["data"][0]["embedding"]
+            if response.status_code in RETRY_STATUS_CODES and attempt < self.max_retries:
+                delay = self._retry_after_delay(response)
+                response.close()
+                time.sleep(delay if delay is not None else self._backoff_delay(attempt))
+                continue
+
+            response.raise_for_status()
+            return response
+
+    def _backoff_delay(self, attempt: int) -> float:
+        """
+        Full-jitter exponential backoff delay for the given attempt number.
+        """
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _retry_after_delay(self, response: requests.Response) -> Optional[float]:
+        """
+        Delay requested by the server's Retry-After header, capped at backoff_max.
+
+        :return: Delay in seconds, or None if the header is missing or invalid
+        """
+        retry_after = response.headers.get("Retry-After")
+        if not retry_after:
+            return None
+        try:
+            delay = float(retry_after)
+        except ValueError:
+            try:
+                delay = parsedate_to_datetime(retry_after).timestamp() - time.time()
+            except (TypeError, ValueError):
+                return None
+        return min(max(delay, 0.0), self.backoff_max)
@@ -1,14 +1,19 @@
 import os
-import re
 import io
 import logging
+import bisect
+import contextlib
+import itertools
+import multiprocessing
+import signal
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, as_completed, TimeoutError as FutureTimeoutError
 from PyPDF2 import PdfReader
 from PyPDF2.errors import PdfReadError
-from nltk.corpus import stopwords
-from nltk.tokenize import word_tokenize
 from database_manager import DatabaseManager
 from embedding_model import EmbeddingModel
 from text_chunker import TextChunker
+from text_normalizer import normalize_text
 from faiss_manager import FAISSManager
 import time
 
@@ -16,21 +21,29 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 
 def clean_and_preprocess_text(text):
     """
-    Clean and preprocess the extracted text.
+    Clean and preprocess the extracted text: lowercase it, keep only letters and whitespace
+    and remove stopwords (see text_normalizer.normalize_text).
     
     :param text: Input text string
     :return: Cleaned and preprocessed text string
     """
-    text = text.lower()
-    text = re.sub(r'[^a-zA-Z\s]', '', text)
-    tokens = word_tokenize(text)
-    stop_words = set(stopwords.words('english'))
-    tokens = [token for token in tokens if token not in stop_words]
-    return ' '.join(tokens)
+    return normalize_text(text)
 
-def process_multiple_pdfs(pdf_files, save_to_file=False, keyword_filter=None, max_pages=None, clean_text=False, chunk_size=1000, chunk_overlap=200, use_faiss=True, db_manager=None, embedding_model=None, faiss_manager=None):
+def process_multiple_pdfs(pdf_files, save_to_file=False, keyword_filter=None, max_pages=None, clean_text=False, chunk_size=1000, chunk_overlap=200, use_faiss=True, db_manager=None, embedding_model=None, faiss_manager=None, use_processes=False, max_workers=None, file_timeout=None, progress_callback=None, large_file_threshold=None, term_extractor=None):
     """
     Process multiple PDF files, store results in a database, and generate embeddings for text chunks.
+
+    With a term_extractor, the lemmatized terms of each chunk are stored as well, so search
+    results can be scored for keyword overlap without re-tokenizing the chunks.
+
+    With use_processes=True the PDFs are parsed in a process pool (see extract_texts_in_processes)
+    and only the extracted text comes back to this process, where it is chunked, embedded and stored.
+    Files of at least large_file_threshold bytes are instead split into page ranges that are parsed
+    in parallel and chunked and embedded while later pages are still being parsed (see index_pdf_pages),
+    while the process pool parses the other files.
+
+    :return: Dictionary of the indexed files' (chunk, embedding) tuples, or their number of chunks for large
+             files, keyed by the absolute path of each file, or by its upload name for file objects
     """
     results = {}
     if keyword_filter:
@@ -39,6 +52,7 @@ def process_multiple_pdfs(pdf_files, save_to_file=False, keyword_filter=None, ma
     
     successful_extractions = 0
     failed_extractions = 0
+    start_time = time.time()
     
     db_manager = db_manager or DatabaseManager()
     embedding_model = embedding_model or EmbeddingModel()
@@ -47,40 +61,63 @@ def process_multiple_pdfs(pdf_files, save_to_file=False, keyword_filter=None, ma
     if use_faiss and faiss_manager is None:
         faiss_manager = FAISSManager(embedding_model.get_embedding_dimension())
         db_manager.set_faiss_manager(faiss_manager)
+
+    large_files = []
+    if use_processes and large_file_threshold:
+        large_files = [f for f in pdf_files if isinstance(f, str) and os.path.getsize(f) >= large_file_threshold]
+        large_file_set = set(large_files)
+        pdf_files = [f for f in pdf_files if f not in large_file_set]
+
+    # File objects cannot be sent to worker processes, so they are always parsed here.
+    # The worker processes start on the other files now and parse them while the large files
+    # below are indexed.
+    if use_processes and all(isinstance(f, str) for f in pdf_files):
+        extracted = extract_texts_in_processes(pdf_files, max_pages, clean_text, max_workers=max_workers, timeout=file_timeout)
+    else:
+        extracted = ((f, *extract_pages_from_pdf(f, max_pages, clean_text)) for f in pdf_files)
+
+    for i, file_path in enumerate(large_files, 1):
+        filename = os.path.basename(file_path)
+        logging.info(f"Processing {i}/{total_files} page by page: {filename}")
+        # A failed or timed-out file is rolled back and does not abort the rest of the batch
+        try:
+            pages = iter_pdf_pages_parallel(file_path, max_pages, clean_text, max_workers=max_workers, timeout=file_timeout)
+            results[os.path.abspath(file_path)] = index_pdf_pages(filename, file_path, pages, clean_text, save_to_file, text_chunker, embedding_model, db_manager,
+                                                                 term_extractor=term_extractor)
+            successful_extractions += 1
+        except ExtractionTimeout:
+            logging.error(f"Timed out after {file_timeout}s extracting {file_path}")
+            failed_extractions += 1
+        except Exception as e:
+            logging.error(f"Failed to process {filename}: {e}")
+            failed_extractions += 1
+        if progress_callback:
+            progress_callback(i, total_files, time.time() - start_time)
     
-    for i, file_obj in enumerate(pdf_files, 1):
+    for i, (file_obj, text, page_count, page_starts) in enumerate(extracted, len(large_files) + 1):
         if isinstance(file_obj, str):
             filename = os.path.basename(file_obj)
             file_path = file_obj
+            result_key = os.path.abspath(file_obj)
         else:
             filename = f"uploaded_file_{i}.pdf"
             file_path = file_obj
+            result_key = filename
         logging.info(f"Processing {i}/{total_files}: {filename}")
         
-        text, page_count = extract_text_from_pdf(file_path, max_pages, clean_text)
         if text:
-            chunks = text_chunker.chunk_text(text)
-            chunk_embeddings = embedding_model.get_embeddings(chunks)
-            results[filename] = list(zip(chunks, chunk_embeddings))
-            successful_extractions += 1
-            if save_to_file:
-                output_path = f"{os.path.splitext(file_path)[0]}.txt"
-                with open(output_path, 'w', encoding='utf-8') as out_file:
-                    out_file.write(text)
-            
-            # Ensure that the number of chunks matches the number of embeddings
-            if len(chunks) == len(chunk_embeddings):
-                db_manager.insert_pdf_extract(filename, text, page_count, clean_text, [emb.tolist() for emb in chunk_embeddings])
-            else:
-                logging.warning(f"Mismatch in number of chunks ({len(chunks)}) and embeddings ({len(chunk_embeddings)}) for {filename}. Adjusting chunks to match embeddings.")
-                # Adjust chunks to match embeddings
-                if len(chunks) > len(chunk_embeddings):
-                    chunks = chunks[:len(chunk_embeddings)]
-                else:
-                    chunks.extend([''] * (len(chunk_embeddings) - len(chunks)))
-                db_manager.insert_pdf_extract(filename, text, page_count, clean_text, [emb.tolist() for emb in chunk_embeddings], chunks)
+            # One file's embedding or database error must not abort the rest of the batch
+            try:
+                results[result_key] = index_pdf_text(filename, file_path, text, page_count, clean_text, save_to_file, text_chunker, embedding_model, db_manager, page_starts,
+                                                     term_extractor=term_extractor)
+                successful_extractions += 1
+            except Exception as e:
+                logging.error(f"Failed to index {filename}: {e}")
+                failed_extractions += 1
         else:
             failed_extractions += 1
+        if progress_callback:
+            progress_callback(i, total_files, time.time() - start_time)
     
     logging.info(f"\nProcessing Summary:")
     logging.info(f"Total PDFs processed: {total_files}")
@@ -89,10 +126,174 @@ def process_multiple_pdfs(pdf_files, save_to_file=False, keyword_filter=None, ma
     
     return results
 
+def index_pdf_text(filename, file_path, text, page_count, clean_text, save_to_file, text_chunker, embedding_model, db_manager, page_starts=None, term_extractor=None):
+    """
+    Chunk and embed the extracted text of one PDF and store it in the database.
+
+    :param page_starts: Character offset of each page in text, used to record each chunk's page
+    :param term_extractor: Optional TermExtractor for the chunk terms stored with each chunk
+    :return: List of (chunk, embedding) tuples
+    """
+    spans = text_chunker.chunk_spans(text)
+    chunks = [text[start:end] for start, end in spans]
+    chunk_embeddings = embedding_model.get_embeddings(chunks)
+    if save_to_file:
+        output_path = f"{os.path.splitext(file_path)[0]}.txt"
+        with open(output_path, 'w', encoding='utf-8') as out_file:
+            out_file.write(text)
+    
+    # Ensure that the number of chunks matches the number of embeddings
+    if len(chunks) != len(chunk_embeddings):
+        logging.warning(f"Mismatch in number of chunks ({len(chunks)}) and embeddings ({len(chunk_embeddings)}) for {filename}. Adjusting chunks to match embeddings.")
+        # Adjust chunks to match embeddings
+        if len(chunks) > len(chunk_embeddings):
+            chunks = chunks[:len(chunk_embeddings)]
+            spans = spans[:len(chunk_embeddings)]
+        else:
+            chunks.extend([''] * (len(chunk_embeddings) - len(chunks)))
+            spans.extend([(len(text), len(text))] * (len(chunk_embeddings) - len(spans)))
+    pages = [bisect.bisect_right(page_starts, start) for start, _ in spans] if page_starts else None
+    db_manager.insert_pdf_extract(filename, text, page_count, clean_text, chunk_embeddings, chunks,
+                                  source_path=os.path.abspath(file_path) if isinstance(file_path, str) else None,
+                                  chunk_offsets=spans, chunk_pages=pages,
+                                  chunk_terms=[term_extractor.terms(chunk) for chunk in chunks] if term_extractor else None)
+    return list(zip(chunks, chunk_embeddings))
+
+def index_pdf_pages(filename, file_path, pages, clean_text, save_to_file, text_chunker, embedding_model, db_manager, embedding_batch_size=64, term_extractor=None):
+    """
+    Chunk and embed a PDF from a page iterator as the pages arrive and store it in the database.
+
+    Every embedding_batch_size chunks are embedded and staged in the database together with
+    the pages they were cut from, and then released (see DatabaseManager.pdf_extract_writer).
+    Memory is therefore bounded by one such window of pages rather than by the size of the
+    document, and the document becomes visible only once all its pages are stored.
+
+    :param pages: Iterator of (page_number, text) tuples, e.g. from iter_pdf_pages_parallel
+    :param embedding_batch_size: Number of chunks embedded and written at a time
+    :param term_extractor: Optional TermExtractor for the chunk terms stored with each chunk
+    :return: Number of stored chunks
+    """
+    window_pages = []
+    pending = []
+    out_file = open(f"{os.path.splitext(file_path)[0]}.txt", 'w', encoding='utf-8') if save_to_file else None
+
+    def page_stream():
+        for _, page_text in pages:
+            page_text += "\n"
+            window_pages.append(page_text)
+            if out_file:
+                out_file.write(page_text)
+            yield page_text
+
+    def write_window(writer):
+        texts = [chunk.text for chunk in pending]
+        writer.append("".join(window_pages), len(window_pages), embedding_model.get_embeddings(texts), texts,
+                      chunk_offsets=[(chunk.start, chunk.end) for chunk in pending],
+                      chunk_pages=[chunk.first_page for chunk in pending],
+                      chunk_terms=[term_extractor.terms(text) for text in texts] if term_extractor else None)
+        window_pages.clear()
+        pending.clear()
+
+    try:
+        with db_manager.pdf_extract_writer(filename, clean_text, source_path=os.path.abspath(file_path)) as writer:
+            for chunk in text_chunker.iter_chunks(page_stream()):
+                pending.append(chunk)
+                if len(pending) >= embedding_batch_size:
+                    write_window(writer)
+            write_window(writer)
+    finally:
+        if out_file:
+            out_file.close()
+    return writer.chunk_count
+
+class ExtractionTimeout(Exception):
+    pass
+
+def _raise_extraction_timeout(signum, frame):
+    raise ExtractionTimeout()
+
+@contextlib.contextmanager
+def _extraction_alarm(timeout):
+    """
+    Raise ExtractionTimeout in the block after timeout seconds, using SIGALRM where the
+    platform supports it, so a pathological PDF cannot occupy a worker forever.
+    """
+    use_alarm = timeout and hasattr(signal, 'setitimer')
+    if use_alarm:
+        signal.signal(signal.SIGALRM, _raise_extraction_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        yield
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+def _extract_worker(pdf_path, max_pages, clean_text, timeout):
+    """
+    Process pool entry point: parse one PDF and return only plain data to the parent.
+    """
+    try:
+        with _extraction_alarm(timeout):
+            text, page_count, page_starts = extract_pages_from_pdf(pdf_path, max_pages, clean_text)
+    except ExtractionTimeout:
+        logging.error(f"Timed out after {timeout}s extracting {pdf_path}")
+        text, page_count, page_starts = None, None, None
+    return pdf_path, text, page_count, page_starts
+
+def _process_pool(max_workers):
+    # Forking a multi-threaded server process can copy held locks into the child,
+    # so prefer a fork server where the platform has one
+    mp_context = multiprocessing.get_context('forkserver') if 'forkserver' in multiprocessing.get_all_start_methods() else None
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=mp_context)
+
+def extract_texts_in_processes(pdf_files, max_pages=None, clean_text=False, max_workers=None, timeout=None):
+    """
+    Extract text from PDF files in a process pool so parsing runs on all cores instead of
+    serializing on the GIL.
+
+    The files are submitted to the pool when this is called, so they are parsed while the caller
+    does other work before consuming the returned iterator. The pool is shut down once the
+    iterator is exhausted or closed, so it must be consumed.
+
+    :param pdf_files: List of PDF file paths
+    :param max_workers: Number of worker processes (default: os.cpu_count())
+    :param timeout: Per-file extraction timeout in seconds (None for no limit)
+    :return: Iterator of (pdf_path, text, page_count, page_starts) tuples in completion order
+             (see extract_pages_from_pdf); text and page_count are None when extraction failed or timed out
+    """
+    if not pdf_files:
+        return iter(())
+    max_workers = min(max_workers or os.cpu_count() or 1, len(pdf_files))
+    with contextlib.ExitStack() as stack:
+        executor = stack.enter_context(_process_pool(max_workers))
+        futures = {executor.submit(_extract_worker, pdf_path, max_pages, clean_text, timeout): pdf_path for pdf_path in pdf_files}
+        # The iterator takes over shutting down the pool
+        return _iter_extracted(futures, stack.pop_all())
+
+def _iter_extracted(futures, pool):
+    with pool:
+        for future in as_completed(futures):
+            try:
+                yield future.result()
+            except Exception as e:
+                logging.error(f"Worker failed to extract {futures[future]}: {e}")
+                yield futures[future], None, None, None
+
 def extract_text_from_pdf(pdf_file, max_pages=None, clean_text=False, max_retries=3, retry_delay=1):
     """
     Extract text from a single PDF file with retry mechanism.
     """
+    text, page_count, _ = extract_pages_from_pdf(pdf_file, max_pages, clean_text, max_retries, retry_delay)
+    return text, page_count
+
+def extract_pages_from_pdf(pdf_file, max_pages=None, clean_text=False, max_retries=3, retry_delay=1):
+    """
+    Extract text from a single PDF file with retry mechanism, keeping track of where each page starts.
+
+    :param clean_text: Clean each page with clean_and_preprocess_text
+    :return: Tuple of (text, page_count, page_starts) where page_starts holds the character offset
+             of each page in text
+    """
     for attempt in range(max_retries):
         try:
             if isinstance(pdf_file, str):
@@ -102,19 +303,16 @@ def extract_text_from_pdf(pdf_file, max_pages=None, clean_text=False, max_retrie
             
             reader = PdfReader(file)
             
-            text = ""
             total_pages = len(reader.pages)
             pages_to_process = min(total_pages, max_pages) if max_pages else total_pages
-            for i in range(pages_to_process):
-                text += reader.pages[i].extract_text() + "\n"
-            
-            if clean_text:
-                text = clean_and_preprocess_text(text)
+            page_texts = [page_text + "\n" for _, page_text in _iter_reader_pages(reader, 0, pages_to_process, clean_text)]
+            text = "".join(page_texts)
+            page_starts = list(itertools.accumulate((len(page_text) for page_text in page_texts[:-1]), initial=0)) if page_texts else []
             
             if isinstance(pdf_file, str):
                 file.close()
             
-            return text, pages_to_process
+            return text, pages_to_process, page_starts
         except (IOError, PdfReadError) as e:
             if attempt < max_retries - 1:
                 logging.warning(f"Error processing PDF (attempt {attempt + 1}/{max_retries}): {str(e)}. Retrying...")
@@ -123,7 +321,105 @@ def extract_text_from_pdf(pdf_file, max_pages=None, clean_text=False, max_retrie
                 logging.error(f"Failed to process PDF after {max_retries} attempts: {str(e)}")
                 if isinstance(pdf_file, str) and 'file' in locals():
                     file.close()
-    return None, None
+    return None, None, None
+
+def _iter_reader_pages(reader, start_page, end_page, clean_text=False):
+    for i in range(start_page, end_page):
+        page_text = reader.pages[i].extract_text()
+        if clean_text:
+            page_text = clean_and_preprocess_text(page_text)
+        yield i + 1, page_text
+
+def get_pdf_page_count(pdf_file, max_pages=None):
+    """
+    Return the number of pages that would be extracted from a PDF file.
+    """
+    with open(pdf_file, 'rb') as file:
+        total_pages = len(PdfReader(file).pages)
+    return min(total_pages, max_pages) if max_pages else total_pages
+
+def iter_pdf_pages(pdf_file, max_pages=None, clean_text=False, start_page=0, end_page=None):
+    """
+    Lazily extract the pages of a PDF file.
+
+    Only the current page's text is held at a time; callers can consume the
+    iterator while later pages have not been parsed yet.
+
+    :param pdf_file: PDF file path or binary file object
+    :param max_pages: Maximum number of pages to extract
+    :param clean_text: Clean each page with clean_and_preprocess_text
+    :param start_page: Index of the first page to extract (0-based)
+    :param end_page: Index after the last page to extract (default: all pages)
+    :return: Iterator of (page_number, text) tuples with 1-based page numbers
+    """
+    file = open(pdf_file, 'rb') if isinstance(pdf_file, str) else pdf_file
+    try:
+        reader = PdfReader(file)
+        total_pages = len(reader.pages)
+        pages_to_process = min(total_pages, max_pages) if max_pages else total_pages
+        end_page = pages_to_process if end_page is None else min(end_page, pages_to_process)
+        yield from _iter_reader_pages(reader, start_page, end_page, clean_text)
+    finally:
+        if isinstance(pdf_file, str):
+            file.close()
+
+def _extract_page_range_worker(pdf_path, start_page, end_page, clean_text, deadline=None):
+    """
+    Process pool entry point: extract one page range of a PDF.
+
+    :param deadline: Optional time.time() by which the range must be extracted
+    """
+    timeout = None
+    if deadline is not None:
+        timeout = deadline - time.time()
+        if timeout <= 0:
+            raise ExtractionTimeout()
+    with _extraction_alarm(timeout):
+        return list(iter_pdf_pages(pdf_path, clean_text=clean_text, start_page=start_page, end_page=end_page))
+
+def iter_pdf_pages_parallel(pdf_path, max_pages=None, clean_text=False, max_workers=None, pages_per_task=16, window=None, timeout=None):
+    """
+    Extract the pages of one large PDF in parallel and yield them in order.
+
+    The page range is split into tasks of pages_per_task pages that run in a process pool.
+    At most window tasks are in flight or waiting to be consumed, so memory is bounded by
+    window * pages_per_task pages rather than by the size of the document, and the caller
+    can chunk and embed early pages while later ones are still being parsed.
+
+    :param pdf_path: PDF file path
+    :param max_workers: Number of worker processes (default: os.cpu_count())
+    :param pages_per_task: Number of pages extracted per task
+    :param window: Maximum number of outstanding tasks (default: 2 * max_workers)
+    :param timeout: Seconds after the first page is requested by which all pages must be extracted
+                    (None for no limit); ExtractionTimeout is raised when they are not
+    :return: Iterator of (page_number, text) tuples in page order
+    """
+    deadline = time.time() + timeout if timeout else None
+    page_count = get_pdf_page_count(pdf_path, max_pages)
+    if page_count == 0:
+        return
+    ranges = [(start, min(start + pages_per_task, page_count)) for start in range(0, page_count, pages_per_task)]
+    max_workers = min(max_workers or os.cpu_count() or 1, len(ranges))
+    window = window or 2 * max_workers
+
+    with _process_pool(max_workers) as executor:
+        pending = deque()
+        next_range = 0
+        try:
+            while next_range < len(ranges) or pending:
+                while next_range < len(ranges) and len(pending) < window:
+                    start, end = ranges[next_range]
+                    pending.append(executor.submit(_extract_page_range_worker, pdf_path, start, end, clean_text, deadline))
+                    next_range += 1
+                try:
+                    pages = pending.popleft().result(timeout=None if deadline is None else max(deadline - time.time(), 0))
+                except FutureTimeoutError:
+                    raise ExtractionTimeout()
+                yield from pages
+        finally:
+            # Tasks that have not started are dropped when the consumer stops early or fails
+            for future in pending:
+                future.cancel()
 
 if __name__ == "__main__":
     # Example usage
@@ -140,7 +436,8 @@ if __name__ == "__main__":
     logging.info(f"\nProcessed {len(results)} PDF files successfully.")
     
     db_manager = DatabaseManager()
-    for filename in results.keys():
+    for pdf_path in results.keys():
+        filename = os.path.basename(pdf_path)
         db_result = db_manager.get_pdf_extract(filename)
         if db_result:
             logging.info(f"Retrieved from database - {filename}:")
@@ -1,22 +1,35 @@
 import nltk
-from nltk.tokenize import word_tokenize
-from nltk.corpus import stopwords, wordnet
-from nltk.stem import WordNetLemmatizer
-import string
+from nltk.corpus import wordnet
 import numpy as np
 from prompt_engineer import PromptEngineer
+from term_extractor import TermExtractor
+from lru_cache import LRUCache
+from embedding_cache import normalize_text
 
 class QueryProcessor:
-    def __init__(self, embedding_model):
+    def __init__(self, embedding_model, query_cache_size=10_000, token_cache_size=100_000, max_synonyms=5):
+        """
+        :param query_cache_size: Number of preprocessed queries, processed queries and query embeddings kept in LRU caches
+        :param token_cache_size: Number of per-token lemmas and synonym lists kept in LRU caches
+        :param max_synonyms: Maximum number of WordNet synonyms added per query token
+        """
         # Download required NLTK resources
         nltk.download('punkt', quiet=True)
         nltk.download('stopwords', quiet=True)
         nltk.download('wordnet', quiet=True)
         
-        self.stop_words = set(stopwords.words('english'))
-        self.lemmatizer = WordNetLemmatizer()
+        self.term_extractor = TermExtractor(lemma_cache_size=token_cache_size)
+        self.stop_words = self.term_extractor.stop_words
+        self.lemmatizer = self.term_extractor.lemmatizer
         self.embedding_model = embedding_model
         self.prompt_engineer = PromptEngineer()
+        self.max_synonyms = max_synonyms
+        # Repeated queries skip NLTK entirely; new queries made of known words skip the WordNet lookups
+        self.terms_cache = LRUCache(query_cache_size)
+        self.query_cache = LRUCache(query_cache_size)
+        self.synonym_cache = LRUCache(token_cache_size)
+        # Exact processed query -> embedding, in front of the embedding model and its persistent cache
+        self.query_embedding_cache = LRUCache(query_cache_size)
 
     def preprocess_query(self, query):
         """
@@ -25,16 +38,12 @@ class QueryProcessor:
         :param query: Input query string
         :return: Preprocessed query tokens
         """
-        # Tokenize the query
-        tokens = word_tokenize(query.lower())
-        
-        # Remove punctuation and stopwords
-        tokens = [token for token in tokens if token not in string.punctuation and token not in self.stop_words]
-        
-        # Lemmatize the tokens
-        lemmatized_tokens = [self.lemmatizer.lemmatize(token) for token in tokens]
-        
-        return lemmatized_tokens
+        key = normalize_text(query.lower())
+        terms = self.terms_cache.get(key)
+        if terms is None:
+            terms = tuple(self.term_extractor.terms(query))
+            self.terms_cache.put(key, terms)
+        return list(terms)
 
     def expand_query(self, tokens):
         """
@@ -44,13 +53,35 @@ class QueryProcessor:
         :return: Expanded list of tokens
         """
         expanded_tokens = []
+        seen = set()
         for token in tokens:
             expanded_tokens.append(token)
+            seen.add(token)
+            for synonym in self.synonyms(token):
+                if synonym not in seen:
+                    expanded_tokens.append(synonym)
+                    seen.add(synonym)
+        return expanded_tokens
+
+    def synonyms(self, token):
+        """
+        WordNet synonyms of a token, at most max_synonyms, using the synonym cache.
+
+        :param token: Preprocessed query token
+        :return: Tuple of distinct synonyms in WordNet order, without the token itself
+        """
+        synonyms = self.synonym_cache.get(token)
+        if synonyms is None:
+            names = {}
             for syn in wordnet.synsets(token):
                 for lemma in syn.lemmas():
-                    if lemma.name() != token and lemma.name() not in expanded_tokens:
-                        expanded_tokens.append(lemma.name())
-        return expanded_tokens
+                    if lemma.name() != token:
+                        names.setdefault(lemma.name())
+                if len(names) >= self.max_synonyms:
+                    break
+            synonyms = tuple(names)[:self.max_synonyms]
+            self.synonym_cache.put(token, synonyms)
+        return synonyms
 
     def combine_with_context(self, query, conversation_history, max_context_length=5):
         """
@@ -82,19 +113,109 @@ class QueryProcessor:
         else:
             combined_query = query
         
-        preprocessed_tokens = self.preprocess_query(combined_query)
-        expanded_tokens = self.expand_query(preprocessed_tokens)
-        return ' '.join(expanded_tokens)
+        key = normalize_text(combined_query.lower())
+        processed_query = self.query_cache.get(key)
+        if processed_query is None:
+            preprocessed_tokens = self.preprocess_query(combined_query)
+            expanded_tokens = self.expand_query(preprocessed_tokens)
+            processed_query = ' '.join(expanded_tokens)
+            self.query_cache.put(key, processed_query)
+        return processed_query
 
-    def query_to_embedding(self, query):
+    def query_to_embedding(self, query, processed=False):
         """
         Convert a query to its embedding representation.
         
         :param query: Input query string
+        :param processed: The query is already the output of process_query and is embedded as is
         :return: Embedding vector for the processed query
         """
-        processed_query = self.process_query(query)
-        return self.embedding_model.get_embedding(processed_query)
+        return self.queries_to_embeddings([query], processed=processed)[0]
+
+    def queries_to_embeddings(self, queries, processed=False):
+        """
+        Convert several queries to their embeddings with one bulk embedding call.
+
+        :param queries: List of input query strings
+        :param processed: The queries are already the output of process_query and are embedded as is
+        :return: List of embedding vectors, in the order of queries
+        """
+        processed_queries = queries if processed else [self.process_query(query) for query in queries]
+        embeddings = [self.query_embedding_cache.get(query) for query in processed_queries]
+        missing = list(dict.fromkeys(query for query, embedding in zip(processed_queries, embeddings) if embedding is None))
+        if missing:
+            new_embeddings = dict(zip(missing, self.embedding_model.get_embeddings(missing)))
+            for query, embedding in new_embeddings.items():
+                self.query_embedding_cache.put(query, embedding)
+            embeddings = [new_embeddings[query] if embedding is None else embedding
+                          for query, embedding in zip(processed_queries, embeddings)]
+        return embeddings
+
+    def cache_stats(self):
+        """
+        Return the counters of the query preprocessing caches.
+
+        :return: Dictionary of LRUCache.stats() per cache
+        """
+        return {
+            'terms': self.terms_cache.stats(),
+            'processed_queries': self.query_cache.stats(),
+            'query_embeddings': self.query_embedding_cache.stats(),
+            'synonyms': self.synonym_cache.stats(),
+            'lemmas': self.term_extractor.lemma_cache.stats()
+        }
+
+    def calculate_relevance_scores(self, queries, results, chunk_terms=None):
+        """
+        Calculate relevance scores for the search results of several queries.
+
+        Uses the same formula as calculate_relevance_score. The distinct candidate chunks of
+        all queries form one sparse chunk-by-term matrix, and each query's token overlap is
+        computed over it with numpy instead of comparing token sets chunk by chunk.
+
+        :param queries: List of original query strings
+        :param results: One list of (chunk, distance) tuples per query
+        :param chunk_terms: Optional precomputed terms of each result chunk, aligned with results;
+                            None entries are computed from the chunk text
+        :return: One list of relevance scores per query, aligned with results
+        """
+        if chunk_terms is None:
+            chunk_terms = [[None] * len(hits) for hits in results]
+
+        # Chunk-by-term incidence matrix in CSR form: row r has the term ids term_ids[indptr[r]:indptr[r + 1]]
+        vocabulary = {}
+        rows = {}
+        term_ids = []
+        row_lengths = []
+        result_rows = []
+        for hits, terms_per_hit in zip(results, chunk_terms):
+            hit_rows = []
+            for (chunk, _), terms in zip(hits, terms_per_hit):
+                row = rows.get(chunk)
+                if row is None:
+                    terms = set(self.term_extractor.terms(chunk) if terms is None else terms)
+                    term_ids.extend(vocabulary.setdefault(term, len(vocabulary)) for term in terms)
+                    row_lengths.append(len(terms))
+                    row = rows[chunk] = len(rows)
+                hit_rows.append(row)
+            result_rows.append(np.array(hit_rows, dtype=np.int64))
+        term_ids = np.array(term_ids, dtype=np.int64)
+        entry_rows = np.repeat(np.arange(len(rows)), row_lengths)
+
+        scores = []
+        for query, hits, hit_rows in zip(queries, results, result_rows):
+            if not hits:
+                scores.append([])
+                continue
+            query_tokens = set(self.preprocess_query(query))
+            in_query = np.zeros(len(vocabulary), dtype=np.float32)
+            in_query[[vocabulary[token] for token in query_tokens if token in vocabulary]] = 1
+            overlap = np.bincount(entry_rows, weights=in_query[term_ids], minlength=len(rows))[hit_rows]
+            # A query made only of stopwords has no tokens to overlap with
+            token_overlap = overlap / len(query_tokens) if query_tokens else np.zeros(len(hits))
+            semantic_similarity = 1 / (1 + np.array([distance for _, distance in hits], dtype=np.float64))
+            scores.append((0.5 * token_overlap + 0.5 * semantic_similarity).tolist())
+        return scores
 
     def calculate_relevance_score(self, query, chunk, distance):
         """
@@ -107,10 +228,10 @@ class QueryProcessor:
         """
         # Preprocess query and chunk
         query_tokens = set(self.preprocess_query(query))
-        chunk_tokens = set(self.preprocess_query(chunk))
+        chunk_tokens = set(self.term_extractor.terms(chunk))
         
-        # Calculate token overlap
-        token_overlap = len(query_tokens.intersection(chunk_tokens)) / len(query_tokens)
+        # Calculate token overlap (a query made only of stopwords has no tokens to overlap with)
+        token_overlap = len(query_tokens.intersection(chunk_tokens)) / len(query_tokens) if query_tokens else 0.0
         
         # Calculate semantic similarity (inverse of distance)
         semantic_similarity = 1 / (1 + distance)
@@ -0,0 +1,113 @@
+import glob
+import hashlib
+import os
+import tempfile
+from flask import Request, current_app
+from werkzeug.utils import secure_filename
+
+class HashingFileWriter:
+    """
+    File that receives an upload: the content is written straight to a temporary file in
+    the upload folder and hashed on the way, so uploads of any size never sit in memory
+    and are not read a second time for their hash.
+    """
+
+    def __init__(self, directory):
+        """
+        :param directory: Directory of the temporary file; the upload is later renamed within it
+        """
+        fd, self.path = tempfile.mkstemp(prefix='.upload-', suffix='.part', dir=directory)
+        self._file = os.fdopen(fd, 'w+b')
+        self._digest = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self._digest.update(data)
+        self.size += len(data)
+        return self._file.write(data)
+
+    def read(self, size=-1):
+        return self._file.read(size)
+
+    def readline(self, size=-1):
+        return self._file.readline(size)
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        return self._file.seek(offset, whence)
+
+    def tell(self):
+        return self._file.tell()
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    @property
+    def closed(self):
+        return self._file.closed
+
+    def hexdigest(self):
+        """
+        SHA-256 of the content written so far, as used by the document manifest.
+        """
+        return self._digest.hexdigest()
+
+class StreamingUploadRequest(Request):
+    """
+    Flask request that streams uploaded files into the app's UPLOAD_FOLDER as they are
+    parsed (see HashingFileWriter), instead of spooling them through temporary files.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.upload_streams = []
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        upload_folder = current_app.config['UPLOAD_FOLDER']
+        os.makedirs(upload_folder, exist_ok=True)
+        stream = HashingFileWriter(upload_folder)
+        self.upload_streams.append(stream)
+        return stream
+
+    def discard_uploads(self):
+        """
+        Close the received upload files and delete those that store_upload did not keep,
+        e.g. after a rejected or aborted request.
+        """
+        for stream in self.upload_streams:
+            stream.close()
+            if os.path.exists(stream.path):
+                os.remove(stream.path)
+        self.upload_streams = []
+
+def store_upload(stream, filename, upload_folder, known_paths=()):
+    """
+    Give a received upload its final name, or delete it if its content is already stored.
+
+    The final name is the sanitized client file name followed by the first 16 hex digits
+    of the content hash, so a client cannot overwrite other files and uploads of identical
+    content are recognized by name.
+
+    A copy that is stored but not among known_paths is kept and reported as new, so an upload
+    whose indexing could not be started, e.g. because the indexing queue was full, is indexed
+    when it is uploaded again.
+
+    :param stream: HashingFileWriter the upload was received into
+    :param filename: File name sent by the client
+    :param upload_folder: Folder the upload was received into
+    :param known_paths: Indexed files holding content with the same hash
+    :return: Tuple of (path of the stored file, True if the content is already indexed)
+    """
+    stream.close()
+    content_hash = stream.hexdigest()
+    stem = os.path.splitext(secure_filename(filename or ''))[0] or 'upload'
+    path = os.path.join(upload_folder, f"{stem}-{content_hash[:16]}.pdf")
+    indexed = [p for p in known_paths if os.path.exists(p)]
+    stored = indexed or glob.glob(os.path.join(glob.escape(upload_folder), f"*-{content_hash[:16]}.pdf"))
+    if stored:
+        os.remove(stream.path)
+        return (path if path in stored else stored[0]), bool(indexed)
+    os.replace(stream.path, path)
+    return path, False
@@ -0,0 +1,231 @@
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+try:
+    import redis
+    from redis import WatchError
+except ImportError:
+    redis = None
+
+    class WatchError(Exception):
+        pass
+
+load_dotenv()
+
+# Task states, as reported by /task_status
+PENDING = 'PENDING'
+PROGRESS = 'PROGRESS'
+SUCCESS = 'SUCCESS'
+FAILURE = 'FAILURE'
+
+# Allowed state transitions; SUCCESS and FAILURE are final
+TRANSITIONS = {
+    PENDING: {PROGRESS, SUCCESS, FAILURE},
+    PROGRESS: {PROGRESS, SUCCESS, FAILURE},
+    SUCCESS: set(),
+    FAILURE: set(),
+}
+
+class InvalidTransition(ValueError):
+    pass
+
+class TaskStore:
+    """
+    Store of background task states with TTL expiry and a size cap.
+
+    Every update refreshes the task's TTL. When more than max_tasks tasks are stored,
+    the least recently updated ones are dropped. Subclasses implement the storage of
+    task records (JSON-serializable dictionaries).
+    """
+
+    def __init__(self, ttl=3600, max_tasks=10_000):
+        """
+        :param ttl: Seconds a task is kept after its last update
+        :param max_tasks: Maximum number of stored tasks
+        """
+        self.ttl = ttl
+        self.max_tasks = max_tasks
+
+    def create(self):
+        """
+        Register a new task in the PENDING state.
+
+        :return: Task id
+        """
+        task_id = str(uuid.uuid4())
+        self._insert(task_id, {'state': PENDING, 'created': time.time()})
+        return task_id
+
+    def set_progress(self, task_id, **progress):
+        """
+        Move a task to PROGRESS with the given progress fields, e.g. current, total, status and eta.
+        """
+        self._transition(task_id, PROGRESS, progress=progress)
+
+    def set_success(self, task_id, result):
+        """
+        Mark a task as finished with a JSON-serializable result.
+        """
+        self._transition(task_id, SUCCESS, result=result)
+
+    def set_failure(self, task_id, error):
+        """
+        Mark a task as failed with an error message.
+        """
+        self._transition(task_id, FAILURE, error=str(error))
+
+    def get(self, task_id):
+        """
+        :return: Task record with at least a 'state' key, or None for unknown and expired tasks
+        """
+        raise NotImplementedError
+
+    def _insert(self, task_id, record):
+        raise NotImplementedError
+
+    def _update(self, task_id, update):
+        """
+        Apply update(record) -> record to a stored task atomically.
+        """
+        raise NotImplementedError
+
+    def _transition(self, task_id, state, **fields):
+        def update(record):
+            if record is None:
+                raise KeyError(f"Unknown or expired task {task_id}")
+            if state not in TRANSITIONS[record['state']]:
+                raise InvalidTransition(f"Task {task_id} cannot go from {record['state']} to {state}")
+            return {'state': state, 'created': record['created'], 'updated': time.time(), **fields}
+        self._update(task_id, update)
+
+class InMemoryTaskStore(TaskStore):
+    """
+    Task store for a single process.
+    """
+
+    def __init__(self, ttl=3600, max_tasks=10_000):
+        super().__init__(ttl, max_tasks)
+        # Ordered by last update, which is also expiry order
+        self._tasks = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, task_id):
+        with self._lock:
+            self._expire(time.time())
+            record = self._tasks.get(task_id)
+            return dict(record[1]) if record else None
+
+    def _insert(self, task_id, record):
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            self._tasks[task_id] = (now + self.ttl, record)
+            while len(self._tasks) > self.max_tasks:
+                self._tasks.popitem(last=False)
+
+    def _update(self, task_id, update):
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            entry = self._tasks.get(task_id)
+            self._tasks[task_id] = (now + self.ttl, update(entry[1] if entry else None))
+            self._tasks.move_to_end(task_id)
+
+    def _expire(self, now):
+        """
+        Drop expired tasks. Called with the lock held.
+        """
+        while self._tasks:
+            task_id, (expires_at, _) = next(iter(self._tasks.items()))
+            if expires_at > now:
+                break
+            del self._tasks[task_id]
+
+class RedisTaskStore(TaskStore):
+    """
+    Task store shared by all processes through Redis (or any server speaking the Redis protocol).
+
+    Each task is a JSON string with a Redis TTL; a sorted set of task ids scored by last
+    update time enforces the size cap.
+    """
+
+    def __init__(self, client=None, url=None, ttl=3600, max_tasks=10_000, prefix='pdfchat:task:'):
+        """
+        :param client: redis.Redis-compatible client; created from url if not given
+        :param url: Redis URL, e.g. redis://localhost:6379/0
+        :param prefix: Prefix of the Redis keys
+        """
+        super().__init__(ttl, max_tasks)
+        if client is None:
+            if redis is None:
+                raise ImportError("The Redis task store requires the redis package (pip install redis).")
+            client = redis.Redis.from_url(url or 'redis://localhost:6379/0')
+        self.client = client
+        self.prefix = prefix
+        self.index_key = f"{prefix}index"
+
+    def get(self, task_id):
+        value = self.client.get(self._key(task_id))
+        return json.loads(value) if value is not None else None
+
+    def _insert(self, task_id, record):
+        now = time.time()
+        pipe = self.client.pipeline()
+        pipe.set(self._key(task_id), json.dumps(record), px=self._ttl_milliseconds())
+        pipe.zadd(self.index_key, {task_id: now})
+        # Task keys expire on their own; drop their ids from the index too
+        pipe.zremrangebyscore(self.index_key, '-inf', now - self.ttl)
+        pipe.zcard(self.index_key)
+        size = pipe.execute()[-1]
+        if size > self.max_tasks:
+            evicted = [member.decode() if isinstance(member, bytes) else member
+                       for member, _ in self.client.zpopmin(self.index_key, size - self.max_tasks)]
+            if evicted:
+                self.client.delete(*(self._key(evicted_id) for evicted_id in evicted))
+
+    def _update(self, task_id, update):
+        key = self._key(task_id)
+        while True:
+            with self.client.pipeline() as pipe:
+                try:
+                    pipe.watch(key)
+                    value = pipe.get(key)
+                    record = update(json.loads(value) if value is not None else None)
+                    pipe.multi()
+                    pipe.set(key, json.dumps(record), px=self._ttl_milliseconds())
+                    pipe.zadd(self.index_key, {task_id: time.time()})
+                    pipe.execute()
+                    return
+                except WatchError:
+                    # The task was changed concurrently; retry with the new record
+                    continue
+
+    def _key(self, task_id):
+        return f"{self.prefix}{task_id}"
+
+    def _ttl_milliseconds(self):
+        return max(1, int(self.ttl * 1000))
+
+def create_task_store():
+    """
+    Create the task store configured by TASK_STORE_BACKEND ('memory' or 'redis').
+
+    The Redis backend connects to TASK_STORE_URL, or to REDIS_HOST, REDIS_PORT and REDIS_DB.
+
+    :return: TaskStore instance
+    """
+    backend = os.getenv('TASK_STORE_BACKEND', 'memory').lower()
+    ttl = float(os.getenv('TASK_TTL', 3600))
+    max_tasks = int(os.getenv('TASK_STORE_MAX_TASKS', 10_000))
+    if backend == 'memory':
+        return InMemoryTaskStore(ttl=ttl, max_tasks=max_tasks)
+    if backend == 'redis':
+        url = os.getenv('TASK_STORE_URL') or \
+            f"redis://{os.getenv('REDIS_HOST', 'localhost')}:{os.getenv('REDIS_PORT', '6379')}/{os.getenv('REDIS_DB', '0')}"
+        return RedisTaskStore(url=url, ttl=ttl, max_tasks=max_tasks)
+    raise ValueError(f"Unknown task store backend {backend}; expected 'memory' or 'redis'")
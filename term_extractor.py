@@ -0,0 +1,49 @@
+import string
+from nltk.tokenize import word_tokenize
+from nltk.stem import WordNetLemmatizer
+from lru_cache import LRUCache
+from text_normalizer import english_stop_words
+
+class TermExtractor:
+    """
+    Turn text into the lemmatized, stopword-free terms used for keyword overlap scoring.
+
+    Used for queries at search time and for chunks at index time, so both sides are
+    normalized the same way. Requires the NLTK punkt, stopwords and wordnet data.
+    """
+
+    def __init__(self, lemma_cache_size=100_000):
+        """
+        :param lemma_cache_size: Number of token lemmas kept in an LRU cache, since WordNet lookups dominate lemmatization
+        """
+        self.stop_words = english_stop_words()
+        self.lemmatizer = WordNetLemmatizer()
+        self.lemma_cache = LRUCache(lemma_cache_size)
+
+    def terms(self, text):
+        """
+        Tokenize the text, remove punctuation and stopwords, and lemmatize the tokens.
+
+        :param text: Input text string
+        :return: List of terms in text order
+        """
+        tokens = word_tokenize(text.lower())
+        tokens = [token for token in tokens if token not in string.punctuation and token not in self.stop_words]
+        return [self.lemmatize(token) for token in tokens]
+
+    def lemmatize(self, token):
+        """
+        Lemmatize a token, using the lemma cache.
+        """
+        lemma = self.lemma_cache.get(token)
+        if lemma is None:
+            lemma = self.lemmatizer.lemmatize(token)
+            self.lemma_cache.put(token, lemma)
+        return lemma
+
+    def term_set(self, text):
+        """
+        :param text: Input text string
+        :return: Set of distinct terms
+        """
+        return set(self.terms(text))
@@ -0,0 +1,62 @@
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+
+# The application modules live at the top of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+class StubServer:
+    """
+    Local HTTP server answering POST requests with scripted (status, headers, body) responses
+    and recording when each request arrived.
+    """
+
+    def __init__(self):
+        self.responses = []
+        self.request_times = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                stub.request_times.append(time.monotonic())
+                status, headers, body = stub.responses.pop(0) if stub.responses else (500, {}, {})
+                payload = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+@pytest.fixture(scope='session')
+def nltk_data():
+    """
+    Skip tests that build the IndexingPipeline when the NLTK data it needs is not installed.
+    """
+    import nltk
+    for resource in ('tokenizers/punkt', 'corpora/stopwords', 'corpora/wordnet'):
+        try:
+            nltk.data.find(resource)
+        except LookupError:
+            pytest.skip(f"NLTK data {resource} is not installed")
+
+@pytest.fixture
+def stub_server():
+    stub = StubServer()
+    stub.thread.start()
+    yield stub
+    stub.server.shutdown()
+    stub.server.server_close()
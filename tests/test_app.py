@@ -0,0 +1,61 @@
+import importlib
+import io
+import threading
+import time
+import pytest
+from bounded_executor import BoundedExecutor
+
+@pytest.fixture(scope='module')
+def app_module(tmp_path_factory, nltk_data):
+    """
+    The Flask app module, with the pipeline's database and index files in a temporary directory.
+    """
+    directory = tmp_path_factory.mktemp('app')
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.chdir(directory)
+        for name, value in {
+            'DB_NAME': str(directory / 'pdf_extracts.db'),
+            'FAISS_INDEX_FILE': str(directory / 'faiss_index.bin'),
+            'BM25_INDEX_FILE': str(directory / 'bm25_index.npz'),
+            'EMBEDDING_CACHE_DB': str(directory / 'embedding_cache.db'),
+            'EMBEDDING_BACKEND': 'hashing',
+            'OPENROUTER_API_KEY': 'test-key',
+        }.items():
+            monkeypatch.setenv(name, value)
+        indexing_pipeline = importlib.import_module('indexing_pipeline')
+        indexing_pipeline._shared_pipeline = None
+        yield importlib.import_module('app')
+        indexing_pipeline._shared_pipeline = None
+
+def wait_until_idle(executor, timeout=5):
+    deadline = time.monotonic() + timeout
+    while executor.stats()['in_flight'] or executor.stats()['queued']:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+def test_upload_rejected_by_a_full_indexing_queue_is_indexed_on_retry(app_module, tmp_path, monkeypatch):
+    executor = BoundedExecutor('indexing', max_workers=1, max_queue=0)
+    indexed = []
+    monkeypatch.setattr(app_module, 'indexing_executor', executor)
+    monkeypatch.setattr(app_module, 'run_indexing_pipeline_task', lambda task_id, pdf_files, *options: indexed.append(pdf_files))
+    monkeypatch.setitem(app_module.app.config, 'UPLOAD_FOLDER', str(tmp_path / 'uploads'))
+    client = app_module.app.test_client()
+
+    def upload():
+        return client.post('/upload', data={'documents': (io.BytesIO(b'%PDF-1.4 report'), 'report.pdf')},
+                           content_type='multipart/form-data')
+
+    busy = threading.Event()
+    executor.submit(busy.wait, 5)
+    rejected = upload()
+    assert rejected.status_code == 429
+    assert rejected.headers['Retry-After']
+
+    busy.set()
+    wait_until_idle(executor)
+    retried = upload()
+    assert retried.status_code == 202
+    assert retried.json['files'][0]['duplicate'] is False
+    wait_until_idle(executor)
+    assert len(indexed) == 1
+    assert [path.rsplit('/', 1)[-1] for path in indexed[0]] == [retried.json['files'][0]['stored_as']]
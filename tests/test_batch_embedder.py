@@ -0,0 +1,42 @@
+import pytest
+import requests
+from batch_embedder import BatchEmbedder
+from embedding_model import EmbeddingModel
+
+def failing_embed_fn(error):
+    calls = []
+
+    def embed(texts):
+        calls.append(texts)
+        raise error
+    return embed, calls
+
+def test_transient_errors_are_retried_max_retries_times():
+    embed, calls = failing_embed_fn(ConnectionError('connection reset'))
+    embedder = BatchEmbedder(embed, max_retries=2, retry_delay=0)
+
+    with pytest.raises(ConnectionError):
+        embedder.embed(['a', 'b'])
+    assert len(calls) == 3
+
+def test_other_errors_are_not_retried():
+    embed, calls = failing_embed_fn(ValueError('invalid input'))
+    embedder = BatchEmbedder(embed, max_retries=2, retry_delay=0)
+
+    with pytest.raises(ValueError):
+        embedder.embed(['a', 'b'])
+    assert len(calls) == 1
+
+def test_openrouter_backend_retries_only_in_the_client(stub_server, monkeypatch):
+    monkeypatch.setenv('OPENROUTER_API_KEY', 'test-key')
+    monkeypatch.setenv('OPENROUTER_BASE_URL', stub_server.url)
+    monkeypatch.setenv('OPENROUTER_MAX_RETRIES', '2')
+    monkeypatch.setenv('OPENROUTER_BACKOFF_BASE', '0.001')
+    monkeypatch.setenv('EMBEDDING_MAX_RETRIES', '3')
+    model = EmbeddingModel(backend='openrouter')
+    stub_server.responses = [(503, {}, {})] * 20
+
+    with pytest.raises(requests.HTTPError):
+        model.get_embeddings(['a'])
+    # One request plus OPENROUTER_MAX_RETRIES retries; the batch is not retried on top
+    assert len(stub_server.request_times) == 3
@@ -0,0 +1,57 @@
+import importlib
+import pytest
+
+pytest.importorskip('celery')
+
+@pytest.fixture(scope='module')
+def celery_tasks(tmp_path_factory, nltk_data):
+    """
+    celery_tasks on the in-memory broker and result backend, with a worker thread pool running
+    in this process and the pipeline's database and index files in a temporary directory.
+    """
+    from celery.contrib.testing.worker import start_worker
+    directory = tmp_path_factory.mktemp('celery')
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.chdir(directory)
+        for name, value in {
+            'CELERY_BROKER_URL': 'memory://',
+            'CELERY_RESULT_BACKEND': 'cache+memory://',
+            'DB_NAME': str(directory / 'pdf_extracts.db'),
+            'FAISS_INDEX_FILE': str(directory / 'faiss_index.bin'),
+            'BM25_INDEX_FILE': str(directory / 'bm25_index.npz'),
+            'EMBEDDING_CACHE_DB': str(directory / 'embedding_cache.db'),
+            'EMBEDDING_BACKEND': 'hashing',
+            'OPENROUTER_API_KEY': 'test-key',
+            'INDEX_REFRESH_INTERVAL': '0',
+        }.items():
+            monkeypatch.setenv(name, value)
+        indexing_pipeline = importlib.import_module('indexing_pipeline')
+        module = importlib.import_module('celery_tasks')
+        indexing_pipeline._shared_pipeline = None
+        module._chunk_writer = None
+        with start_worker(module.celery, pool='threads', concurrency=2, perform_ping_check=False):
+            yield module
+        indexing_pipeline._shared_pipeline = None
+        module._chunk_writer = None
+
+def test_chord_merges_indexed_and_failed_documents(celery_tasks, tmp_path):
+    from benchmarks import write_synthetic_pdf
+    good = str(tmp_path / 'report.pdf')
+    write_synthetic_pdf(good, pages=3)
+    broken = str(tmp_path / 'broken.pdf')
+    with open(broken, 'wb') as file:
+        file.write(b'not a pdf')
+
+    summary = celery_tasks.run_indexing_pipeline.delay([good, broken]).get(timeout=120)
+
+    assert summary['indexed'] == 1
+    assert summary['chunks'] > 0
+    assert list(summary['failed']) == [broken]
+    pipeline = celery_tasks.get_pipeline()
+    assert pipeline.faiss_manager.ntotal == summary['chunks']
+    assert list(pipeline.db_manager.get_documents()) == [good]
+
+    # The indexed file is skipped from now on; the broken one is tried again
+    summary = celery_tasks.run_indexing_pipeline.delay([good, broken]).get(timeout=120)
+    assert summary['indexed'] == 0
+    assert list(summary['failed']) == [broken]
@@ -0,0 +1,14 @@
+import pytest
+from embedding_model import EmbeddingModel
+
+@pytest.fixture(autouse=True)
+def openrouter_key(monkeypatch):
+    monkeypatch.setenv('OPENROUTER_API_KEY', 'test-key')
+
+def test_shortened_embeddings_are_rejected_for_models_not_trained_for_them():
+    with pytest.raises(ValueError):
+        EmbeddingModel(model_name='mistralai/mistral-embed', backend='openrouter', dimensions=512)
+
+def test_text_embedding_3_models_return_shortened_embeddings():
+    model = EmbeddingModel(model_name='openai/text-embedding-3-small', backend='openrouter', dimensions=512)
+    assert model.get_embedding_dimension() == 512
@@ -0,0 +1,44 @@
+import pytest
+import requests
+from openrouter_client import OpenRouterClient
+
+EMBEDDINGS = {'data': [{'index': 1, 'embedding': [0.0, 1.0]}, {'index': 0, 'embedding': [1.0, 0.0]}]}
+
+@pytest.fixture
+def client(stub_server, monkeypatch):
+    monkeypatch.setenv('OPENROUTER_API_KEY', 'test-key')
+    monkeypatch.setenv('OPENROUTER_MAX_RETRIES', '3')
+    monkeypatch.setenv('OPENROUTER_BACKOFF_BASE', '0.01')
+    monkeypatch.setenv('OPENROUTER_BACKOFF_MAX', '5')
+    with requests.Session() as session:
+        yield OpenRouterClient(base_url=stub_server.url, session=session)
+
+def test_retries_server_errors_until_success(client, stub_server):
+    stub_server.responses = [(503, {}, {}), (502, {}, {}), (200, {}, EMBEDDINGS)]
+
+    assert client.generate_embeddings(['a', 'b']) == [[1.0, 0.0], [0.0, 1.0]]
+    assert len(stub_server.request_times) == 3
+
+def test_waits_for_retry_after_on_rate_limit(client, stub_server):
+    stub_server.responses = [(429, {'Retry-After': '1'}, {}), (200, {}, EMBEDDINGS)]
+
+    client.generate_embeddings(['a', 'b'])
+
+    first, second = stub_server.request_times
+    # The backoff alone would retry within milliseconds
+    assert second - first >= 0.9
+
+def test_gives_up_after_max_retries(client, stub_server):
+    stub_server.responses = [(500, {}, {})] * 4
+
+    with pytest.raises(requests.HTTPError) as error:
+        client.generate_embeddings(['a'])
+    assert error.value.response.status_code == 500
+    assert len(stub_server.request_times) == 4
+
+def test_does_not_retry_client_errors(client, stub_server):
+    stub_server.responses = [(400, {}, {'error': 'bad request'}), (200, {}, EMBEDDINGS)]
+
+    with pytest.raises(requests.HTTPError):
+        client.generate_embeddings(['a'])
+    assert len(stub_server.request_times) == 1
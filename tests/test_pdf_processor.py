@@ -0,0 +1,46 @@
+import os
+import pdf_processor
+from benchmarks import write_synthetic_pdf
+from database_manager import DatabaseManager
+from embedding_model import EmbeddingModel
+
+def test_small_files_are_parsed_while_large_files_are_indexed(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    small = [str(tmp_path / f"small_{i}.pdf") for i in range(3)]
+    large = [str(tmp_path / f"large_{i}.pdf") for i in range(2)]
+    for i, path in enumerate(small):
+        write_synthetic_pdf(path, pages=2, seed=i)
+    for i, path in enumerate(large):
+        write_synthetic_pdf(path, pages=30, seed=10 + i)
+    threshold = min(os.path.getsize(path) for path in large)
+
+    events = []
+    process_pool = pdf_processor._process_pool
+    index_pdf_pages = pdf_processor.index_pdf_pages
+
+    def recording_pool(max_workers):
+        executor = process_pool(max_workers)
+        submit = executor.submit
+
+        def record_submit(fn, *args, **kwargs):
+            if fn is pdf_processor._extract_worker:
+                events.append(('parse', args[0]))
+            return submit(fn, *args, **kwargs)
+        executor.submit = record_submit
+        return executor
+
+    def recording_index_pdf_pages(filename, file_path, *args, **kwargs):
+        events.append(('index', file_path))
+        return index_pdf_pages(filename, file_path, *args, **kwargs)
+
+    monkeypatch.setattr(pdf_processor, '_process_pool', recording_pool)
+    monkeypatch.setattr(pdf_processor, 'index_pdf_pages', recording_index_pdf_pages)
+    results = pdf_processor.process_multiple_pdfs(
+        large + small, chunk_size=500, chunk_overlap=100, use_faiss=False, use_processes=True, max_workers=2,
+        large_file_threshold=threshold, db_manager=DatabaseManager(str(tmp_path / 'pdf_extracts.db')),
+        embedding_model=EmbeddingModel(backend='hashing'))
+
+    assert sorted(results) == sorted(large + small)
+    # All small files were handed to the pool before the first large file was indexed
+    first_index = events.index(('index', large[0]))
+    assert sorted(path for kind, path in events[:first_index] if kind == 'parse') == sorted(small)
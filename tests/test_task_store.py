@@ -0,0 +1,77 @@
+import time
+import pytest
+from task_store import InMemoryTaskStore, RedisTaskStore, InvalidTransition, PENDING, PROGRESS, SUCCESS, FAILURE
+
+@pytest.fixture(params=['memory', 'redis'])
+def make_store(request):
+    """
+    Factory of task stores of each backend; the Redis one runs against fakeredis.
+    """
+    if request.param == 'memory':
+        return InMemoryTaskStore
+    fakeredis = pytest.importorskip('fakeredis')
+    return lambda **options: RedisTaskStore(client=fakeredis.FakeRedis(), **options)
+
+def test_task_moves_through_progress_to_success(make_store):
+    store = make_store()
+    task_id = store.create()
+    assert store.get(task_id)['state'] == PENDING
+
+    store.set_progress(task_id, current=1, total=2)
+    store.set_progress(task_id, current=2, total=2)
+    assert store.get(task_id)['progress'] == {'current': 2, 'total': 2}
+
+    store.set_success(task_id, {'indexed': 2})
+    task = store.get(task_id)
+    assert task['state'] == SUCCESS
+    assert task['result'] == {'indexed': 2}
+
+@pytest.mark.parametrize('finish', [
+    lambda store, task_id: store.set_success(task_id, 'done'),
+    lambda store, task_id: store.set_failure(task_id, RuntimeError('failed')),
+])
+def test_final_states_reject_further_transitions(make_store, finish):
+    store = make_store()
+    task_id = store.create()
+    finish(store, task_id)
+    final = store.get(task_id)
+
+    with pytest.raises(InvalidTransition):
+        store.set_progress(task_id, current=1)
+    with pytest.raises(InvalidTransition):
+        store.set_success(task_id, 'again')
+    with pytest.raises(InvalidTransition):
+        store.set_failure(task_id, 'again')
+    assert store.get(task_id) == final
+    assert final['state'] in (SUCCESS, FAILURE)
+
+def test_unknown_task_cannot_be_updated(make_store):
+    store = make_store()
+    with pytest.raises(KeyError):
+        store.set_progress('missing', current=1)
+
+def test_tasks_expire_after_ttl_since_last_update(make_store):
+    store = make_store(ttl=0.2)
+    idle = store.create()
+    active = store.create()
+
+    time.sleep(0.12)
+    store.set_progress(active, current=1)
+    time.sleep(0.12)
+
+    assert store.get(idle) is None
+    assert store.get(active)['state'] == PROGRESS
+    time.sleep(0.25)
+    assert store.get(active) is None
+
+def test_size_cap_drops_least_recently_updated_tasks(make_store):
+    store = make_store(max_tasks=2)
+    first = store.create()
+    second = store.create()
+    store.set_progress(first, current=1)
+
+    third = store.create()
+
+    assert store.get(second) is None
+    assert store.get(first)['state'] == PROGRESS
+    assert store.get(third)['state'] == PENDING
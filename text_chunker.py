@@ -1,45 +1,124 @@
+import bisect
 import re
+from itertools import chain
+
+# Matches up to the end of the last sentence ('.', '!' or '?' followed by whitespace) in the
+# searched range; the greedy prefix makes the search run backwards from the range's end
+LAST_SENTENCE_END = re.compile(r'.*[.!?]\s+', re.DOTALL)
+
+class Chunk:
+    """
+    Position of one chunk in the chunked text.
+
+    The chunk's text is only sliced from the source when it is read, so iterating over
+    chunks for their offsets does not copy the document.
+    """
+    __slots__ = ('start', 'end', 'first_page', 'last_page', '_source', '_source_offset')
+
+    def __init__(self, start, end, first_page, last_page, source, source_offset=0):
+        """
+        :param start: Offset of the chunk's first character in the concatenated text
+        :param end: Offset after the chunk's last character
+        :param first_page: 1-based number of the page the chunk starts on
+        :param last_page: 1-based number of the page the chunk ends on
+        :param source: String holding the chunk's text
+        :param source_offset: Offset of source in the concatenated text
+        """
+        self.start = start
+        self.end = end
+        self.first_page = first_page
+        self.last_page = last_page
+        self._source = source
+        self._source_offset = source_offset
+
+    @property
+    def text(self):
+        return self._source[self.start - self._source_offset:self.end - self._source_offset]
+
+    def __len__(self):
+        return self.end - self.start
+
+    def __repr__(self):
+        return f"Chunk(start={self.start}, end={self.end}, pages={self.first_page}-{self.last_page})"
 
 class TextChunker:
     def __init__(self, chunk_size=1000, overlap=200):
+        """
+        :param chunk_size: Maximum number of characters per chunk
+        :param overlap: Number of characters a chunk shares with the previous one; must be smaller than chunk_size
+        """
+        if chunk_size <= 0:
+            raise ValueError(f"chunk_size must be positive, got {chunk_size}")
+        if not 0 <= overlap < chunk_size:
+            raise ValueError(f"overlap must be at least 0 and smaller than chunk_size ({chunk_size}), got {overlap}")
         self.chunk_size = chunk_size
         self.overlap = overlap
 
     def chunk_text(self, text):
         """
         Split the input text into overlapping chunks.
-        
+
         :param text: Input text string
         :return: List of text chunks
         """
-        chunks = []
-        start = 0
-        text_length = len(text)
+        return [chunk.text for chunk in self.iter_chunks(text)]
 
-        while start < text_length:
-            end = start + self.chunk_size
-            chunk = text[start:end]
+    def chunk_spans(self, text):
+        """
+        Character offsets of the chunks produced by chunk_text.
 
-            # Adjust chunk to end at a sentence boundary if possible
-            if end < text_length:
-                sentence_end = self._find_sentence_end(chunk)
-                if sentence_end != -1:
-                    end = start + sentence_end
-                    chunk = text[start:end]
+        :param text: Input text string
+        :return: List of (start, end) tuples
+        """
+        return [(chunk.start, chunk.end) for chunk in self.iter_chunks(text)]
 
-            chunks.append(chunk)
-            start = end - self.overlap
+    def iter_chunks(self, pages):
+        """
+        Split a text or a stream of page texts into overlapping chunks in a single pass.
 
-        return chunks
+        A chunk is at most chunk_size characters long and ends after the last sentence end
+        in that window whose punctuation lies beyond the overlap with the previous chunk,
+        or at chunk_size if there is none. Every chunk therefore starts after the previous
+        one, and each part of the text is searched for sentence ends about once.
 
-    def _find_sentence_end(self, text):
-        """
-        Find the last sentence boundary in the text.
-        
-        :param text: Input text string
-        :return: Index of the last sentence end, or -1 if not found
+        Page texts are chunked as if they were concatenated. Each chunk is yielded as soon
+        as enough text has arrived to decide where it ends, and text before the current
+        chunk is released.
+
+        :param pages: Text string, or iterable of page text strings
+        :return: Iterator of Chunk records with offsets into the concatenated text
         """
-        sentence_ends = list(re.finditer(r'[.!?]\s+', text))
-        if sentence_ends:
-            return sentence_ends[-1].end()
-        return -1
+        if isinstance(pages, str):
+            pages = (pages,)
+        chunk_size, overlap = self.chunk_size, self.overlap
+        buffer = ""
+        buffer_offset = 0
+        page_starts = []
+        start = 0
+
+        for page_text in chain(pages, (None,)):
+            final = page_text is None
+            if not final:
+                page_starts.append(buffer_offset + len(buffer))
+                # Release the text before the current chunk
+                buffer = buffer[start - buffer_offset:] + page_text
+                buffer_offset = start
+            length = buffer_offset + len(buffer)
+
+            # A chunk's end is only final once text beyond start + chunk_size is known
+            while length - start > chunk_size or (final and start < length):
+                end = start + chunk_size
+                if end < length:
+                    match = LAST_SENTENCE_END.match(buffer, start + overlap - buffer_offset, end - buffer_offset)
+                    if match:
+                        end = buffer_offset + match.end()
+                else:
+                    end = length
+                yield Chunk(start, end,
+                            bisect.bisect_right(page_starts, start) or 1,
+                            bisect.bisect_right(page_starts, end - 1) or 1,
+                            buffer, buffer_offset)
+                if end == length:
+                    start = end
+                    break
+                start = end - overlap
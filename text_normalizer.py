@@ -0,0 +1,51 @@
+import functools
+import re
+from nltk.corpus import stopwords
+
+# Everything but letters and whitespace is removed
+NON_LETTERS = re.compile(r'[^a-zA-Z\s]')
+# Contractions that NLTK's word_tokenize splits in letter-only text, e.g. "cannot" -> "can", "not"
+CONTRACTIONS = {
+    'cannot': ('can', 'not'),
+    'gimme': ('gim', 'me'),
+    'gonna': ('gon', 'na'),
+    'gotta': ('got', 'ta'),
+    'lemme': ('lem', 'me'),
+    'wanna': ('wan', 'na'),
+}
+
+# Translate-table fast path for ASCII text: one bytes.translate call lowercases the text and
+# deletes the characters NON_LETTERS matches
+_ASCII_LOWERCASE = bytes.maketrans(bytes(range(65, 91)), bytes(range(97, 123)))
+_ASCII_NON_LETTERS = bytes(c for c in range(128) if NON_LETTERS.match(chr(c)))
+
+@functools.lru_cache(maxsize=None)
+def english_stop_words():
+    """
+    NLTK's English stopwords, loaded once per process.
+
+    :return: Frozenset of stopwords
+    """
+    return frozenset(stopwords.words('english'))
+
+def normalize_text(text, use_translate=True):
+    """
+    Lowercase the text, remove everything but letters and whitespace, and drop stopwords.
+
+    Produces the same tokens as tokenizing the letter-only text with NLTK's word_tokenize,
+    without running the tokenizer: such text only needs splitting at whitespace and at the
+    contractions word_tokenize separates.
+
+    :param text: Input text string
+    :param use_translate: Clean ASCII text with a translate table instead of the regular expression
+    :return: Remaining tokens joined by single spaces
+    """
+    if use_translate and text.isascii():
+        text = text.encode('ascii').translate(_ASCII_LOWERCASE, _ASCII_NON_LETTERS).decode('ascii')
+    else:
+        text = NON_LETTERS.sub('', text.lower())
+    tokens = text.split()
+    if not CONTRACTIONS.keys().isdisjoint(tokens):
+        tokens = [part for token in tokens for part in CONTRACTIONS.get(token, (token,))]
+    stop_words = english_stop_words()
+    return ' '.join([token for token in tokens if token not in stop_words])